@@ -0,0 +1,99 @@
+import argparse
+import http.server
+import os
+import sys
+import threading
+import time
+
+import bs4
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import abr
+import ratelimit
+
+# A saved-shape ABN Lookup page: the LocalBusiness block surrounded by the usual head, navigation and footer.
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "abr_view.html")
+
+
+def serve(page, latency):
+    body = page.encode()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def legacy_lookup(url, id):
+    """The per-call requests.get + full-document parse abr.ABRClient replaced, kept for comparison."""
+    html = requests.get(f"{url}{id}").text
+    soup = bs4.BeautifulSoup(html, "html.parser").find("div", {'itemscope': True, 'itemtype': 'http://schema.org/LocalBusiness'})
+    return {
+        "type": soup.find("th", string="Entity type:").find_next("a").text.strip(),
+        "name": soup.find("span", itemprop="legalName").text.strip(),
+        "status": soup.find("td", string=lambda text: text and ('Active' in text or 'Cancelled' in text)).text.strip(),
+    }
+
+
+def measure(function, ids):
+    start = time.perf_counter()
+    function(ids)
+    return len(ids) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ABN lookups against a local ABR stand-in, legacy scrape vs ABRClient")
+    parser.add_argument("-n", "--lookups", type=int, default=200, help="ABNs to look up")
+    parser.add_argument("-l", "--latency", type=float, default=0.02, help="Simulated server latency in seconds")
+    parser.add_argument("-j", "--jobs", type=int, default=8, help="Concurrent lookups for the bulk path")
+    args = parser.parse_args()
+
+    with open(FIXTURE) as file:
+        page = file.read()
+    server = serve(page, args.latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}/ABN/View?abn="
+    ids = [f"{51824753556 + i}" for i in range(args.lookups)]
+
+    start = time.perf_counter()
+    for _ in range(200):
+        bs4.BeautifulSoup(page, "html.parser").find("div", {'itemtype': 'http://schema.org/LocalBusiness'})
+    full_parse = (time.perf_counter() - start) / 200
+    start = time.perf_counter()
+    for _ in range(200):
+        abr.parse_abn(page)
+    targeted_parse = (time.perf_counter() - start) / 200
+
+    # Measure the client itself, not the outbound limits meant for the real ABR.
+    ratelimit.configure("http:127.0.0.1=none")
+    client = abr.ABRClient(url=url, max_workers=args.jobs)
+    before = measure(lambda ids: [legacy_lookup(url, id) for id in ids], ids)
+    serial = measure(lambda ids: [client.lookup(id) for id in ids], ids)
+    bulk = measure(client.lookup_many, ids)
+    server.shutdown()
+
+    print(f"{len(page) / 1024:.1f} KiB page, {args.latency * 1000:.0f}ms latency, {args.lookups} lookups")
+    print(f"full parse:      {full_parse * 1000:.2f}ms")
+    print(f"targeted parse:  {targeted_parse * 1000:.2f}ms ({full_parse / targeted_parse:.2f}x)")
+    print(f"legacy scrape:   {before:,.1f} lookups/s")
+    print(f"ABRClient:       {serial:,.1f} lookups/s ({serial / before:.2f}x)")
+    print(f"lookup_many x{args.jobs}: {bulk:,.1f} lookups/s ({bulk / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
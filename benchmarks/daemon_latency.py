@@ -0,0 +1,68 @@
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+COMMANDS = ["asic 123456789", "spf example.com", "di example.com"]
+
+
+def run(command, env, repeat):
+    name, *argv = shlex.split(command)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(SRC, f"{name}.py")] + argv, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def wait_for(socket_path, timeout=30.0):
+    sys.path.insert(0, SRC)
+    import daemon
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if daemon.ping(socket_path):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-command latency in-process vs through the daemon")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="Runs per command (median is reported)")
+    parser.add_argument("-s", "--socket", help="Use an already running daemon on this socket instead of starting one")
+    parser.add_argument("commands", nargs="*", default=COMMANDS, help="Commands to time, e.g. 'spf example.com'")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    socket_path = args.socket or os.path.join(directory, "daemon.sock")
+    server = None
+    if args.socket is None:
+        server = subprocess.Popen([sys.executable, os.path.join(SRC, "daemon.py"), "serve"],
+                                  env=dict(os.environ, POLARIC_SOCKET=socket_path),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for(socket_path):
+            sys.exit(f"daemon did not come up on {socket_path}")
+        local = dict(os.environ, POLARIC_NO_DAEMON="1")
+        forwarded = dict(os.environ, POLARIC_SOCKET=socket_path)
+        for command in args.commands:
+            # One untimed run through the daemon warms its caches, as a day of use would.
+            run(command, forwarded, 1)
+            before = run(command, local, args.repeat)
+            after = run(command, forwarded, args.repeat)
+            print(f"{command:<24} in-process {before * 1000:7.1f}ms  daemon {after * 1000:7.1f}ms  ({before / after:.2f}x)")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
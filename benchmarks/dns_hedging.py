@@ -0,0 +1,69 @@
+import argparse
+import os
+import random
+import socketserver
+import sys
+import threading
+import time
+
+import dns.message
+import dns.rrset
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import di
+import ratelimit
+
+
+def serve(loss, latency):
+    """A UDP nameserver stand-in answering every A query with 192.0.2.1, dropping a fraction of queries."""
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            data, sock = self.request
+            if random.random() < loss:
+                return
+            query = dns.message.from_wire(data)
+            response = dns.message.make_response(query)
+            response.answer.append(dns.rrset.from_text(query.question[0].name, 300, "IN", "A", "192.0.2.1"))
+            time.sleep(latency * random.uniform(0.5, 1.5))
+            sock.sendto(response.to_wire(), self.client_address)
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UDPServer):
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def run(nameservers, queries, ratio, timeout):
+    dns_resolver = di.DNSResolver(nameservers, timeout=timeout, hedge_ratio=ratio)
+    start = time.perf_counter()
+    for i in range(queries):
+        dns_resolver.resolve(f"host{i}.example.com", di.RecordType.A)
+    return time.perf_counter() - start, dns_resolver.hedging.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedged vs plain DNS queries against lossy local nameserver stand-ins")
+    parser.add_argument("-n", "--queries", type=int, default=400, help="Distinct names to resolve")
+    parser.add_argument("-s", "--servers", type=int, default=2, help="Stand-in nameservers")
+    parser.add_argument("-l", "--loss", type=float, default=0.02, help="Fraction of queries each server drops")
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated server latency in seconds")
+    parser.add_argument("-t", "--timeout", type=float, default=1.0, help="Per-server timeout in seconds")
+    parser.add_argument("-r", "--ratio", type=float, default=0.05, help="Hedge load cap")
+    args = parser.parse_args()
+
+    ratelimit.configure("dns=none")
+    nameservers = ",".join(f"127.0.0.1:{serve(args.loss, args.latency)}" for _ in range(args.servers))
+    plain, plain_stats = run(nameservers, args.queries, 0, args.timeout)
+    hedged, hedged_stats = run(nameservers, args.queries, args.ratio, args.timeout)
+
+    print(f"{args.queries} queries, {args.servers} servers, {args.loss:.0%} loss, {args.latency * 1000:.0f}ms latency, {args.timeout:.1f}s timeout")
+    print(f"plain:  {plain:6.2f}s total, p99 {plain_stats['p99'] * 1000:7.1f}ms")
+    print(f"hedged: {hedged:6.2f}s total, p99 {hedged_stats['p99'] * 1000:7.1f}ms, "
+          f"{hedged_stats['hedged']} hedges ({hedged_stats['hedged'] / args.queries:.1%} extra load), {hedged_stats['won']} won, "
+          f"p99 without them {hedged_stats['p99_unhedged'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
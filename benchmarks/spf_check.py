@@ -0,0 +1,78 @@
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import spfcheck
+
+# A policy shaped like a typical customer: a few includes of large senders plus local hosts.
+POLICIES = {
+    "customer.example": "v=spf1 a mx include:_spf.google.example include:spf.protection.outlook.example include:sendgrid.example -all",
+    "_spf.google.example": "v=spf1 " + " ".join(f"ip4:{network}" for network in (
+        "35.190.247.0/24", "64.233.160.0/19", "66.102.0.0/20", "66.249.80.0/20", "72.14.192.0/18", "74.125.0.0/16",
+        "108.177.8.0/21", "173.194.0.0/16", "209.85.128.0/17", "216.58.192.0/19", "216.239.32.0/19")) + " ip6:2001:4860:4000::/36 ~all",
+    "spf.protection.outlook.example": "v=spf1 ip4:40.92.0.0/15 ip4:40.107.0.0/16 ip4:52.100.0.0/15 ip4:104.47.0.0/17 ip6:2a01:111:f400::/48 -all",
+    "sendgrid.example": "v=spf1 ip4:167.89.0.0/17 ip4:208.117.48.0/20 ip4:50.31.32.0/19 ip4:149.72.0.0/16 ~all",
+    # An include whose default is pass: everything but 5.0.0.0/8 matches it.
+    "open.customer.example": "v=spf1 include:open.example -all",
+    "open.example": "v=spf1 -ip4:5.0.0.0/8 +all",
+}
+ADDRESSES = {"customer.example": ["203.0.113.10"], "mx.customer.example.": ["203.0.113.25"]}
+
+
+class FixtureResolver(spfcheck.QuietSPFResolver):
+    """Serves POLICIES/ADDRESSES from memory so only evaluation is timed."""
+    def query_txt(self, domain):
+        return [f'"{POLICIES[domain]}"'] if domain in POLICIES else []
+
+    def query_addresses(self, domain):
+        return ADDRESSES.get(domain, [])
+
+    def query_mx(self, domain):
+        return ["mx.customer.example."] if domain == "customer.example" else []
+
+
+def sample_ips(count, seed=1):
+    generator = random.Random(seed)
+    networks = [ipaddress.ip_network(network) for network in ("64.233.160.0/19", "40.92.0.0/15", "149.72.0.0/16", "0.0.0.0/0")]
+    ips = []
+    for _ in range(count):
+        network = generator.choice(networks)
+        ips.append(str(network.network_address + generator.randrange(network.num_addresses)))
+    return ips
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SPF check_host evaluations per second over a compiled policy")
+    parser.add_argument("-n", "--count", type=int, default=200000, help="Evaluations to run")
+    args = parser.parse_args()
+
+    checker = spfcheck.SPFChecker(FixtureResolver())
+    start = time.perf_counter()
+    checker.policy("customer.example")
+    compiled = time.perf_counter() - start
+
+    ips = sample_ips(args.count)
+    start = time.perf_counter()
+    results = {}
+    for ip, domain, result in checker.check_many((ip, "customer.example") for ip in ips):
+        results[result] = results.get(result, 0) + 1
+    elapsed = time.perf_counter() - start
+    print(f"compile: {compiled * 1000:.2f} ms")
+    print(f"{args.count} evaluations in {elapsed:.2f}s ({args.count / elapsed:,.0f}/s) {results}")
+
+    for domain in ("customer.example", "open.customer.example"):
+        start = time.perf_counter()
+        records = spfcheck.flatten(checker, domain)
+        flattened = time.perf_counter() - start
+        sampled, mismatches = spfcheck.verify(checker, domain, records)
+        print(f"flatten {domain}: {len(records)} records in {flattened * 1000:.2f} ms, {len(mismatches)}/{sampled} mismatches")
+        if mismatches:
+            sys.exit(f"flattened {domain} disagrees with the live policy, e.g. {mismatches[0]}")
+
+
+if __name__ == "__main__":
+    main()
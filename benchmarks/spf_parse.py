@@ -0,0 +1,107 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import spf
+
+# Published SPF records of common senders and typical customer records.
+CORPUS = [
+    "v=spf1 include:_netblocks.google.com include:_netblocks2.google.com include:_netblocks3.google.com ~all",
+    "v=spf1 ip4:35.190.247.0/24 ip4:64.233.160.0/19 ip4:66.102.0.0/20 ip4:66.249.80.0/20 ip4:72.14.192.0/18 ip4:74.125.0.0/16 ip4:108.177.8.0/21 ip4:173.194.0.0/16 ip4:209.85.128.0/17 ip4:216.58.192.0/19 ip4:216.239.32.0/19 ~all",
+    "v=spf1 ip6:2001:4860:4000::/36 ip6:2404:6800:4000::/36 ip6:2607:f8b0:4000::/36 ip6:2800:3f0:4000::/36 ip6:2a00:1450:4000::/36 ip6:2c0f:fb50:4000::/36 ~all",
+    "v=spf1 include:spf.protection.outlook.com -all",
+    "v=spf1 ip4:40.92.0.0/15 ip4:40.107.0.0/16 ip4:52.100.0.0/15 ip4:52.102.0.0/16 ip4:52.103.0.0/17 ip4:104.47.0.0/17 ip6:2a01:111:f400::/48 ip6:2a01:111:f403::/49 ip6:2a01:111:f403:8000::/51 ip6:2a01:111:f403:c000::/51 ip6:2a01:111:f403:f000::/52 -all",
+    "v=spf1 include:spf.email-hosting.net.au ~all",
+    "v=spf1 a mx include:spf.hostingplatform.net.au ~all",
+    "v=spf1 include:servers.mcsv.net ?all",
+    "v=spf1 ip4:205.201.128.0/20 ip4:198.2.128.0/18 ip4:148.105.8.0/21 -all",
+    "v=spf1 include:sendgrid.net include:mailgun.org include:amazonses.com -all",
+    "v=spf1 ip4:167.89.0.0/17 ip4:208.117.48.0/20 ip4:50.31.32.0/19 ip4:198.37.144.0/20 ip4:198.21.0.0/21 ip4:192.254.112.0/20 ip4:168.245.0.0/17 ip4:149.72.0.0/16 ip4:159.183.0.0/16 ~all",
+    "v=spf1 include:mail.zendesk.com include:_spf.salesforce.com include:spf.mandrillapp.com ~all",
+    "v=spf1 exists:%{i}._spf.mta.salesforce.com -all",
+    "v=spf1 include:%{ir}.%{v}.%{d}.spf.has.pphosted.com ~all",
+    "v=spf1 redirect=_spf.example.com",
+    "v=spf1 a mx ip4:203.0.113.10 ip4:203.0.113.11 include:_spf.google.com include:_spf.google.com ~all ~all",
+    "v=spf1 mx a:mail.example.com.au ptr -all",
+    "v=spf1 203.0.113.5 include:spf.protection.outlook.com -all",
+    '"v=spf1 include:spf.email-hosting.net.au -all"',
+    "v=spf1 include:spf.protection.outlook.com include:spf.email-hosting.net.au include:_spf.google.com include:servers.mcsv.net include:sendgrid.net include:mailgun.org include:amazonses.com include:_spf.salesforce.com include:mail.zendesk.com include:spf.mandrillapp.com include:_spf.createsend.com -all",
+]
+
+
+def legacy_lint(spf_record):
+    """The regex-per-rule implementation SPFResolver.lint replaced, kept for comparison."""
+    errors = []
+    if spf_record.startswith('"') or spf_record.endswith('"'):
+        errors.append("quotes")
+    if "\\" in spf_record:
+        errors.append("backslash")
+    if spf_record.count("~all") > 1:
+        errors.append("~all")
+    if not spf_record.startswith('v=spf1'):
+        errors.append("version")
+    if re.search(r'\binclude:[^\w.-]', spf_record):
+        errors.append("malformed include")
+    if re.search(r'\bredirect=[^\s]+', spf_record):
+        errors.append("redirect")
+    if len(re.findall(r'\ba\b', spf_record)) > 1:
+        errors.append("duplicate a")
+    if len(re.findall(r'\bmx\b', spf_record)) > 1:
+        errors.append("duplicate mx")
+    seen_includes = set()
+    for include in re.findall(r'include:([\w.-]+)', spf_record):
+        if include in seen_includes:
+            errors.append("duplicate include")
+        seen_includes.add(include)
+    if len(spf_record) > 255:
+        errors.append("length")
+    if re.search(r'\b\d{1,3}(\.\d{1,3}){3}\b', spf_record) and not re.search(r'\bip[46]:', spf_record):
+        errors.append("bare ip")
+    if not spf_record.strip():
+        errors.append("empty")
+    if re.search(r'\bredirect\b', spf_record) and re.search(r'\b(include|a|mx|ip4|ip6)\b', spf_record):
+        errors.append("redirect and mechanisms")
+    count = 0
+    if re.search(r'\ba\b', spf_record):
+        count += 1
+    if re.search(r'\bmx\b', spf_record):
+        count += 1
+    targets = re.findall(r'include:([\w.-]+)', spf_record) + re.findall(r'redirect=([\w.-]+)', spf_record)
+    return errors, count, targets
+
+
+def tokenized_lint(resolver, spf_record):
+    terms = spf.tokenize.__wrapped__(spf_record)
+    errors = resolver.lint(spf_record, terms)
+    count = sum(1 for term in terms if term.kind == "mechanism" and term.name in spf.LOOKUP_MECHANISMS)
+    targets = resolver.includes(terms) + resolver.redirects(terms)
+    return errors, count, targets
+
+
+def measure(function, records, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            function(record)
+    elapsed = time.perf_counter() - start
+    return repeat * len(records) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SPF lint throughput, regex scans vs tokenizer")
+    parser.add_argument("-n", "--repeat", type=int, default=2000, help="Passes over the corpus")
+    args = parser.parse_args()
+
+    resolver = spf.SPFResolver()
+    before = measure(legacy_lint, CORPUS, args.repeat)
+    after = measure(lambda record: tokenized_lint(resolver, record), CORPUS, args.repeat)
+    print(f"{len(CORPUS)} records x {args.repeat}")
+    print(f"regex scans: {before:,.0f} records/s")
+    print(f"tokenizer:   {after:,.0f} records/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
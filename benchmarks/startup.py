@@ -0,0 +1,60 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+ENTRY_POINTS = ["di", "spf", "spfcheck", "cor", "asic", "cache", "whm"]
+# Modules that should only load once a backend is actually used.
+HEAVY = ["dns.resolver", "requests", "bs4", "whois", "sqlite3", "cProfile", "urllib3"]
+
+
+def parse_importtime(stderr):
+    """Returns (total import microseconds, imported module names) from -X importtime output."""
+    total = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules.add(name.strip())
+        # Top level imports are unindented; their cumulative time includes everything below them.
+        if name.startswith(" ") and not name.startswith("  "):
+            total += int(cumulative)
+    return total, modules
+
+
+def measure(command, repeat):
+    walls = []
+    imports = []
+    modules = set()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime"] + command, cwd=SRC,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        walls.append(time.perf_counter() - start)
+        total, modules = parse_importtime(process.stderr)
+        imports.append(total)
+    return statistics.median(walls), statistics.median(imports) / 1e6, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start latency of each entry point's --help")
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="Runs per entry point (median is reported)")
+    parser.add_argument("entry_points", nargs="*", default=ENTRY_POINTS, help="Entry points to measure")
+    args = parser.parse_args()
+
+    floor, _, _ = measure(["-c", "pass"], args.repeat)
+    print(f"interpreter: {floor * 1000:.1f}ms")
+    for entry in args.entry_points:
+        wall, imports, modules = measure([f"{entry}.py", "--help"], args.repeat)
+        heavy = [module for module in HEAVY if module in modules]
+        print(f"{entry:<9} {wall * 1000:7.1f}ms wall  {imports * 1000:7.1f}ms imports  heavy: {', '.join(heavy) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
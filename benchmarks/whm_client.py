@@ -0,0 +1,135 @@
+import argparse
+import http.server
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import ratelimit
+import whm
+
+TOKEN = "BENCHMARKTOKEN"
+
+
+def accounts(server, count):
+    """{user: (uid, [domains])}, each account with a main, an addon, a parked and a sub domain."""
+    return {
+        f"user{server}x{i}": (1000 + i, [f"site{server}x{i}.com.au", f"addon{server}x{i}.net.au",
+                                         f"parked{server}x{i}.au", f"shop.site{server}x{i}.com.au"])
+        for i in range(count)
+    }
+
+
+def serve(table, latency):
+    """A stand-in for the WHM JSON API (version 1) functions WHMClient calls."""
+    owners = {domain: user for user, (_, domains) in table.items() for domain in domains}
+
+    def answer(function, params):
+        if function == "domainuserdata":
+            user = owners.get(params.get("domain"))
+            return user is not None, {"userdata": {"user": user}} if user else {}
+        if function == "accountsummary":
+            user = params.get("user")
+            return user in table, {"acct": [{"user": user, "uid": table[user][0]}]} if user in table else {}
+        if function == "get_domain_info":
+            return True, {"domains": [{"domain": domain, "user": user} for domain, user in owners.items()]}
+        if function == "listaccts":
+            return True, {"acct": [{"user": user, "uid": uid} for user, (uid, _) in table.items()]}
+        return False, {}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self.server.requests += 1
+            time.sleep(latency)
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            if self.headers.get("Authorization") != f"whm root:{TOKEN}" or params.get("api.version") != "1":
+                self.send_response(403)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            found, data = answer(url.path.rsplit("/", 1)[-1], params)
+            body = json.dumps({"metadata": {"result": int(found), "reason": "OK" if found else "not found"}, "data": data}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bash_startup(repeat=5):
+    """What the `bash -i -c whm` subprocess pays before the script does anything."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        subprocess.run(["bash", "-i", "-c", "true"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WHM account lookups against local WHM API stand-ins, per domain vs batched")
+    parser.add_argument("-s", "--servers", type=int, default=3, help="Stand-in WHM servers")
+    parser.add_argument("-a", "--accounts", type=int, default=200, help="Accounts per server")
+    parser.add_argument("-n", "--lookups", type=int, default=100, help="Domains to look up")
+    parser.add_argument("-l", "--latency", type=float, default=0.01, help="Simulated server latency in seconds")
+    args = parser.parse_args()
+
+    tables = [accounts(index, args.accounts) for index in range(args.servers)]
+    servers = [serve(table, args.latency) for table in tables]
+    config = [{"host": "127.0.0.1", "port": server.server_address[1], "token": TOKEN, "title": f"whm{index}", "scheme": "http"}
+              for index, server in enumerate(servers)]
+    # Every stand-in is 127.0.0.1, so lift the shared WHM budget to measure the client itself.
+    ratelimit.configure("whm=none,whm:127.0.0.1=none")
+    client = whm.WHMClient(config)
+
+    domains = [domains[index % 4] for table in tables for index, (_, domains) in enumerate(table.values())]
+    domains = domains[::max(len(domains) // args.lookups, 1)][:args.lookups] + ["missing.com.au"]
+
+    start = time.perf_counter()
+    single = {domain: client.lookup(domain) for domain in domains}
+    serial = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = client.lookup_many(domains)
+    batched = time.perf_counter() - start
+
+    index = whm.WHMIndex(client)
+    start = time.perf_counter()
+    index.refresh()
+    refresh = time.perf_counter() - start
+    start = time.perf_counter()
+    indexed = {domain: index.lookup(domain, live=False) for domain in domains}
+    probe = time.perf_counter() - start
+    for server in servers:
+        server.shutdown()
+
+    if not single == batch == indexed:
+        sys.exit("lookup, lookup_many and the index disagree")
+    if single["missing.com.au"] is not None or any(single[domain] is None for domain in domains[:-1]):
+        sys.exit("stand-in accounts were not all found")
+
+    spawn = bash_startup()
+    print(f"{args.servers} servers x {args.accounts} accounts, {len(domains)} lookups, {args.latency * 1000:.0f}ms latency")
+    print(f"bash -i startup: {spawn * 1000:7.1f}ms per domain (before the whm script runs)")
+    print(f"lookup:          {serial / len(domains) * 1000:7.1f}ms per domain")
+    print(f"lookup_many:     {batched / len(domains) * 1000:7.1f}ms per domain ({serial / batched:.1f}x)")
+    print(f"index refresh:   {refresh * 1000:7.1f}ms for {sum(len(table) * 4 for table in tables)} domains")
+    print(f"index lookup:    {probe / len(domains) * 1e6:7.1f}us per domain")
+
+
+if __name__ == "__main__":
+    main()
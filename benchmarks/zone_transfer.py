@@ -0,0 +1,176 @@
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+
+import dns.message
+import dns.query
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+import dns.zone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import di
+import ratelimit
+
+ORIGIN = "example.com."
+
+
+def make_zone(hosts, serial):
+    lines = [
+        f"$ORIGIN {ORIGIN}",
+        "$TTL 300",
+        f"@ IN SOA ns1.nameserver.net.au. hostmaster.example.com. {serial} 3600 600 86400 60",
+        "@ IN NS ns1.nameserver.net.au.",
+        "@ IN A 192.0.2.10",
+        "@ IN MX 10 mx1.email-hosting.net.au.",
+        '@ IN TXT "v=spf1 mx ~all"',
+    ]
+    lines += [f"{subdomain} IN A 192.0.2.{10 + index}" for index, subdomain in enumerate(di.Config.GENERIC_SUBDOMAINS)]
+    lines += [f"host{i} IN A 10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(hosts)]
+    return dns.zone.from_text("\n".join(lines) + "\n", relativize=False)
+
+
+class Authority:
+    """A dnspython authoritative stand-in: UDP/TCP queries, AXFR, and IXFR (up to date, or answered AXFR style)."""
+    def __init__(self, zone, allow_transfer=True, chunk=200):
+        self.zone = zone
+        self.allow_transfer = allow_transfer
+        self.chunk = chunk
+
+    def serial(self):
+        return self.zone.find_rdataset(self.zone.origin, dns.rdatatype.SOA)[0].serial
+
+    def soa(self):
+        return self.zone.find_rrset(self.zone.origin, dns.rdatatype.SOA)
+
+    def answer(self, query):
+        response = dns.message.make_response(query)
+        question = query.question[0]
+        node = self.zone.get_node(question.name)
+        if node is None:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(self.soa())
+            return response
+        rdataset = node.get_rdataset(question.rdclass, question.rdtype)
+        if rdataset is None:
+            response.authority.append(self.soa())
+        else:
+            rrset = dns.rrset.RRset(question.name, rdataset.rdclass, rdataset.rdtype)
+            rrset.update(rdataset)
+            response.answer.append(rrset)
+        return response
+
+    def transfer(self, query):
+        """Yields the response messages for an AXFR or IXFR query."""
+        if not self.allow_transfer:
+            response = dns.message.make_response(query)
+            response.set_rcode(dns.rcode.REFUSED)
+            yield response
+            return
+        if query.question[0].rdtype == dns.rdatatype.IXFR and query.authority and query.authority[0][0].serial >= self.serial():
+            response = dns.message.make_response(query)
+            response.answer.append(self.soa())
+            yield response
+            return
+        rrsets = [self.soa()]
+        for name, node in self.zone.nodes.items():
+            for rdataset in node.rdatasets:
+                if rdataset.rdtype != dns.rdatatype.SOA:
+                    rrset = dns.rrset.RRset(name, rdataset.rdclass, rdataset.rdtype)
+                    rrset.update(rdataset)
+                    rrsets.append(rrset)
+        rrsets.append(self.soa())
+        for start in range(0, len(rrsets), self.chunk):
+            response = dns.message.make_response(query)
+            response.answer.extend(rrsets[start:start + self.chunk])
+            yield response
+
+    def serve(self):
+        authority = self
+
+        class UDPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                sock.sendto(authority.answer(dns.message.from_wire(data)).to_wire(), self.client_address)
+
+        class TCPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                query, _ = dns.query.receive_tcp(self.request)
+                if query.question[0].rdtype in (dns.rdatatype.AXFR, dns.rdatatype.IXFR):
+                    for response in authority.transfer(query):
+                        dns.query.send_tcp(self.request, response)
+                else:
+                    dns.query.send_tcp(self.request, authority.answer(query))
+
+        class UDPServer(socketserver.ThreadingMixIn, socketserver.UDPServer):
+            daemon_threads = True
+
+        class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        tcp = TCPServer(("127.0.0.1", 0), TCPHandler)
+        udp = UDPServer(("127.0.0.1", tcp.server_address[1]), UDPHandler)
+        for server in (tcp, udp):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return tcp.server_address[1]
+
+
+def resolver(port):
+    return di.DNSResolver(f"127.0.0.1:{port}")
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zone transfer vs per-name sweep against a local authoritative stand-in")
+    parser.add_argument("-n", "--hosts", type=int, default=5000, help="Extra hosts in the zone")
+    args = parser.parse_args()
+
+    ratelimit.configure("dns=none")
+    base_domain = ORIGIN.rstrip(".")
+    authority = Authority(make_zone(args.hosts, 1))
+    port = authority.serve()
+    refusing_port = Authority(make_zone(args.hosts, 1), allow_transfer=False).serve()
+
+    swept, sweep_time = timed(lambda: di.fetch_records(resolver(port), base_domain, list(di.Config.GENERIC_SUBDOMAINS)))
+
+    transferrer = di.ZoneTransfer(resolver(port), port=port)
+    zone, axfr_time = timed(lambda: transferrer.transfer(base_domain, ["127.0.0.1"]))
+    transferred = transferrer.to_records(zone, base_domain)
+    zone_text = zone.to_text()
+    serial, serial_time = timed(lambda: transferrer.serial(base_domain, ["127.0.0.1"]))
+    _, ixfr_time = timed(lambda: transferrer.transfer(base_domain, ["127.0.0.1"], zone_text))
+    ixfr_kind = transferrer.kind
+    authority.zone = make_zone(args.hosts + 1, 2)
+    updated, changed_time = timed(lambda: transferrer.transfer(base_domain, ["127.0.0.1"], zone_text))
+    refused = di.ZoneTransfer(resolver(refusing_port), port=refusing_port).transfer(base_domain, ["127.0.0.1"])
+
+    sweep_dict = di.records_to_dict(swept)
+    transfer_dict = di.records_to_dict(transferred)
+    missing = [(type, host) for type, hosts in sweep_dict.items() for host in hosts if transfer_dict.get(type, {}).get(host) != hosts[host]]
+    if missing:
+        sys.exit(f"transfer disagrees with the sweep for {missing}")
+    if serial != 1 or refused is not None or updated.get_node(f"host{args.hosts}.{ORIGIN}") is None:
+        sys.exit("refused transfer or IXFR update not handled")
+
+    names = sum(len(hosts) for hosts in transfer_dict.values())
+    print(f"zone with {len(zone.nodes)} names")
+    sweep_names = len(di.Config.GENERIC_SUBDOMAINS) + 1
+    print(f"per-name sweep: {sweep_time * 1000:8.1f}ms for {sweep_names} names ({sweep_time / sweep_names * len(zone.nodes):.1f}s projected for the zone)")
+    print(f"AXFR:           {axfr_time * 1000:8.1f}ms for {names} (host, type) sets")
+    print(f"SOA check:      {serial_time * 1000:8.1f}ms (what di does before an IXFR)")
+    print(f"IXFR, current:  {ixfr_time * 1000:8.1f}ms ({ixfr_kind}, mostly parsing the stored zone)")
+    print(f"IXFR, changed:  {changed_time * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import concurrent.futures
+import threading
+import urllib.parse
+import cache
+import common
+import ratelimit
+import metrics
+
+bs4 = common.LazyModule("bs4")
+requests = common.LazyModule("requests")
+
+ABN_URL = "https://abr.business.gov.au/ABN/View?abn="
+LOCAL_BUSINESS = 'itemtype="http://schema.org/LocalBusiness"'
+# (connect, read) seconds
+TIMEOUT = (5, 20)
+MAX_WORKERS = 8
+
+
+def parse_abn(html):
+    """Extracts type/name/status from the LocalBusiness block of an ABR page, or None.
+
+    Only the block itself is handed to the parser: everything before it (head,
+    navigation, scripts) is skipped by a plain string search, and SoupStrainer
+    keeps the tree down to the one div.
+    """
+    marker = html.find(LOCAL_BUSINESS)
+    if marker == -1:
+        return None
+    start = html.rfind("<div", 0, marker)
+    strainer = bs4.SoupStrainer("div", attrs={"itemtype": "http://schema.org/LocalBusiness"})
+    soup = bs4.BeautifulSoup(html[start:], "html.parser", parse_only=strainer)
+
+    abn = {}
+    try:
+        entity_type_row = soup.find("th", string="Entity type:")
+        if entity_type_row:
+            abn["type"] = entity_type_row.find_next("a").text.strip()
+        abn["name"] = soup.find("span", itemprop="legalName").text.strip()
+        abn["status"] = soup.find("td", string=lambda text: text and ('Active' in text or 'Cancelled' in text)).text.strip()
+        return abn
+    except AttributeError:
+        return None
+
+
+class ABRClient:
+    """ABN lookups over one keep-alive session, cached in the shared result store."""
+    def __init__(self, url=ABN_URL, timeout=TIMEOUT, max_workers=MAX_WORKERS, store=None):
+        self.url = url
+        self.destination = f"http:{urllib.parse.urlsplit(url).hostname}"
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.store = store
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def fetch(self, id):
+        ratelimit.acquire(self.destination)
+        metrics.count("abr.requests")
+        with metrics.timer("abr.fetch"):
+            response = self.session.get(f"{self.url}{id}", timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    def scrape(self, id):
+        abn = parse_abn(self.fetch(id))
+        if abn is not None:
+            abn["id"] = f"{id}"
+        return abn
+
+    def lookup(self, id):
+        """Returns {"id", "name", "type", "status"} for an ABN, or None when it can't be found."""
+        id = f"{id}"
+        if self.store is None:
+            return self.scrape(id)
+        abn = self.store.fetch("abn", id, lambda: self.scrape(id))
+        if abn is not None:
+            abn.setdefault("id", id)
+        return abn
+
+    def lookup_many(self, ids, max_workers=None):
+        """Looks up ABNs in parallel, at most max_workers at a time, returning {id: result or None}.
+
+        A failed request yields None for that ABN instead of aborting the batch.
+        """
+        def safe_lookup(id):
+            try:
+                return self.lookup(id)
+            except requests.RequestException:
+                return None
+
+        ids = list(dict.fromkeys(f"{id}" for id in ids))
+        if not ids:
+            return {}
+        workers = min(max_workers or self.max_workers, len(ids))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(ids, executor.map(ratelimit.bind(safe_lookup), ids)))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def default_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ABRClient(store=cache.default_store())
+        return _client
@@ -1,29 +1,17 @@
 import argparse
-import bs4
-import requests
 import common
+import cache
+import daemon
+import abr
 
 ABN_URI="https://abr.business.gov.au/ABN/View?abn="
 ACN_URI="https://connectonline.asic.gov.au/RegistrySearch/faces/landing/panelSearch.jspx?searchTab=search&searchType=OrgAndBusNm&searchText="
 
 def fetch_abn(id):
-    abn_search_uri = f"{ABN_URI}{id}"
-    abn = {
-        "id":f"{id}",
-    }
-    html = requests.get(abn_search_uri).text
-    soup = bs4.BeautifulSoup(html, "html.parser").find("div", {'itemscope': True, 'itemtype': 'http://schema.org/LocalBusiness'})    
-    
-    try:
-        entity_type_row = soup.find("th", string="Entity type:")
-        if entity_type_row:
-            abn["type"] = entity_type_row.find_next("a").text.strip()
-        abn["name"] = soup.find("span", itemprop="legalName").text.strip()
-        abn["status"] = soup.find("td", string=lambda text: text and ('Active' in text or 'Cancelled' in text)).text.strip()
-        return abn
-    except:
-        common.print_error(f"Could not find ABN at: {abn_search_uri}")
-        return None
+    abn = abr.default_client().lookup(id)
+    if abn is None:
+        common.print_error(f"Could not find ABN at: {ABN_URI}{id}")
+    return abn
 
 def display_abn(abn):
     common.print_color(f"{ABN_URI}{abn['id']}", "YELLOW")
@@ -64,15 +52,17 @@ def search_asic(input):
     except:
         common.print_error(f"Cannot find: {input}")    
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(
         prog="ASIC",
         description="ASIC Search"
     )
     parser.add_argument("id", help="ABN/ACN")
-    args = parser.parse_args()
+    parser.add_argument("--no-cache", help="Ignore cached ABN results", action="store_true")
+    args = parser.parse_args(argv)
+    cache.set_bypass(args.no_cache)
     search_asic(args.id)        
     pass
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    daemon.dispatch("asic", main, ("--no-cache",))
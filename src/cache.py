@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import threading
+import time
+import common
+import ratelimit
+import metrics
+
+sqlite3 = common.LazyModule("sqlite3")
+
+# Seconds a cached result stays fresh, per source.
+TTLS = {
+    "whois": 24 * 60 * 60,
+    "abn": 7 * 24 * 60 * 60,
+    # WHM account index snapshots; whm.WHMIndex refreshes them long before this.
+    "whm": 7 * 24 * 60 * 60,
+    # Record set snapshots for di's change diffs; freshness is decided by the SOA serial and record TTLs.
+    "records": 30 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 24 * 60 * 60
+MAX_ENTRIES = 20000
+# The size limit is checked every this many writes rather than on each one, so it can be overshot by as much.
+EVICT_INTERVAL = 100
+
+
+def cache_dir():
+    if os.environ.get("POLARIC_CACHE_DIR"):
+        return os.environ["POLARIC_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "polaric")
+
+
+class Record(dict):
+    """A cached JSON object that also allows attribute access, like whois.WhoisEntry."""
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+class Store:
+    """On-disk result store shared by di, cor and asic.
+
+    Results are JSON encoded in a single SQLite table keyed by (source, key). When
+    bypass is set, reads always miss but fresh results are still written back.
+    """
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, ttls=None, bypass=False):
+        self.path = path or os.path.join(cache_dir(), "store.sqlite3")
+        self.max_entries = max_entries
+        self.ttls = dict(TTLS, **(ttls or {}))
+        self.bypass = bypass or os.environ.get("POLARIC_NO_CACHE") == "1"
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "source TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (source, key))")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries (created)")
+        return self._connection
+
+    def ttl(self, source):
+        return self.ttls.get(source, DEFAULT_TTL)
+
+    def get(self, source, key):
+        with self._lock:
+            if self.bypass:
+                self.misses += 1
+                return None
+            row = self.connection.execute(
+                "SELECT value, created FROM entries WHERE source = ? AND key = ?", (source, key)).fetchone()
+            if row is None or row[1] + self.ttl(source) < time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0], object_hook=Record)
+
+    def put(self, source, key, value):
+        encoded = json.dumps(value, default=str)
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (source, key, value, created) VALUES (?, ?, ?, ?)",
+                (source, key, encoded, time.time()))
+            # Other processes write to the same file, so the row count is checked rather than tracked.
+            if self._writes % EVICT_INTERVAL == 0:
+                self._evict()
+            self._writes += 1
+        return json.loads(encoded, object_hook=Record)
+
+    def fetch(self, source, key, function):
+        """Returns the cached result for key, otherwise calls function and caches anything but None."""
+        value = self.get(source, key)
+        if value is not None:
+            metrics.count(f"{source}.cache_hits")
+            return value
+        metrics.count(f"{source}.lookups")
+        value = function()
+        if value is None:
+            return None
+        return self.put(source, key, value)
+
+    def _evict(self):
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY created LIMIT ?)",
+                (count - self.max_entries,))
+
+    def purge(self, source=None, expired_only=False):
+        removed = 0
+        with self._lock:
+            sources = [source] if source else [row[0] for row in self.connection.execute("SELECT DISTINCT source FROM entries")]
+            for name in sources:
+                cutoff = time.time() - self.ttl(name) if expired_only else float("inf")
+                removed += self.connection.execute(
+                    "DELETE FROM entries WHERE source = ? AND created < ?", (name, cutoff)).rowcount
+            self.connection.execute("VACUUM")
+        return removed
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT source, COUNT(*), MIN(created), MAX(created) FROM entries GROUP BY source").fetchall()
+            sources = {}
+            for source, count, oldest, newest in rows:
+                (expired,) = self.connection.execute(
+                    "SELECT COUNT(*) FROM entries WHERE source = ? AND created < ?",
+                    (source, now - self.ttl(source))).fetchone()
+                sources[source] = {"entries": count, "expired": expired, "oldest": now - oldest, "newest": now - newest}
+        return {
+            "path": self.path,
+            "size": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "sources": sources,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_store = None
+
+
+def default_store():
+    global _store
+    if _store is None:
+        _store = Store()
+    return _store
+
+
+def set_bypass(bypass):
+    if bypass:
+        default_store().bypass = True
+
+
+# Whois server python-whois queries per TLD, used to share one rate limit per server.
+WHOIS_SERVERS = {
+    "au": "whois.auda.org.au",
+}
+# Markers registries put in a whois response instead of the record when rate limiting.
+THROTTLE_MARKERS = ("BLACKLISTED", "exceeded")
+
+
+class WhoisThrottled(Exception):
+    """Raised instead of caching a response the registry replaced with a rate limit notice."""
+
+
+def whois_server(domain):
+    tld = domain.rstrip(".").rsplit(".", 1)[-1].lower()
+    return WHOIS_SERVERS.get(tld, tld)
+
+
+def whois_lookup(domain):
+    import whois
+
+    def lookup():
+        ratelimit.acquire(f"whois:{whois_server(domain)}")
+        entry = whois.whois(domain)
+        text = getattr(entry, "text", "") or ""
+        if any(marker in text for marker in THROTTLE_MARKERS):
+            raise WhoisThrottled(domain)
+        return dict(entry)
+
+    return default_store().fetch("whois", domain.lower(), lookup)
+
+
+def display_stats(stats):
+    common.print_color(f"Store: {stats['path']} ({stats['size'] / 1024:.1f} KiB)", "CYAN")
+    if not stats["sources"]:
+        common.print_color("Empty.", "YELLOW")
+    for source, data in stats["sources"].items():
+        common.print_color(
+            f"{source}: {data['entries']} entries ({data['expired']} expired), "
+            f"oldest {data['oldest'] / 3600:.1f}h, newest {data['newest'] / 3600:.1f}h, ttl {default_store().ttl(source) / 3600:.0f}h",
+            "WHITE")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Cache",
+        description="Manage the shared whois/ABN result store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show entries per source")
+    purge_parser = subparsers.add_parser("purge", help="Remove cached results")
+    purge_parser.add_argument("source", nargs="?", help="Only purge this source (e.g. whois, abn)")
+    purge_parser.add_argument("-e", "--expired", help="Only purge expired results", action="store_true")
+    args = parser.parse_args()
+
+    store = default_store()
+    if args.command == "stats":
+        display_stats(store.stats())
+    elif args.command == "purge":
+        removed = store.purge(args.source, args.expired)
+        common.print_color(f"Purged {removed} entries.", "GREEN")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
+import argparse
+import importlib
 import re
 import socket
 import tempfile
 import subprocess
+import sys
 import os
+import types
 
 RESET = "\033[0m"
 COLORS = {
@@ -77,13 +81,25 @@ def hyperlink(link, display):
     return f'\033]8;;{link}\033\\{display}\033]8;;\033\\'
 
 
-def print_color(message, color, style="NORMAL", end="\n"):
-    """Prints a message with the specified color."""
-    print(gen_color_str(message, color, style), end=end)
+def print_color(message, color, style="NORMAL", end="\n", file=None):
+    """Prints a message with the specified color, or as plain text when the stream (stdout by default) isn't a terminal."""
+    file = file or sys.stdout
+    print(gen_color_str(message, color, style) if file.isatty() else message, end=end, file=file)
 
 
-def print_error(message):
-    print_color(message, COLORS["RED"], STYLES["BOLD"])
+def print_error(message, file=None):
+    print_color(message, "RED", "BOLD", file=file)
+
+
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 
 def validate_tld(domain, tld):
@@ -116,5 +132,31 @@ def is_valid_ip(ip):
         if is_valid_ipv4(ip):
             return True
     if is_valid_ipv6(ip):
-        return Tru
+        return True
     return False
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module and imports it on first attribute access.
+
+    Attributes the real module doesn't have are imported as submodules, so one
+    dns = LazyModule("dns") serves dns.resolver, dns.rdatatype and so on.
+    """
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, name):
+        module = self._load()
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            try:
+                return importlib.import_module(f"{self.__name__}.{name}")
+            except ModuleNotFoundError:
+                raise AttributeError(f"module '{self.__name__}' has no attribute '{name}'") from None
@@ -1,31 +1,204 @@
 import argparse
+import concurrent.futures
+import csv
+import json
+import random
+import threading
+import time
 import common
-import whois
 import asic
+import abr
+import cache
+import daemon
+import ratelimit
 
-def resolve_id(input):
+MAX_WORKERS = 16
+SERVER_CONCURRENCY = 4
+RETRIES = 4
+BACKOFF = 2.0
+
+class WhoisPool:
+    """Runs whois lookups concurrently, at most per_server at a time against any one whois server.
+
+    When a server answers with a rate limit notice, every lookup against it pauses
+    for an exponentially growing, jittered delay before retrying.
+    """
+    def __init__(self, max_workers=MAX_WORKERS, per_server=SERVER_CONCURRENCY, retries=RETRIES, backoff=BACKOFF):
+        self.max_workers = max_workers
+        self.per_server = per_server
+        self.retries = retries
+        self.backoff = backoff
+        self.semaphores = {}
+        self.resume = {}
+        self.lock = threading.Lock()
+        self.elapsed = 0.0
+
+    @staticmethod
+    def server(domain):
+        return cache.whois_server(domain)
+
+    def semaphore(self, server):
+        with self.lock:
+            if server not in self.semaphores:
+                self.semaphores[server] = threading.BoundedSemaphore(self.per_server)
+            return self.semaphores[server]
+
+    def throttle(self, server, attempt):
+        delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+        with self.lock:
+            self.resume[server] = max(self.resume.get(server, 0), time.monotonic() + delay)
+
+    def lookup(self, domain):
+        server = self.server(domain)
+        for attempt in range(self.retries + 1):
+            wait = self.resume.get(server, 0) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            with self.semaphore(server):
+                start = time.perf_counter()
+                try:
+                    return cache.whois_lookup(domain)
+                except cache.WhoisThrottled:
+                    if attempt == self.retries:
+                        raise
+                finally:
+                    with self.lock:
+                        self.elapsed += time.perf_counter() - start
+            common.print_color(f"{server} is throttling lookups, backing off ({domain}).", "YELLOW")
+            self.throttle(server, attempt)
+
+    def map(self, domains):
+        """Yields (domain, whois result or the exception raised) in input order."""
+        def safe_lookup(domain):
+            try:
+                return self.lookup(domain)
+            except Exception as error:
+                return error
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from zip(domains, executor.map(ratelimit.bind(safe_lookup), domains))
+
+def validate(input):
     if not common.is_fqdn(input):
             common.print_error(f"{input} is not a fully qualified domain name. Skipping.")
-            return None
+            return False
     if not common.validate_tld(input, "au"):
         common.print_error(f"{input} is not australian...? Skipping.")
-        return None
-    whois_information = whois.whois(input)
+        return False
+    return True
+
+def registrant_id(whois_information):
     if whois_information.registrant_id is None:
         return None
-    id = common.digitialise(whois_information.registrant_id).replace(" ", "")
-    return id
+    return common.digitialise(whois_information.registrant_id).replace(" ", "")
+
+def resolve_id(input):
+    if not validate(input):
+        return None
+    return registrant_id(cache.whois_lookup(input))
 
-def resolve_ids(data):
+def resolve_ids(data, pool=None):
     # data-type: [("qualifier", "id"]
+    pool = pool or WhoisPool()
+    qualifiers = [qualifier for qualifier in data if validate(qualifier)]
+    start = time.perf_counter()
     ids = []
-    for qualifier in data:
-        id = resolve_id(qualifier)
+    for qualifier, whois_information in pool.map(qualifiers):
+        if isinstance(whois_information, Exception):
+            common.print_error(f"Whois lookup for {qualifier} failed: {whois_information!r}. Skipping.")
+            continue
+        id = registrant_id(whois_information)
         if id != None:
             ids.append((qualifier, id))
+    elapsed = time.perf_counter() - start
+    if qualifiers:
+        common.print_color(
+            f"Resolved {len(ids)}/{len(qualifiers)} registrant IDs in {elapsed:.2f}s "
+            f"({pool.elapsed:.2f}s of whois lookups, {pool.elapsed / max(elapsed, 1e-9):.1f}x)", "CYAN")
     return ids
 
-def main():
+def id_kind(id):
+    return {11: "ABN", 9: "ACN"}.get(len(id))
+
+def same_entity(a, b):
+    # A company's ABN is two check digits followed by its ACN.
+    if a == b:
+        return True
+    if {id_kind(a), id_kind(b)} == {"ABN", "ACN"}:
+        abn, acn = (a, b) if id_kind(a) == "ABN" else (b, a)
+        return abn[2:] == acn
+    return False
+
+def group_ids(ids):
+    # {"id": ["qualifier", ...]}, in order of first appearance
+    groups = {}
+    for (qualifier, id) in ids:
+        groups.setdefault(id, []).append(qualifier)
+    return groups
+
+def resolve_entities(ids, max_workers=abr.MAX_WORKERS):
+    """Looks up every unique ABN once, concurrently. ACNs have nothing to fetch and map to None."""
+    abns = [id for id in ids if id_kind(id) == "ABN"]
+    entities = dict.fromkeys(ids)
+    entities.update(abr.default_client().lookup_many(abns, max_workers))
+    return entities
+
+def display_entity(id, entity):
+    kind = id_kind(id)
+    if kind == "ABN" and entity is not None:
+        asic.display_abn(entity)
+    elif kind == "ABN":
+        common.print_error(f"Could not find ABN at: {asic.ABN_URI}{id}")
+    elif kind == "ACN":
+        asic.display_acn(id)
+    else:
+        common.print_error(f"Cannot find: {id}")
+
+def display_report(groups, entities, destination_id):
+    for id, qualifiers in groups.items():
+        print(f" {id_kind(id) or 'ID'} {id} ({len(qualifiers)}) ".center(25, "="))
+        display_entity(id, entities.get(id))
+        owned = same_entity(id, destination_id)
+        for qualifier in qualifiers:
+            if owned:
+                common.print_color(f"  {qualifier} (already owned by destination)", "GREEN")
+            else:
+                common.print_color(f"  {qualifier}", "WHITE")
+    print("".center(25, "="))
+    print(f"Destination {destination_id}")
+    display_entity(destination_id, entities.get(destination_id))
+    print("".center(25, "="))
+
+def export_rows(groups, entities, destination_id):
+    for id, qualifiers in groups.items():
+        entity = entities.get(id) or {}
+        for qualifier in qualifiers:
+            yield {
+                "domain": qualifier,
+                "registrant_id": id,
+                "kind": id_kind(id),
+                "name": entity.get("name"),
+                "type": entity.get("type"),
+                "status": entity.get("status"),
+                "owned_by_destination": same_entity(id, destination_id),
+            }
+
+def export_report(path, groups, entities, destination_id):
+    rows = list(export_rows(groups, entities, destination_id))
+    with open(path, "w", newline="") as file:
+        if path.lower().endswith(".json"):
+            destination = entities.get(destination_id) or {}
+            json.dump({
+                "destination": {"id": destination_id, "kind": id_kind(destination_id), "name": destination.get("name"), "status": destination.get("status")},
+                "domains": rows,
+            }, file, indent=2)
+        else:
+            writer = csv.DictWriter(file, fieldnames=["domain", "registrant_id", "kind", "name", "type", "status", "owned_by_destination"])
+            writer.writeheader()
+            writer.writerows(rows)
+    common.print_color(f"Wrote {len(rows)} domains across {len(groups)} entities to {path}", "CYAN")
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         prog="COR",
         description="Change of Registrant"
@@ -33,8 +206,16 @@ def main():
     parser.add_argument("destination", help="What entity is owning the domain?")
     parser.add_argument("-d", "--domain", help="What domain is changing registrant?")
     parser.add_argument("-m", "--multiple", help="What domains are changing registrnat? (separate by new line)", action="store_true")
+    parser.add_argument("-j", "--jobs", help="Concurrent whois lookups", type=common.positive_int, default=MAX_WORKERS)
+    parser.add_argument("--per-server", help="Concurrent whois lookups against any one whois server", type=common.positive_int, default=SERVER_CONCURRENCY)
+    parser.add_argument("-o", "--output", help="Also export the report to FILE (.json for JSON, otherwise CSV)", metavar="FILE")
+    parser.add_argument("--rate-limit", metavar="SPEC", type=ratelimit.argument, action="append", default=[], help="Outbound limits, e.g. 'whois:whois.auda.org.au=1/3,http=none' (requests/s[/burst])")
+    parser.add_argument("--no-cache", help="Ignore cached whois/ABN results", action="store_true")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    cache.set_bypass(args.no_cache)
+    for spec in args.rate_limit:
+        ratelimit.configure(spec)
 
     domains = []
 
@@ -52,16 +233,13 @@ def main():
     if destination_id is None:
         return
     
-    ids = resolve_ids(domains)
-    for (qualifier, id) in ids:
-        print(f" {qualifier} ".center(25, "="))
-        asic.search_asic(id)
-    print("".center(25, "="))
-    print(f"Destination {args.destination}")
-    asic.search_asic(destination_id)
-    print("".center(25, "="))
+    ids = resolve_ids(domains, WhoisPool(max_workers=args.jobs, per_server=args.per_server))
+    groups = group_ids(ids)
+    entities = resolve_entities(list(groups) + [destination_id], args.jobs)
+    display_report(groups, entities, destination_id)
+    if args.output:
+        export_report(args.output, groups, entities, destination_id)
     pass
 
 if __name__ == "__main__":
-    
-    main()
\ No newline at end of file
+    daemon.dispatch("cor", main, ("-m", "--multiple", "-o", "--output", "--no-cache", "--rate-limit"))
@@ -0,0 +1,309 @@
+import argparse
+import contextvars
+import importlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import cache
+import common
+import metrics
+import ratelimit
+
+COMMANDS = ("di", "spf", "cor", "asic")
+# Imported when the daemon starts, so the first request doesn't pay for them.
+WARM_MODULES = ("di", "spf", "cor", "asic", "dns.resolver", "requests", "bs4", "whois")
+# Frames sent back to the client: kind (o = stdout, e = stderr, x = exit code) and payload length.
+FRAME = struct.Struct("!cI")
+START_TIMEOUT = 10.0
+
+session = contextvars.ContextVar("session", default=None)
+
+
+def socket_path():
+    return os.environ.get("POLARIC_SOCKET") or os.path.join(cache.cache_dir(), "daemon.sock")
+
+
+class FrameWriter:
+    """A text stream that sends line-buffered frames of one kind over a client connection."""
+    def __init__(self, connection, kind, tty):
+        self.connection = connection
+        self.kind = kind
+        self.tty = tty
+        self.buffer = []
+
+    def write(self, text):
+        self.buffer.append(text)
+        if "\n" in text:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.connection.send(self.kind, "".join(self.buffer).encode())
+            self.buffer = []
+
+    def isatty(self):
+        return self.tty
+
+
+class Connection:
+    def __init__(self, sock, tty):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.stdout = FrameWriter(self, b"o", tty)
+        self.stderr = FrameWriter(self, b"e", tty)
+
+    def send(self, kind, payload):
+        with self.lock:
+            self.sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+    def exit(self, code):
+        self.stdout.flush()
+        self.stderr.flush()
+        self.send(b"x", str(code).encode())
+
+
+class ContextStream:
+    """Replaces sys.stdout/sys.stderr in the daemon, writing to the stream of the request being served.
+
+    Threads the request hands work to (through ratelimit.bind) write to the same client.
+    """
+    def __init__(self, default, name):
+        self.default = default
+        self.name = name
+
+    def target(self):
+        connection = session.get()
+        return getattr(connection, self.name) if connection is not None else self.default
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def isatty(self):
+        return self.target().isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline() or "{}")
+        command = request.get("command")
+        if command == "status":
+            self.wfile.write(json.dumps(self.server.status()).encode() + b"\n")
+        elif command == "shutdown":
+            self.wfile.write(b"{}\n")
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif command in COMMANDS:
+            self.server.run(command, request.get("argv", []), Connection(self.connection, request.get("tty", False)))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves entry point runs over a Unix socket from one warm process.
+
+    The DNS answer cache, SPF subtree memo, ABR session, result store connection
+    and rate limiter buckets all live for the life of the daemon. Each request
+    runs in its own thread with its own output streams, metrics and rate limit job.
+    """
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            if ping(path):
+                raise RuntimeError(f"A daemon is already listening on {path}")
+            os.unlink(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        super().__init__(path, Handler)
+        os.chmod(path, 0o600)
+        self.path = path
+        self.started = time.time()
+        self.served = 0
+        self.served_lock = threading.Lock()
+
+    def run(self, command, argv, connection):
+        with self.served_lock:
+            self.served += 1
+            number = self.served
+        session.set(connection)
+        metrics.use(metrics.Metrics())
+        code = 0
+        with ratelimit.job(f"client-{number}"):
+            try:
+                importlib.import_module(command).main(argv)
+            except SystemExit as e:
+                if isinstance(e.code, str):
+                    connection.stderr.write(f"{e.code}\n")
+                    code = 1
+                else:
+                    code = e.code or 0
+            except Exception:
+                connection.stderr.write(traceback.format_exc())
+                code = 1
+        try:
+            connection.exit(code)
+        except OSError:
+            pass
+
+    def status(self):
+        import di
+        return {
+            "pid": os.getpid(),
+            "path": self.path,
+            "uptime": time.time() - self.started,
+            "served": self.served,
+            "dns_cache": di.DNSResolver.shared_cache.stats(),
+            "store": {"hits": cache.default_store().hits, "misses": cache.default_store().misses},
+        }
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def connect(path=None):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path or socket_path())
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def request(message, path=None):
+    client = connect(path)
+    if client is None:
+        return None
+    with client, client.makefile("rb") as reader:
+        client.sendall(json.dumps(message).encode() + b"\n")
+        return json.loads(reader.readline() or "null")
+
+
+def ping(path=None):
+    return request({"command": "status"}, path) is not None
+
+
+def read_exactly(reader, size):
+    data = reader.read(size)
+    if len(data) < size:
+        raise ConnectionError("daemon closed the connection")
+    return data
+
+
+def forward(command, argv):
+    """Runs command in the daemon, streaming its output here. Returns the exit code, or None when no daemon is listening."""
+    client = connect()
+    if client is None:
+        return None
+    with client, client.makefile("rb") as reader:
+        client.sendall(json.dumps({"command": command, "argv": argv, "tty": sys.stdout.isatty()}).encode() + b"\n")
+        while True:
+            kind, size = FRAME.unpack(read_exactly(reader, FRAME.size))
+            payload = read_exactly(reader, size)
+            if kind == b"x":
+                return int(payload)
+            stream = sys.stdout if kind == b"o" else sys.stderr
+            stream.write(payload.decode())
+            stream.flush()
+
+
+def dispatch(command, main, local=()):
+    """Entry point for the command line tools: forwards to a running daemon, otherwise runs main here.
+
+    Flags in local need this process (its terminal, working directory or
+    process-wide settings), so commands using them always run in-process.
+    """
+    argv = sys.argv[1:]
+    if os.environ.get("POLARIC_NO_DAEMON") != "1" and not any(arg.split("=", 1)[0] in local for arg in argv):
+        try:
+            code = forward(command, argv)
+        except ConnectionError as e:
+            common.print_error(f"Daemon: {e}")
+            sys.exit(1)
+        if code is not None:
+            sys.exit(code)
+    main()
+
+
+def serve(path):
+    for module in WARM_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+    sys.stdout = ContextStream(sys.stdout, "stdout")
+    sys.stderr = ContextStream(sys.stderr, "stderr")
+    with Server(path) as server:
+        common.print_color(f"Listening on {path} (pid {os.getpid()})", "GREEN")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def start(path):
+    if ping(path):
+        common.print_color(f"Already running on {path}", "YELLOW")
+        return
+    log_path = os.path.join(cache.cache_dir(), "daemon.log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, "a") as log:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve"],
+                         env=dict(os.environ, POLARIC_SOCKET=path), stdin=subprocess.DEVNULL,
+                         stdout=log, stderr=log, start_new_session=True)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if ping(path):
+            common.print_color(f"Started on {path}", "GREEN")
+            return
+        time.sleep(0.05)
+    common.print_error(f"Daemon did not start, see {log_path}")
+    sys.exit(1)
+
+
+def display_status(status):
+    if status is None:
+        common.print_color("Not running.", "YELLOW")
+        return
+    dns_cache = status["dns_cache"]
+    common.print_color(f"Running on {status['path']} (pid {status['pid']}), up {status['uptime'] / 60:.1f} minutes", "GREEN")
+    common.print_color(f"Served {status['served']} commands", "WHITE")
+    common.print_color(f"DNS cache: {dns_cache['entries']} entries, {dns_cache['hits']} hits, {dns_cache['misses']} misses", "WHITE")
+    common.print_color(f"Result store: {status['store']['hits']} hits, {status['store']['misses']} misses", "WHITE")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Daemon",
+        description="Keep resolvers, sessions and caches warm for di, spf, cor and asic")
+    parser.add_argument("command", choices=["start", "stop", "status", "serve"], help="serve runs in the foreground")
+    args = parser.parse_args()
+
+    path = socket_path()
+    if args.command == "serve":
+        serve(path)
+    elif args.command == "start":
+        start(path)
+    elif args.command == "stop":
+        if request({"command": "shutdown"}, path) is None:
+            common.print_color("Not running.", "YELLOW")
+        else:
+            common.print_color("Stopped.", "GREEN")
+    elif args.command == "status":
+        display_status(request({"command": "status"}, path))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,32 @@
-import socket
-import dns.resolver
 import argparse
-import whois
 import re
 import os
 import tempfile
 import subprocess
-import requests
 import time
 import enum
-import bs4
+import concurrent.futures
+import contextvars
+import collections
+import threading
+import ipaddress
+import common
+import cache
+import abr
+import ratelimit
+import metrics
+import daemon
+import spf
+import whm
+import json
+import sys
+import random
+import hashlib
+import itertools
+import queue
+
+# Heavy backends load on first use, so --help and argument errors stay fast.
+dns = common.LazyModule("dns")
 
 class Colors(enum.Enum):
     RED = "\033[0;31m"
@@ -98,7 +115,13 @@ class Config:
         (RecordType.TXT, r"spf\.email-hosting\.net\.au"): "axigen._domainkey",
         (RecordType.TXT, r"spf\.hostingplatform\.net\.au"): "default._domainkey"
     }
+    # Nameservers of ours that may allow zone transfers, so di tries AXFR/IXFR against them first.
+    TRANSFER_NAMESERVERS = [
+        r"^ns\d+\.nameserver\.net\.au\.?$",
+        r"\.hostingplatform\.net\.au\.?$",
+    ]
     RECORD_SEPARATOR = " -> "
+    WHOIS_FIELDS = ("registrar", "updated_date", "status", "name_servers", "registrant_id")
     
     RECORD_HIGHLIGHTS = {
         r"^.*v=spf1.*$" : lambda record: Config.COLORS.RECORD_HIGHLIGHT_COLOR,
@@ -109,23 +132,24 @@ class Config:
 
 class StringBuilder:
     def __init__(self, default_color=Colors.RESET, default_base_color=Colors.RESET, default_style=Styles.NORMAL):
-        self._string = ""
+        self._parts = []
         self.default_color = default_color
         self.default_base_color = default_base_color
         self.default_style = default_style
 
     def append(self, text):
-        self._string += text
+        self._parts.append(text)
         return self
 
     def write(self, string, color=None, style=None, end="\n"):
         color = color or self.default_color
         style = style or self.default_style
-        formatted_string = f"{color.value}{style.value}{string}{Styles.RESET.value}{end}"
-        self._string += formatted_string
+        self._parts.append(f"{Logger.paint(string, color, style)}{end}")
         return self
 
     def highlight(self, string, regex_pattern, highlight_color=None, base_color=None, style=None):
+        if not Logger.colored():
+            return string
         highlight_color = highlight_color or self.default_color
         base_color = base_color or self.default_base_color
         style = style or self.default_style
@@ -137,14 +161,14 @@ class StringBuilder:
         return highlighted_string
 
     def get_string(self):
-        return self._string
+        return "".join(self._parts)
 
     def reset(self):
-        self._string = ""
+        self._parts = []
         return self
         
     def display(self):
-        print(self._string)
+        Logger.emit(f"{self.get_string()}\n")
         
 class Utils:
     @staticmethod
@@ -158,6 +182,8 @@ class StringUtils:
 
     @staticmethod
     def hyperlink(url, text):
+        if not Logger.colored():
+            return f"{text}: {url}"
         return f"\033]8;;{url}\033\\{text}\033]8;;\033\\"
 
 class WhoisDisplay:
@@ -190,33 +216,24 @@ class ACN:
         builder.write(f"ACN: {self.id}", Config.COLORS.ASIC_SECONDARY_COLOR, Config.STYLES.ASIC_STYLE, end="")
         return builder.get_string()
 
+    def to_dict(self):
+        return {"acn": self.id, "url": self.url}
+
 class ABN:
     def __init__(self, url, id):
-        abn_data = self.fetch_abn(url, id)
-        if abn_data:
-            self.id = id
-            self.url = f"{url}{id}"
-            self.name = abn_data.get("name")
-            self.type = abn_data.get("type")
-            self.status = abn_data.get("status")
+        abn_data = self.fetch_abn(url, id) or {}
+        self.id = id
+        self.url = f"{url}{id}"
+        self.name = abn_data.get("name")
+        self.type = abn_data.get("type")
+        self.status = abn_data.get("status")
+
+    def to_dict(self):
+        return {"abn": self.id, "url": self.url, "name": self.name, "type": self.type, "status": self.status}
 
     def fetch_abn(self, url, id):
-        abn_search_uri = f"{url}{id}"
-        html = requests.get(abn_search_uri).text
-        soup = bs4.BeautifulSoup(html, "html.parser").find("div", {'itemscope': True, 'itemtype': 'http://schema.org/LocalBusiness'})    
-        
-        abn_data = {}
-        try:
-            entity_type_row = soup.find("th", string="Entity type:")
-            if entity_type_row:
-                abn_data["type"] = entity_type_row.find_next("a").text.strip()
-            abn_data["name"] = soup.find("span", itemprop="legalName").text.strip()
-            abn_data["status"] = soup.find("td", string=lambda text: text and ('Active' in text or 'Cancelled' in text)).text.strip()
-            return abn_data
-        except AttributeError:
-            # TODO: Log errors
-            return None
-        
+        return abr.default_client().lookup(id)
+
     def __str__(self):
         builder = StringBuilder()
         builder.write(self.url, Config.COLORS.ASIC_SECONDARY_COLOR, Config.STYLES.ASIC_STYLE)
@@ -224,10 +241,10 @@ class ABN:
         builder.write(f"Name: {self.name}", Config.COLORS.ASIC_SECONDARY_COLOR, Config.STYLES.ASIC_STYLE)
         builder.write(f"Type: {self.type}", Config.COLORS.ASIC_SECONDARY_COLOR, Config.STYLES.ASIC_STYLE)
         
-        self.status = f"Status: {self.status}"
-        builder.append(builder.highlight(self.status, "Active", Colors.GREEN, Config.COLORS.ASIC_SECONDARY_COLOR, Config.STYLES.ASIC_STYLE) 
-                       if "Active" in self.status 
-                       else builder.highlight(self.status, "Cancelled", Colors.RED, Config.STYLES.ASIC_STYLE))
+        status = f"Status: {self.status}"
+        builder.append(builder.highlight(status, "Active", Colors.GREEN, Config.COLORS.ASIC_SECONDARY_COLOR, Config.STYLES.ASIC_STYLE) 
+                       if "Active" in status 
+                       else builder.highlight(status, "Cancelled", Colors.RED, Config.STYLES.ASIC_STYLE))
         
         return builder.get_string()
     
@@ -245,11 +262,56 @@ class Nano:
         return content
 
 
+class Writer:
+    """Collects rendered output and writes it to the stream in one call per flush.
+
+    Colour defaults to on only when the stream is a terminal.
+    """
+    def __init__(self, stream=None, color=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self.color = self.stream.isatty() if color is None else color
+        self._parts = []
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def flush(self):
+        if self._parts:
+            self.stream.write("".join(self._parts))
+            self._parts = []
+        self.stream.flush()
+
+
 class Logger:
+    # The Writer of the report being rendered; without one, output goes straight to stdout.
+    output = contextvars.ContextVar("output", default=None)
+
+    @staticmethod
+    def use(writer):
+        Logger.output.set(writer)
+
+    @staticmethod
+    def colored():
+        writer = Logger.output.get()
+        return writer.color if writer is not None else sys.stdout.isatty()
+
+    @staticmethod
+    def emit(text):
+        writer = Logger.output.get()
+        if writer is not None:
+            writer.write(text)
+        else:
+            sys.stdout.write(text)
+
+    @staticmethod
+    def paint(string, color: Colors = Colors.RESET, style: Styles = Styles.NORMAL):
+        if not Logger.colored():
+            return f"{string}"
+        return f"{color.value}{style.value}{string}{Styles.RESET.value}"
+
     @staticmethod
     def write(string, color: Colors = Colors.RESET, style: Styles = Styles.NORMAL, end="\n"):
-        formatted_string = f"{color.value}{style.value}{string}{Styles.RESET.value}"
-        print(formatted_string, end=end)
+        Logger.emit(f"{Logger.paint(string, color, style)}{end}")
         
     @staticmethod
     def write_header(string, color: Colors = Colors.RESET, style: Styles = Styles.NORMAL, center_char=".", center_length=50):
@@ -257,13 +319,17 @@ class Logger:
         offset = center_length - len(message)
         left_padding = offset // 2
         right_padding = offset - left_padding
+        label = f"\x1b[7m {message} \x1b[0m" if Logger.colored() else f" {message} "
         Logger.write(center_char * left_padding, color, style, end="")
-        Logger.write(f"\x1b[7m {message} \x1b[0m", color, style, end="")
+        Logger.write(label, color, style, end="")
         Logger.write(center_char * right_padding, color, style, end="\n")
 
     
     @staticmethod
     def highlight(string, regex_pattern, color: Colors = Colors.RESET, base_color: Colors=Colors.RESET, style: Styles = Styles.NORMAL):
+        if not Logger.colored():
+            return f"{string}"
+
         def apply_highlighting(match):
             return f"{color.value}{style.value}{match.group(0)}{Styles.RESET.value}{base_color.value}"
         
@@ -277,10 +343,14 @@ class Record:
         self.host = host
         self.type = type
         self.value = value
+        self.ttl = None
 
     def __str__(self):
         return f"{self.host} {self.value}"
 
+    def to_dict(self):
+        return {"host": self.host, "type": self.type.name, "value": self.value}
+
 
 class MXRecord(Record):
     def __init__(self, host, value, priority):
@@ -290,6 +360,9 @@ class MXRecord(Record):
     def __str__(self):
         return f"{self.host} {self.priority} {self.value}"
 
+    def to_dict(self):
+        return dict(super().to_dict(), priority=self.priority)
+
 
 class SOARecord(Record):
     def __init__(self, host, value, mname, rname, serial, refresh, retry, expire, minimum):
@@ -305,6 +378,10 @@ class SOARecord(Record):
     def __str__(self):
         return f"{self.host} {self.mname} {self.rname} {self.serial} {self.refresh} {self.retry} {self.expire} {self.minimum}"
 
+    def to_dict(self):
+        return dict(super().to_dict(), mname=self.mname, rname=self.rname, serial=self.serial, refresh=self.refresh,
+                    retry=self.retry, expire=self.expire, minimum=self.minimum)
+
 class Domain:
     @staticmethod
     def is_fqdn(domain):
@@ -321,116 +398,26 @@ class Domain:
             return ""
         return domain.replace(f".{base_domain}", "")
         
-class SPFResolver:
+class SPFResolver(spf.SPFResolver):
+    """SPF walker that answers TXT queries through DNSResolver and its answer cache."""
     def __init__(self, dns_resolver):
-        self.errors = []
-        self.lookup_count = 0
+        super().__init__()
         self.dns_resolver = dns_resolver
-        self.limit = 10
-
-    def resolve_domain(self, domain):
-        try:
-            answers = self.dns_resolver.resolve(domain, RecordType.TXT)
-            for txt_record in answers:
-                txt_data = txt_record.value
-                if txt_data.startswith('"') and txt_data.endswith('"'):
-                    txt_data = txt_data[1:-1]
-                if "v=spf1" in txt_data: 
-                    spf_record = txt_data
-                    if domain in spf_record:
-                        self.errors.append(f"Recursive SPF record detected! Contains the domain: {domain}")
-                    return self.parse_spf(spf_record)
-        except dns.resolver.NoAnswer:
-            pass
-        except dns.resolver.NXDOMAIN:
-            pass
-        except dns.resolver.NoNameservers:
-            return
-
-    def resolve_spf(self, spf):
-        try:
-            # DNS Resolver includes quotation marks in the TXT record, so we need to remove them
-            if spf.startswith('"') and spf.endswith('"'):
-                    spf = spf[1:-1]
-            return self.parse_spf(spf)
-        except Exception as e:
-            print(e)
-            
-    def parse_spf(self, spf_record):
-        if spf_record.startswith('"') or spf_record.endswith('"'):
-            self.errors.append(f"SPF record has unnecessary quotation marks: {spf_record}")
-        
-        if "\\" in spf_record:
-            self.errors.append(f"SPF record contains backslashes: {spf_record}")
-        
-        if spf_record.count("~all") > 1:
-            self.errors.append(f"Redundant '~all' mechanism detected in SPF record: {spf_record}")
-        
-        if not spf_record.startswith('v=spf1'):
-            self.errors.append(f"Missing 'v=spf1' at the start of the SPF record: {spf_record}")
-
-        if re.search(r'\binclude:[^\w.-]', spf_record):
-            self.errors.append(f"Malformed 'include' mechanism in SPF record: {spf_record}")
-
-        if re.search(r'\bredirect=[^\s]+', spf_record):
-            self.errors.append(f"SPF record contains a 'redirect' modifier, which should be used alone: {spf_record}")
 
-        if len(re.findall(r'\ba\b', spf_record)) > 1:
-            self.errors.append(f"Duplicate 'a' mechanism detected in SPF record: {spf_record}")
-        
-        if len(re.findall(r'\bmx\b', spf_record)) > 1:
-            self.errors.append(f"Duplicate 'mx' mechanism detected in SPF record: {spf_record}")
-        
-        includes = re.findall(r'include:([\w.-]+)', spf_record)
-        seen_includes = set()
-        for include in includes:
-            if include in seen_includes:
-                self.errors.append(f"Duplicate 'include' mechanism for domain {include} detected: {spf_record}")
-            seen_includes.add(include)
-
-        if len(spf_record) > 255:
-            self.errors.append(f"SPF record exceeds 255 characters: {spf_record}")
-
-        if re.search(r'\b\d{1,3}(\.\d{1,3}){3}\b', spf_record) and not re.search(r'\bip[46]:', spf_record):
-            self.errors.append(f"IP address used without 'ip4' or 'ip6' prefix in SPF record: {spf_record}")
-        
-        if not spf_record.strip():
-            self.errors.append("SPF record is empty.")
-        
-        if re.search(r'\bredirect\b', spf_record) and re.search(r'\b(include|a|mx|ip4|ip6)\b', spf_record):
-            self.errors.append(f"SPF record contains both 'redirect' and other mechanisms: {spf_record}")
+    def memo_key(self):
+        return self.dns_resolver.identity()
 
-        if self.lookup_count > self.limit:
-            self.errors.append(f"Too many lookups: {spf_record} {self.lookup_count}/{self.limit}")
-            return
+    def query_txt(self, domain):
+        return [txt_record.value for txt_record in self.dns_resolver.resolve(domain, RecordType.TXT)]
 
-        if bool(re.search(r'\ba\b', spf_record)):
-            self.lookup_count += 1
-        if bool(re.search(r'\bmx\b', spf_record)):
-            self.lookup_count += 1
+    def query_addresses(self, domain):
+        return [record.value for type in (RecordType.A, RecordType.AAAA) for record in self.dns_resolver.resolve(domain, type)]
 
-        include_results = {}
-        includes = re.findall(r'include:([\w.-]+)', spf_record)
-        for include_domain in includes:
-            if include_domain not in include_results:
-                self.lookup_count += 1
-                include_results[include_domain] = self.resolve_domain(include_domain)
+    def query_mx(self, domain):
+        return [record.value for record in self.dns_resolver.resolve(domain, RecordType.MX)]
 
-        redirects = re.findall(r'redirect=([\w.-]+)', spf_record)
-        if redirects:
-            self.lookup_count += 1
-            self.resolve_domain(redirects[0])
-
-        if self.lookup_count > self.limit:
-            self.errors.append(f"Too many lookups: {self.lookup_count}/{self.limit} for SPF record: {spf_record}")
-        
-        result = {
-            "count": self.lookup_count,
-            "spf": spf_record,
-            "include": include_results,
-            "errors": self.errors
-        }
-        return result
+    def report_missing(self, domain):
+        pass
 
 class SPFDisplay:
     def __init__(self, spf_lookup):
@@ -484,233 +471,891 @@ class SPFDisplay:
             for error in errors:
                 Logger.write(f"- {error}", Colors.HI_RED)
 
-class DNSResolver:
-    def __init__(self, nameserver=None):
-        self.resolver = dns.resolver.Resolver()
+class DNSCache:
+    """LRU cache of DNS answers keyed by (name, RecordType).
+
+    Answers expire with their TTL. NXDOMAIN and NoAnswer are cached negatively for
+    min(SOA TTL, SOA MINIMUM) from the authority section, as per RFC 2308.
+    """
+    def __init__(self, max_entries=4096, default_negative_ttl=300):
+        self.max_entries = max_entries
+        self.default_negative_ttl = default_negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
 
-    def resolve(self, domain, type):
-        try:
-            answers = self.resolver.resolve(domain, type.name)
-            if type == RecordType.MX:
-                return [MXRecord(domain, answer.exchange.to_text(), answer.preference) for answer in answers]
-            elif type == RecordType.SOA:
-                answer = answers[0]
-                return [SOARecord(domain, answer.to_text(), answer.mname.to_text(), answer.rname.to_text(), answer.serial, answer.refresh, answer.retry, answer.expire, answer.minimum)]
-            else:
-                return [Record(domain, answer.to_text(), type) for answer in answers]
-        except dns.resolver.NoAnswer:
-            return []
-        except dns.resolver.NXDOMAIN:
-            return []
-        except dns.resolver.NoNameservers:
-            return []
-        
-    def exists(self, domain):
+    @staticmethod
+    def key(domain, type):
+        return (domain.lower().rstrip("."), type)
+
+    def entry(self, domain, type):
+        """Returns (records, exists) for a cached answer, or None on a miss."""
+        key = self.key(domain, type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, records, exists = entry
+                if expires > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(records), exists
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def get(self, domain, type):
+        entry = self.entry(domain, type)
+        return entry[0] if entry is not None else None
+
+    def put(self, domain, type, records, ttl, exists=True):
+        key = self.key(domain, type)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, list(records), exists)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def negative_ttl(self, error):
+        if isinstance(error, dns.resolver.NXDOMAIN):
+            responses = list(error.responses().values())
+        else:
+            responses = [error.kwargs.get("response")]
+        for response in responses:
+            if response is None:
+                continue
+            for rrset in response.authority:
+                if rrset.rdtype == dns.rdatatype.SOA:
+                    return min(rrset.ttl, rrset[0].minimum)
+        return self.default_negative_ttl
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class Hedging:
+    """Load cap and counters for hedged DNS queries, shared by a resolver's pools.
+
+    At most ratio extra queries are sent per query answered. The unhedged reservoir
+    holds what each query would have taken without its hedge: for a hedge that won,
+    the time the first server eventually took to answer or fail.
+    """
+    def __init__(self, ratio=0.05, percentile=95, factor=2.0, minimum=0.005, default=0.5, min_samples=8):
+        self.ratio = ratio
+        self.percentile = percentile
+        self.factor = factor
+        self.minimum = minimum
+        self.default = default
+        self.min_samples = min_samples
+        self.queries = 0
+        self.hedged = 0
+        self.won = 0
+        self.latencies = LatencyReservoir()
+        self.unhedged = LatencyReservoir()
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.ratio <= 0 or self.hedged >= self.ratio * self.queries + 1:
+                return False
+            self.hedged += 1
+        metrics.count("dns.hedged")
+        return True
+
+    def threshold(self, samples, lifetime):
+        """factor times the server's running percentile RTT, or the default until enough answers were seen.
+
+        Hedging at the bare p90 fires on ordinary jitter, which adds load and wins nothing.
+        """
+        if len(samples) < self.min_samples:
+            return min(self.default, lifetime / 2)
+        samples = sorted(samples)
+        return min(max(samples[int(len(samples) * self.percentile / 100)] * self.factor, self.minimum), lifetime / 2)
+
+    def record(self, seconds, unhedged=None, won=False):
+        with self._lock:
+            self.queries += 1
+            self.won += won
+            self.latencies.add(seconds)
+            if unhedged is not None:
+                self.unhedged.add(unhedged)
+        if won:
+            metrics.count("dns.hedge_wins")
+
+    def track(self, primary, start):
+        """Adds the beaten query's own latency to the unhedged reservoir once it answers or fails."""
+        def done(_):
+            with self._lock:
+                self.pending.pop(primary, None)
+                self.unhedged.add(time.perf_counter() - start)
+        with self._lock:
+            self.pending[primary] = start
+        primary.add_done_callback(done)
+
+    def stats(self):
+        with self._lock:
+            # Queries still outstanding count with what they have taken so far.
+            unhedged = LatencyReservoir()
+            for sample in self.unhedged.samples + [time.perf_counter() - start for start in self.pending.values()]:
+                unhedged.add(sample)
+            return {"queries": self.queries, "hedged": self.hedged, "won": self.won,
+                    "p99": self.latencies.percentile(99), "p99_unhedged": unhedged.percentile(99)}
+
+
+class NameserverPool:
+    """A set of nameservers, each queried on its own, tried fastest first by an EWMA of observed RTT.
+
+    A server that times out or fails (SERVFAIL, REFUSED) is charged the full timeout and the
+    query moves on to the next one. Servers that aren't being picked drift back down so a slow
+    one is retried now and then instead of being written off for the life of the process.
+
+    When an answer is later than twice the server's p95 RTT, the query is hedged: sent again to the
+    next server (or the same one when it is alone) and the first answer wins. A dnspython query
+    can't be interrupted, so the loser is left to finish in the background, still feeding its RTT.
+    """
+    executor = None
+    executor_lock = threading.Lock()
+
+    def __init__(self, servers, timeout=2.0, alpha=0.3, decay=0.98, hedging=None):
+        # servers: [(address, port)]
+        self.timeout = timeout
+        self.alpha = alpha
+        self.decay = decay
+        self.hedging = hedging or Hedging()
+        self.resolvers = {}
+        self.servers = {}
+        for address, port in servers:
+            name = address if port == 53 else f"{address}:{port}"
+            resolver = dns.resolver.Resolver(configure=False)
+            resolver.nameservers = [address]
+            resolver.port = port
+            resolver.timeout = resolver.lifetime = timeout
+            self.resolvers[name] = resolver
+            self.servers[name] = {"address": address, "queries": 0, "failures": 0, "ewma": None, "max": 0.0,
+                                  "samples": collections.deque(maxlen=100)}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls):
+        with cls.executor_lock:
+            if cls.executor is None:
+                cls.executor = concurrent.futures.ThreadPoolExecutor(max_workers=256)
+            return cls.executor
+
+    def ranked(self):
+        # Servers not yet heard from go first, so each one gets measured.
+        with self._lock:
+            return sorted(self.servers, key=lambda name: self.servers[name]["ewma"] or 0.0)
+
+    def observe(self, name, seconds, failed=False):
+        with self._lock:
+            server = self.servers[name]
+            server["queries"] += 1
+            server["failures"] += failed
+            server["max"] = max(server["max"], seconds)
+            server["ewma"] = seconds if server["ewma"] is None else self.alpha * seconds + (1 - self.alpha) * server["ewma"]
+            if not failed:
+                server["samples"].append(seconds)
+            for other, stats in self.servers.items():
+                if other != name and stats["ewma"] is not None:
+                    stats["ewma"] *= self.decay
+
+    def late(self, name, seconds):
+        with self._lock:
+            server = self.servers[name]
+            server["ewma"] = max(server["ewma"] or 0.0, seconds)
+
+    def threshold(self, name, lifetime):
+        with self._lock:
+            samples = list(self.servers[name]["samples"])
+        return self.hedging.threshold(samples, lifetime)
+
+    def send(self, name, domain, rdtype, lifetime):
+        """One query to one server; NXDOMAIN and NoAnswer are answers too."""
+        ratelimit.acquire(f"dns:{self.servers[name]['address']}")
+        start = time.perf_counter()
         try:
-            self.resolve(domain, RecordType.A)
-            return True
-        except dns.resolver.NoAnswer:
-            return False
-        except dns.resolver.NXDOMAIN:
+            answers = self.resolvers[name].resolve(domain, rdtype, lifetime=lifetime)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.YXDOMAIN):
+            self.observe(name, time.perf_counter() - start)
+            raise
+        except (dns.resolver.NoNameservers, dns.exception.Timeout):
+            self.observe(name, max(time.perf_counter() - start, lifetime), failed=True)
+            raise
+        self.observe(name, time.perf_counter() - start)
+        return answers
+
+    def query(self, domain, rdtype, lifetime=None):
+        """Resolves with the fastest server that answers, hedging once if it is slow and failing over on errors."""
+        lifetime = lifetime or self.timeout
+        if self.hedging.ratio <= 0:
+            return self.query_serial(domain, rdtype, lifetime)
+        executor = self.get_executor()
+        ranked = self.ranked()
+        start = time.perf_counter()
+        futures = {}
+
+        def launch(name):
+            future = executor.submit(ratelimit.bind(self.send), name, domain, rdtype, lifetime)
+            futures[future] = name
+            return future
+
+        first = current = ranked[0]
+        primary = launch(ranked.pop(0))
+        wait = self.threshold(first, lifetime)
+        hedge = None
+        error = None
+        while futures:
+            done, _ = concurrent.futures.wait(futures, timeout=wait, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                # Past the threshold: rank the server down now rather than when it finally
+                # answers, and hedge once per query within the load cap.
+                self.late(current, wait)
+                wait = None
+                if self.hedging.allow():
+                    hedge = launch(ranked.pop(0) if ranked else first)
+                continue
+            for future in done:
+                del futures[future]
+                try:
+                    answers = future.result()
+                except (dns.resolver.NoNameservers, dns.exception.Timeout) as e:
+                    error = e
+                    continue
+                except dns.exception.DNSException:
+                    self.finish(start, primary, future is hedge)
+                    raise
+                self.finish(start, primary, future is hedge)
+                return answers
+            if not futures and ranked:
+                current = ranked.pop(0)
+                launch(current)
+                wait = None if hedge else self.threshold(current, lifetime)
+        self.finish(start, primary, False)
+        raise error or dns.resolver.NoNameservers()
+
+    def query_serial(self, domain, rdtype, lifetime):
+        """Tries each server in turn on the calling thread, for when hedging is off."""
+        start = time.perf_counter()
+        error = None
+        for name in self.ranked():
+            try:
+                answers = self.send(name, domain, rdtype, lifetime)
+            except (dns.resolver.NoNameservers, dns.exception.Timeout) as e:
+                error = e
+                continue
+            except dns.exception.DNSException:
+                self.finish(start, None, False)
+                raise
+            self.finish(start, None, False)
+            return answers
+        self.finish(start, None, False)
+        raise error or dns.resolver.NoNameservers()
+
+    def finish(self, start, primary, won):
+        elapsed = time.perf_counter() - start
+        if not won:
+            self.hedging.record(elapsed, elapsed)
+            return
+        self.hedging.record(elapsed, won=True)
+        self.hedging.track(primary, start)
+
+    def stats(self):
+        with self._lock:
+            return {name: {"queries": server["queries"], "failures": server["failures"],
+                           "ewma": server["ewma"] or 0.0, "max": server["max"]}
+                    for name, server in self.servers.items()}
+
+
+class DNSResolver:
+    """Resolves through the system nameservers, an explicit list, or a zone's own authoritative servers.
+
+    nameserver is a comma separated list of addresses or hostnames, each optionally with a
+    port ("127.0.0.1:5353", "[::1]:5353"). Explicit servers get their own answer cache, since
+    their answers may differ from the system resolver's.
+    """
+    # Shared by every resolver in the process so SPF, display and sweep lookups reuse answers.
+    shared_cache = DNSCache()
+
+    def __init__(self, nameserver=None, cache=None, timeout=2.0, hedge_ratio=0.05):
+        self.timeout = timeout
+        self.hedging = Hedging(hedge_ratio)
+        if nameserver:
+            servers = [self.parse_server(server.strip()) for server in nameserver.split(",") if server.strip()]
+            self.cache = cache or DNSCache()
+        else:
+            system = dns.resolver.Resolver()
+            servers = [(address, system.port) for address in system.nameservers]
+            self.cache = cache or DNSResolver.shared_cache
+        self.pool = NameserverPool(servers, timeout, hedging=self.hedging)
+        self.authoritative = None
+        self.zone = None
+        self.reverse_timeout = 2.0
+        self.reverse_failure_ttl = 60
+
+    @staticmethod
+    def parse_server(server):
+        """(address, port) for "host", "host:port" or "[v6]:port", looking hostnames up with the system resolver."""
+        port = 53
+        if server.startswith("["):
+            server, _, rest = server[1:].partition("]")
+            port = int(rest.lstrip(":") or 53)
+        elif server.count(":") == 1:
+            server, port = server.split(":")
+            port = int(port)
+        if not DNSResolver.is_valid_ip(server):
+            server = dns.resolver.Resolver().resolve(server, "A")[0].to_text()
+        return server, port
+
+    def use_authoritative(self, base_domain):
+        """Queries names in base_domain's zone straight at the zone's nameservers. Returns False when none are found."""
+        zone = base_domain.lower().rstrip(".")
+        while zone:
+            try:
+                hostnames = [answer.target.to_text() for answer in self.pool.query(zone, "NS")]
+                break
+            except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN, dns.resolver.NoNameservers, dns.exception.Timeout):
+                zone = zone.partition(".")[2]
+        if not zone:
             return False
-        except dns.resolver.NoNameservers:
+        addresses = []
+        for hostname in hostnames:
+            try:
+                addresses.extend(answer.to_text() for answer in self.pool.query(hostname, "A"))
+            except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN, dns.resolver.NoNameservers, dns.exception.Timeout):
+                continue
+        if not addresses:
             return False
-        
+        if self.cache is DNSResolver.shared_cache:
+            self.cache = DNSCache()
+        self.zone = zone
+        self.authoritative = NameserverPool([(address, 53) for address in dict.fromkeys(addresses)], self.timeout, hedging=self.hedging)
+        return True
+
+    def pool_for(self, name):
+        name = name.lower().rstrip(".")
+        if self.authoritative is not None and (name == self.zone or name.endswith(f".{self.zone}")):
+            return self.authoritative
+        return self.pool
+
+    def query(self, name, rdtype, lifetime=None):
+        pool = self.pool_for(name)
+        try:
+            return pool.query(name, rdtype, lifetime)
+        except dns.resolver.NoAnswer as e:
+            # A CNAME out of the zone, or a delegated child zone: only a recursive server can finish it.
+            response = e.kwargs.get("response")
+            if pool is self.pool or response is None or (response.flags & dns.flags.AA and not response.answer):
+                raise
+            return self.pool.query(name, rdtype, lifetime)
+
+    def lookup(self, domain, type):
+        """Returns (records, exists), where exists is False when the name is NXDOMAIN or no nameserver answers for it."""
+        entry = self.cache.entry(domain, type)
+        if entry is not None:
+            metrics.count("dns.cache_hits")
+            return entry
+        try:
+            metrics.count("dns.queries")
+            with metrics.timer(f"dns.{type.name}"):
+                answers = self.query(domain, type.name)
+            records = self.to_records(domain, type, answers, answers.rrset.ttl)
+            self.cache.put(domain, type, records, max(answers.expiration - time.time(), 0))
+            return records, True
+        except dns.resolver.NoAnswer as e:
+            self.cache.put(domain, type, [], self.cache.negative_ttl(e))
+            return [], True
+        except dns.resolver.NXDOMAIN as e:
+            self.cache.put(domain, type, [], self.cache.negative_ttl(e), exists=False)
+            return [], False
+        except (dns.resolver.NoNameservers, dns.exception.Timeout):
+            return [], False
+
+    def identity(self):
+        """The servers this resolver asks, for caches shared between resolvers."""
+        authoritative = tuple(self.authoritative.servers) if self.authoritative is not None else ()
+        return (tuple(self.pool.servers), self.zone, authoritative)
+
+    def stats(self):
+        """Per-server query counts and latency, keyed by pool ("recursive", "authoritative")."""
+        pools = {"recursive": self.pool.stats()}
+        if self.authoritative is not None:
+            pools["authoritative"] = self.authoritative.stats()
+        return pools
+
+    def resolve(self, domain, type):
+        return self.lookup(domain, type)[0]
+
+    @staticmethod
+    def to_records(domain, type, answers, ttl=None):
+        # answers: an Answer or an Rdataset, anything iterating over rdata
+        if type == RecordType.MX:
+            records = [MXRecord(domain, answer.exchange.to_text(), answer.preference) for answer in answers]
+        elif type == RecordType.SOA:
+            answer = answers[0]
+            records = [SOARecord(domain, answer.to_text(), answer.mname.to_text(), answer.rname.to_text(), answer.serial, answer.refresh, answer.retry, answer.expire, answer.minimum)]
+        elif type == RecordType.TXT:
+            records = [Record(domain, spf.txt_value(answer), type) for answer in answers]
+        else:
+            records = [Record(domain, answer.to_text(), type) for answer in answers]
+        for record in records:
+            record.ttl = ttl
+        return records
+
+    def resolve_many(self, queries, max_workers=1):
+        # queries: [(domain, RecordType)] -> results in the same order
+        if max_workers <= 1:
+            return [self.resolve(domain, type) for domain, type in queries]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(ratelimit.bind(lambda query: self.resolve(*query)), queries))
+
+    def exists(self, domain):
+        return self.lookup(domain, RecordType.A)[1]
+
+    def reverse(self, ip):
+        """Returns the PTR hostname of an IPv4/IPv6 address, or None, through the answer cache."""
+        name = dns.reversename.from_address(ip).to_text()
+        hostnames = self.cache.get(name, "PTR")
+        if hostnames is not None:
+            metrics.count("dns.cache_hits")
+        else:
+            try:
+                metrics.count("dns.queries")
+                with metrics.timer("dns.PTR"):
+                    answers = self.query(name, "PTR", lifetime=self.reverse_timeout)
+                hostnames = [answer.target.to_text().rstrip(".") for answer in answers]
+                self.cache.put(name, "PTR", hostnames, max(answers.expiration - time.time(), 0))
+            except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN) as e:
+                hostnames = []
+                self.cache.put(name, "PTR", hostnames, self.cache.negative_ttl(e))
+            except (dns.resolver.NoNameservers, dns.exception.Timeout):
+                # Failures are cached briefly so one unreachable zone doesn't stall every record pointing at it.
+                hostnames = []
+                self.cache.put(name, "PTR", hostnames, self.reverse_failure_ttl)
+        return hostnames[0] if hostnames else None
+
+    def reverse_many(self, ips, max_workers=16):
+        """Reverse resolves every address concurrently, returning {ip: hostname or None}."""
+        ips = list(dict.fromkeys(ips))
+        if not ips:
+            return {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(ips))) as executor:
+            return dict(zip(ips, executor.map(ratelimit.bind(self.reverse), ips)))
 
-    
     @staticmethod
     def is_valid_ipv4(ipv4):
-        ipv4_pattern = r'^(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$'
-        if re.match(ipv4_pattern, ipv4):
-            return True
-        return False
+        try:
+            return ipaddress.ip_address(ipv4).version == 4
+        except ValueError:
+            return False
 
     @staticmethod
     def is_valid_ipv6(ipv6):
-        ipv6_pattern = r'^(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}$|^([0-9a-fA-F]{1,4}:){1,7}:$|^::([0-9a-fA-F]{1,4}:){1,7}[0-9a-fA-F]{1,4}$|^([0-9a-fA-F]{1,4}:){1,6}:([0-9a-fA-F]{1,4}:){1,7}[0-9a-fA-F]{1,4}$'
-        if re.match(ipv6_pattern, ipv6):
-            return True
-        return False
+        try:
+            return ipaddress.ip_address(ipv6).version == 6
+        except ValueError:
+            return False
     
     @staticmethod
     def is_valid_ip(ip):
-        if len(ip) <= 15:
-            if DNSResolver.is_valid_ipv4(ip):
-                return True
-        if DNSResolver.is_valid_ipv6(ip):
-            return True
-        return False
+        return DNSResolver.is_valid_ipv4(ip) or DNSResolver.is_valid_ipv6(ip)
 
-class WHMResolver:
-    def fetch_whm(self, domain):
-        try:
-            command = ["bash", "-i", "-c", f"whm {domain}"]
-            result = subprocess.run(
-                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-            return result.stdout.decode('utf-8')
-        except:
-            return None
-            pass
-
-    def extract_details(self, data):
-        match = re.search(r"ID (\d+) - username (\w+) - server ([\w\d.]+)", data)
-        if match:
-            return {
-                "ID": match.group(1),
-                "username": match.group(2),
-                "server": match.group(3)
-            }
-        return None
+class ZoneTransfer:
+    """Loads a whole zone over one TCP transfer from its authoritative servers, when they allow it.
 
-    def extract_title(self, data):
-        match = re.search(r"===== (.*?)[: ]", data)
-        if match:
-            return match.group(1)
+    With the text of a previously transferred zone, an IXFR asks only for the changes
+    since its serial (the server may answer with a full AXFR instead). Transferred
+    answers are also put in the DNS answer cache.
+    """
+    def __init__(self, dns_resolver, port=53, timeout=10.0):
+        self.dns_resolver = dns_resolver
+        self.port = port
+        self.timeout = timeout
+        self.kind = None
+
+    def nameservers(self, base_domain):
+        """Addresses of the domain's nameservers that match Config.TRANSFER_NAMESERVERS."""
+        addresses = []
+        for record in self.dns_resolver.resolve(base_domain, RecordType.NS):
+            if any(re.search(pattern, record.value) for pattern in Config.TRANSFER_NAMESERVERS):
+                addresses.extend(address.value for address in self.dns_resolver.resolve(record.value, RecordType.A))
+        return list(dict.fromkeys(addresses))
+
+    def serial(self, base_domain, addresses):
+        """The zone's SOA serial straight from the first authoritative server that answers, or None."""
+        for address in addresses:
+            try:
+                ratelimit.acquire(f"dns:{address}")
+                metrics.count("dns.queries")
+                response = dns.query.udp(dns.message.make_query(base_domain, "SOA"), address, timeout=self.timeout, port=self.port)
+                for rrset in response.answer:
+                    if rrset.rdtype == dns.rdatatype.SOA:
+                        return rrset[0].serial
+            except (dns.exception.DNSException, OSError):
+                continue
         return None
 
-    def parse_name_link(self, data):
-        parts = data.split(" - ", 1)
-        if len(parts) == 2:
-            return {"name": parts[0].strip(), "link": parts[1].strip()}
+    def transfer(self, base_domain, addresses, zone_text=None):
+        """Returns the zone from the first server that transfers it, or None when every server refuses."""
+        origin = dns.name.from_text(base_domain)
+        for address in addresses:
+            kind = "IXFR" if zone_text is not None else "AXFR"
+            try:
+                if zone_text is not None:
+                    zone = dns.zone.from_text(zone_text, origin, relativize=False)
+                    query, _ = dns.xfr.make_query(zone)
+                else:
+                    zone = dns.zone.Zone(origin, relativize=False)
+                    query, _ = dns.xfr.make_query(zone, serial=None)
+                ratelimit.acquire(f"dns:{address}")
+                metrics.count("dns.transfers")
+                with metrics.timer(f"dns.{kind}"):
+                    dns.query.inbound_xfr(address, zone, query, port=self.port, timeout=self.timeout, lifetime=self.timeout)
+                self.kind = kind
+                return zone
+            except (dns.exception.DNSException, OSError):
+                metrics.count("dns.transfers_refused")
         return None
 
-    def parse_output(self, output):
-        whm_object = {}
-        title = ""
-        for line in output.split('\n'):
-            if "=====" in line:
-                if "No service found for domain" in line:
+    def to_records(self, zone, base_domain):
+        """Converts a zone into fetch_records' {RecordType: {host: [records]}}, caching every answer on the way."""
+        records = {}
+        names = {}
+        for name, node in zone.nodes.items():
+            host = name.to_text().rstrip(".")
+            for rdataset in node.rdatasets:
+                if rdataset.rdtype.name not in RecordType.__members__:
                     continue
-                title = self.extract_title(line)
-                whm_object[title] = {"details": {}, "links": {}}
-            elif "Found service" in line and title:
-                details = self.extract_details(line)
-                whm_object[title]["details"] = details
-            elif "Link" in line and title:
-                link = self.parse_name_link(line)
-                whm_object[title]["links"][link["name"]] = link["link"]
-        return whm_object if title else None
-    
+                type = RecordType[rdataset.rdtype.name]
+                host_records = DNSResolver.to_records(host, type, rdataset, rdataset.ttl)
+                self.dns_resolver.cache.put(host, type, host_records, rdataset.ttl)
+                names.setdefault(host, {})[type] = host_records
+        for host in sorted(names, key=lambda host: (host != base_domain, host)):
+            key = base_domain if host == base_domain else Domain.extract_subdomain(host, base_domain)
+            for type in RecordType:
+                if names[host].get(type):
+                    records.setdefault(type, {})[key] = names[host][type]
+        return records
+
+
+class WHMResolver:
+    """Finds the hosting accounts for a domain through the WHM API, or the `whm` script when no API servers are configured."""
     def resolve(self, domain):
-        output = self.fetch_whm(domain)    
-        if output:
-            return self.parse_output(output)
-        return None
+        return whm.resolve(domain)
+
+    def resolve_many(self, domains):
+        return whm.resolve_many(domains)
+
+class Target:
+    """A record from the DNS sweep together with what its value points at.
+
+    FQDN values carry their A records (each a Target with its PTR name) in addresses,
+    IP values carry their PTR name in ptr. Records themselves may be shared with the
+    DNS answer cache, so the resolution lives here rather than on them.
+    """
+    def __init__(self, record, addresses=None, ptr=None, error=None):
+        self.record = record
+        self.addresses = addresses
+        self.ptr = ptr
+        self.error = error
+
+    def to_dict(self):
+        result = self.record.to_dict()
+        if self.addresses is not None:
+            result["addresses"] = [address.to_dict() for address in self.addresses]
+        if DNSResolver.is_valid_ip(self.record.value):
+            result["ptr"] = self.ptr
+        if self.error is not None:
+            result["error"] = self.error
+        return result
+
 
 class RecordDisplay:
-    def display_target(target, resolver, separator, depth=0, is_multiple=False):
-        def print_target(target, highlight, color, highlight_color, is_multiple, end=""):
+    def display_target(target, separator, depth=0, is_multiple=False):
+        def print_target(text, highlight, color, highlight_color, is_multiple, end=""):
             indent = "\t" * depth if is_multiple else ""
-            Logger.write(f"{indent}{Logger.highlight(f'{target}', highlight, highlight_color, color)}", color, end=end)
+            Logger.write(f"{indent}{Logger.highlight(f'{text}', highlight, highlight_color, color)}", color, end=end)
 
+        record = target.record
         color = Config.COLORS.SECONDARY_COLOR
         
         highlight_color = Config.COLORS.RECORD_HIGHLIGHT_COLOR
         highlight_pattern = ""
         
         for pattern in Config.RECORD_HIGHLIGHTS:
-            if re.search(pattern, target.value):
-                highlight_color = Config.RECORD_HIGHLIGHTS[pattern](target)
+            if re.search(pattern, record.value):
+                highlight_color = Config.RECORD_HIGHLIGHTS[pattern](record)
                 highlight_pattern = pattern
                 break
 
-        if Domain.is_fqdn(target.value):
-            try:
-                results = resolver.resolve(target.value, RecordType.A)
-                is_multiple = len(results) > 1
+        if target.error is not None:
+            Logger.write(f"Error resolving {record}: {target.error}", Colors.RED, Styles.REVERSED)
+        elif target.addresses is not None:
+            is_multiple = len(target.addresses) > 1
 
-                print_target(target, highlight_pattern, color, highlight_color, is_multiple)
-                print(f"{separator}", end="")
+            print_target(record, highlight_pattern, color, highlight_color, is_multiple)
+            Logger.emit(separator)
 
-                if is_multiple:
-                    print()
+            if is_multiple or not target.addresses:
+                Logger.emit("\n")
 
-                for record in results:
-                    RecordDisplay.display_target(record, resolver,
-                                separator, depth+1, is_multiple)
-
-            except Exception as e:
-                Logger.write(f"Error resolving {target}: {e}", Colors.RED, Styles.REVERSED)
-        elif DNSResolver.is_valid_ip(target.value):
-            try:
-                hostname = socket.gethostbyaddr(f"{target.value}")[0]
-                
-                print_target(target if depth == 0 else target.value, highlight_pattern, color, highlight_color, is_multiple)
-                print(f"{separator}", end="")
-                Logger.write(hostname, color)
-            
-            except socket.herror as e:
-                print_target(target if depth == 0 else target.value, highlight_pattern, color, highlight_color, is_multiple)
-                print(f"{separator}", end="")
+            for address in target.addresses:
+                RecordDisplay.display_target(address, separator, depth+1, is_multiple)
+        elif DNSResolver.is_valid_ip(record.value):
+            print_target(record if depth == 0 else record.value, highlight_pattern, color, highlight_color, is_multiple)
+            Logger.emit(separator)
+            if target.ptr is not None:
+                Logger.write(target.ptr, color)
+            else:
                 Logger.write(f"Unknown Host", Colors.RED, Styles.REVERSED)
         else:
-            print_target(target, highlight_pattern, color, highlight_color, is_multiple)
-            print()
+            print_target(record, highlight_pattern, color, highlight_color, is_multiple)
+            Logger.emit("\n")
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Domain Information')
-    parser.add_argument('domain', type=str, help='Domain name')
-    parser.add_argument("-ns", "--nameserver", help="Set nameserver")
-    parser.add_argument("-sd", "--subdomains", help="Multiple subdomains", action="store_true")
+class PhaseRunner:
+    """Runs the independent lookup phases of a report, optionally overlapping them.
 
-    args = parser.parse_args()
-    base_domain = args.domain
+    Every phase is timed through metrics. In serial mode each phase runs to completion as it is
+    submitted, which matches the original back-to-back behaviour.
+    """
+    def __init__(self, parallel=False, max_workers=8):
+        self.concurrent = parallel
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) if parallel else None
+        self.futures = {}
 
-    dns_resolver = DNSResolver(args.nameserver)
-    subdomains = Config.GENERIC_SUBDOMAINS
-    
-    if args.subdomains:
-        subdomains.extend([line for line in Nano.get_text().split("\n") if line != ""])
-        for subdomain in subdomains[:]:
-            if not dns_resolver.exists(f"{subdomain}.{base_domain}"):
-                subdomains.remove(subdomain)                
-                
-    start_time = time.time()
-                
-    whm_resolver = WHMResolver()
-    whm = whm_resolver.resolve(base_domain)
-    if whm is not None:
-        Logger.write_header("Web Hosting Manager (WHM)", Config.COLORS.WHM_PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
-        for title, data in whm.items():
-            if "links" not in data:
-                continue
-            Logger.write(f"{title}", Config.COLORS.WHM_SECONDARY_COLOR, Config.STYLES.WHM_STYLE)
-            for name, link in data["links"].items():
-                Logger.write(f"\t{StringUtils.hyperlink(link, name)}", Config.COLORS.WHM_SECONDARY_COLOR, Config.STYLES.WHM_STYLE)
-
-
-    whois_lookup = whois.whois(base_domain)    
-    if whois_lookup.registrant_id != None:
-        Logger.write_header("ASIC Lookup", Config.COLORS.ASIC_PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
-        id = StringUtils.digitialise(whois_lookup.registrant_id)
-        id_length = len(id)
-        if id_length == 11:
-            abn = ABN(Config.URLS.ABN_URL,id)
-            Logger.write(abn)
-        elif id_length == 9:
-            acn = ACN(Config.URLS.ACN_URL,id)
-            Logger.write(acn)
-    
-    Logger.write_header("Domain Information", Config.COLORS.WHOIS_PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
-    Logger.write(WhoisDisplay(whois_lookup), end=" ")
-    
-    # get all records on the domain
-    records = []
-    for record_type in RecordType:
-        records.extend(dns_resolver.resolve(base_domain, record_type))
-    
-    # get all the records on the subdomains
-    subdomain_records = {}
+    def submit(self, name, function, *args):
+        def timed():
+            with metrics.phase(name):
+                return function(*args)
+
+        metrics.default_metrics().declare(name)
+
+        if self.executor is not None:
+            future = self.executor.submit(ratelimit.bind(timed))
+        else:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(timed())
+            except Exception as e:
+                future.set_exception(e)
+        self.futures[name] = future
+        return future
+
+    def result(self, name):
+        return self.futures[name].result()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_asic(whois_future):
+    whois_lookup = whois_future.result()
+    if whois_lookup.registrant_id is None:
+        return None
+    id = StringUtils.digitialise(whois_lookup.registrant_id)
+    id_length = len(id)
+    if id_length == 11:
+        return ABN(Config.URLS.ABN_URL, id)
+    elif id_length == 9:
+        return ACN(Config.URLS.ACN_URL, id)
+    return None
+
+
+class DigestSet:
+    """Exact set membership for strings, holding a 64-bit digest of each instead of the string.
+
+    About 70 bytes an item (7MB for a 100k-name wordlist). Two distinct names share a
+    digest with probability around n^2 / 2^65, one in ten million for a million names.
+    """
+    def __init__(self):
+        self.digests = set()
+
+    @staticmethod
+    def digest(item):
+        return int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "little")
+
+    def add(self, item):
+        self.digests.add(self.digest(item))
+
+    def __contains__(self, item):
+        return self.digest(item) in self.digests
+
+    def __len__(self):
+        return len(self.digests)
+
+
+class SubdomainProber:
+    """Finds which of a stream of subdomains exist, concurrently and wildcard aware.
+
+    A few random labels are resolved first. If any of them exists, the zone has a
+    wildcard, and names whose A answers fall entirely within the wildcard's addresses
+    (or that exist without A records, when the wildcard has none) are dropped as its echoes.
+
+    Names pass through a bounded queue to the worker threads and are deduplicated
+    exactly by a 64-bit digest each, so a long stream costs a few bytes per name
+    rather than the names themselves; only the names found are kept.
+    """
+    def __init__(self, dns_resolver, base_domain, max_workers=16, wildcard_probes=3, budget=None):
+        self.dns_resolver = dns_resolver
+        self.base_domain = base_domain
+        self.max_workers = max_workers
+        self.wildcard_probes = wildcard_probes
+        self.budget = budget
+        self.wildcard = False
+        self.wildcard_values = set()
+        self.probed = 0
+        self.found = 0
+        self.filtered = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.exhausted = False
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def random_label():
+        return "".join(random.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=16))
+
+    def lookup_many(self, hosts):
+        queries = [(host, RecordType.A) for host in hosts]
+        if not queries:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(queries))) as executor:
+            return list(executor.map(ratelimit.bind(lambda query: self.dns_resolver.lookup(*query)), queries))
+
+    def detect_wildcard(self):
+        hosts = [f"{self.random_label()}.{self.base_domain}" for _ in range(self.wildcard_probes)]
+        for records, exists in self.lookup_many(hosts):
+            if exists:
+                self.wildcard = True
+                self.wildcard_values.update(record.value for record in records)
+        return self.wildcard
+
+    def is_wildcard_echo(self, records):
+        if not self.wildcard:
+            return False
+        if not records:
+            return not self.wildcard_values
+        return {record.value for record in records} <= self.wildcard_values
+
+    def check(self, index, subdomain, found):
+        try:
+            records, exists = self.dns_resolver.lookup(f"{subdomain}.{self.base_domain}", RecordType.A)
+        except Exception:
+            with self.lock:
+                self.probed += 1
+                self.errors += 1
+            return
+        with self.lock:
+            self.probed += 1
+            if not exists:
+                return
+            if self.is_wildcard_echo(records):
+                self.filtered += 1
+                return
+            self.found += 1
+            found[subdomain] = (index, records)
+
+    def probe(self, subdomains, progress=None, interval=1.0):
+        """Returns {subdomain: A records} for the subdomains that exist, in the order they were given.
+
+        subdomains may be any iterable, read lazily. At most budget names are probed.
+        progress, if given, is called with the prober about every interval seconds.
+        """
+        self.started = time.monotonic()
+        self.detect_wildcard()
+        work = queue.Queue(maxsize=self.max_workers * 4)
+        found = {}
+
+        def worker():
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                self.check(*item, found)
+
+        workers = [threading.Thread(target=ratelimit.bind(worker), daemon=True) for _ in range(self.max_workers)]
+        for thread in workers:
+            thread.start()
+        seen = DigestSet()
+        submitted = 0
+        reported = time.monotonic()
+        try:
+            for subdomain in subdomains:
+                if subdomain in seen:
+                    self.duplicates += 1
+                    continue
+                if self.budget is not None and submitted >= self.budget:
+                    self.exhausted = True
+                    break
+                seen.add(subdomain)
+                work.put((submitted, subdomain))
+                submitted += 1
+                if progress is not None and time.monotonic() - reported >= interval:
+                    progress(self)
+                    reported = time.monotonic()
+        finally:
+            for _ in workers:
+                work.put(None)
+            for thread in workers:
+                thread.join()
+        if progress is not None:
+            progress(self)
+
+        metrics.count("subdomains.probed", self.probed)
+        metrics.count("subdomains.found", self.found)
+        metrics.count("subdomains.wildcard_filtered", self.filtered)
+        return {subdomain: records for subdomain, (_, records) in sorted(found.items(), key=lambda item: item[1][0])}
+
+
+def read_wordlist(stream):
+    for line in read_domains(stream):
+        yield line.lower().rstrip(".")
+
+
+def display_progress(prober):
+    elapsed = max(time.monotonic() - prober.started, 1e-9)
+    sys.stderr.write(f"\r{prober.probed} names, {prober.probed / elapsed:.0f}/s, {prober.found} found"
+                     + (f", {prober.filtered} wildcard" if prober.wildcard else "") + "\x1b[K")
+    sys.stderr.flush()
+
+
+def fetch_records(dns_resolver, base_domain, subdomains, max_workers=1, known=None):
+    """Sweeps every RecordType of the domain and subdomains, skipping answers already in known ({host: {RecordType: records}})."""
+    known = known or {}
+
+    def sweep(hosts):
+        queries = [(host, record_type) for host in hosts for record_type in RecordType if record_type not in known.get(host, {})]
+        results = dns_resolver.resolve_many(queries, max_workers)
+        answers = {(host, record_type): result for (host, record_type), result in zip(queries, results)}
+        records = {}
+        for host in hosts:
+            for record_type in RecordType:
+                records.setdefault(host, []).extend(known.get(host, {}).get(record_type) or answers.get((host, record_type), []))
+        return records
+
+    # get all the records on the domain and the subdomains, keyed by the domain
+    swept = sweep([base_domain] + [f"{subdomain}.{base_domain}" for subdomain in subdomains])
+    all_records = {base_domain: swept[base_domain]}
     for subdomain in subdomains:
-        subdomain_records[subdomain] = []
-        for record_type in RecordType:
-            subdomain_records[subdomain].extend(dns_resolver.resolve(f"{subdomain}.{base_domain}", record_type))
-    
-    # combine into a single list keyed by the domain
-    all_records = {base_domain: records}
-    all_records.update(subdomain_records)
-    
+        all_records[subdomain] = swept[f"{subdomain}.{base_domain}"]
+
     # Using Config.SMART_SUBDOMAINS, check if any records trigger a special case and add them to a local smart_subdomains list.
     smart_subdomains = {}
     for record_list in all_records.values():
@@ -720,15 +1365,12 @@ def main():
                     if subdomain not in smart_subdomains:
                         smart_subdomains[subdomain] = []
                     smart_subdomains[subdomain].append(record)
-                    
+
     # Resolve the smart subdomains into all_records
+    swept = sweep([f"{subdomain}.{base_domain}" for subdomain in smart_subdomains])
     for subdomain in smart_subdomains:
-        subdomain_records[subdomain] = []
-        for record_type in RecordType:
-            subdomain_records[subdomain].extend(dns_resolver.resolve(f"{subdomain}.{base_domain}", record_type))
-        all_records.update(subdomain_records)
-        
-    
+        all_records[subdomain] = swept[f"{subdomain}.{base_domain}"]
+
     transformed_records = {}
     for domain, record_list in all_records.items():
         for record in record_list:
@@ -737,28 +1379,569 @@ def main():
             if domain not in transformed_records[record.type]:
                 transformed_records[record.type][domain] = []
             transformed_records[record.type][domain].append(record)
-    
-    # Display all records
+    return transformed_records
+
+
+def record_from_dict(data):
+    type = RecordType[data["type"]]
+    if type == RecordType.MX:
+        return MXRecord(data["host"], data["value"], data["priority"])
+    if type == RecordType.SOA:
+        return SOARecord(data["host"], data["value"], data["mname"], data["rname"], data["serial"],
+                         data["refresh"], data["retry"], data["expire"], data["minimum"])
+    return Record(data["host"], data["value"], type)
+
+
+def records_from_dict(data):
+    return {
+        RecordType[type]: {host: [record_from_dict(record) for record in host_records] for host, host_records in hosts.items()}
+        for type, hosts in data.items()
+    }
+
+
+def diff_records(old, new):
+    """Compares two records_to_dict() sweeps by (type, host, value).
+
+    A host whose only value of a type was replaced, or a record whose other fields
+    (MX priority, SOA timers) differ, counts as changed rather than removed and added.
+    """
+    changes = {"added": [], "removed": [], "changed": []}
+    for type in dict.fromkeys(list(old) + list(new)):
+        hosts = dict.fromkeys(list(old.get(type, {})) + list(new.get(type, {})))
+        for host in hosts:
+            before = {record["value"]: record for record in old.get(type, {}).get(host, [])}
+            after = {record["value"]: record for record in new.get(type, {}).get(host, [])}
+            removed = [record for value, record in before.items() if value not in after]
+            added = [record for value, record in after.items() if value not in before]
+            if len(removed) == 1 and len(added) == 1:
+                changes["changed"].append({"old": removed[0], "new": added[0]})
+            else:
+                changes["removed"].extend(removed)
+                changes["added"].extend(added)
+            changes["changed"].extend({"old": before[value], "new": after[value]}
+                                      for value in before if value in after and before[value] != after[value])
+    return changes
+
+
+def soa_serial(records, base_domain):
+    soa = records.get(RecordType.SOA, {}).get(base_domain) or []
+    return soa[0].serial if soa else None
+
+
+def sweep_records(dns_resolver, base_domain, subdomains, max_workers=1, known=None, transfer=True, store=None):
+    """Sweeps the domain like fetch_records, short-circuiting on an unchanged SOA serial.
+
+    When transfer is set and the domain is on one of our nameservers, the whole zone
+    is loaded by AXFR (or IXFR against the snapshot's zone) instead, falling back to
+    per-name queries if every server refuses.
+
+    The last sweep of each (domain, subdomain set) is kept in the result store with its
+    SOA serial. When the live serial matches and the snapshot is younger than the
+    smallest TTL it contained, the snapshot is served for one SOA query. Otherwise the
+    zone is swept again and compared with the snapshot. Returns (records, changes).
+    """
+    store = store or cache.default_store()
+    names = ",".join(sorted(subdomains))
+    key = f"{base_domain.lower()}:{hashlib.sha1(names.encode()).hexdigest()[:16]}"
+    snapshot = store.get("records", key)
+    soa = dns_resolver.resolve(base_domain, RecordType.SOA)
+    serial = soa[0].serial if soa else None
+    changes = {"serial": serial, "snapshot": None, "cached": False, "transfer": None}
+
+    if snapshot is not None:
+        changes["snapshot"] = {"serial": snapshot["serial"], "created": snapshot["created"]}
+        if serial is not None and snapshot["serial"] == serial and time.time() - snapshot["created"] < snapshot["min_ttl"]:
+            metrics.count("records.snapshot_hits")
+            changes["cached"] = True
+            return records_from_dict(snapshot["records"]), changes
+
+    zone = None
+    if transfer:
+        transferrer = ZoneTransfer(dns_resolver)
+        addresses = transferrer.nameservers(base_domain)
+        zone_text = snapshot.get("zone") if snapshot is not None else None
+        if addresses and zone_text is not None and transferrer.serial(base_domain, addresses) == snapshot["serial"]:
+            # Our authoritative server vouches for the transferred zone, so skip parsing it for an IXFR.
+            metrics.count("records.snapshot_hits")
+            changes.update(cached=True, transfer="SOA")
+            store.put("records", key, dict(snapshot, created=time.time()))
+            return records_from_dict(snapshot["records"]), changes
+        if addresses:
+            zone = transferrer.transfer(base_domain, addresses, zone_text)
+            if zone is None and zone_text is not None:
+                zone = transferrer.transfer(base_domain, addresses)
+    if zone is not None:
+        records = transferrer.to_records(zone, base_domain)
+        changes["transfer"] = transferrer.kind
+    else:
+        records = fetch_records(dns_resolver, base_domain, subdomains, max_workers, known)
+    swept = records_to_dict(records)
+    if snapshot is not None:
+        changes.update(diff_records(snapshot["records"], swept))
+    ttls = [record.ttl for hosts in records.values() for host_records in hosts.values() for record in host_records if record.ttl is not None]
+    store.put("records", key, {
+        "serial": soa_serial(records, base_domain) or serial,
+        "created": time.time(),
+        "min_ttl": min(ttls) if ttls else 0,
+        "records": swept,
+        "zone": zone.to_text() if zone is not None else None,
+    })
+    return records, changes
+
+
+def fetch_spf(dns_resolver, base_domain):
+    spf_resolver = SPFResolver(dns_resolver)
+    return spf_resolver.resolve_domain(base_domain)
+
+
+def resolve_targets(transformed_records, dns_resolver, max_workers=16):
+    """Turns the DNS sweep into Targets, resolving the A records of every FQDN they show in one concurrent batch, then every address's PTR in another."""
+    def resolve(name):
+        try:
+            return dns_resolver.resolve(name, RecordType.A), None
+        except Exception as e:
+            return None, f"{e}"
+
+    targets = {}
     for record_type, domains in transformed_records.items():
-        Logger.write_header(f"{record_type.name} RECORDS", Config.COLORS.PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
         for domain, records in domains.items():
             for record in records:
-                RecordDisplay.display_target(record, dns_resolver, Config.RECORD_SEPARATOR) 
-    
-    
-    spf_resolver = SPFResolver(dns_resolver)
-    spf_lookup = spf_resolver.resolve_domain(base_domain)
+                targets.setdefault(record_type, {}).setdefault(domain, []).append(Target(record))
+    pending = [target for domains in targets.values() for host_targets in domains.values() for target in host_targets]
+
+    hostnames = list(dict.fromkeys(target.record.value for target in pending if Domain.is_fqdn(target.record.value)))
+    if hostnames:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(hostnames))) as executor:
+            answers = dict(zip(hostnames, executor.map(ratelimit.bind(resolve), hostnames)))
+        for target in pending:
+            if target.record.value in answers:
+                addresses, target.error = answers[target.record.value]
+                if addresses is not None:
+                    target.addresses = [Target(address) for address in addresses]
+
+    pending = [address for target in pending for address in (target.addresses or [target])
+               if DNSResolver.is_valid_ip(address.record.value)]
+    with metrics.phase("PTR"):
+        names = dns_resolver.reverse_many([target.record.value for target in pending])
+    for target in pending:
+        target.ptr = names[target.record.value]
+    return targets
+
+
+def records_to_dict(records):
+    return {
+        record_type.name: {host: [record.to_dict() for record in host_records] for host, host_records in hosts.items()}
+        for record_type, hosts in records.items()
+    }
+
+
+def whois_to_dict(whois_lookup):
+    return {field: whois_lookup.get(field) for field in Config.WHOIS_FIELDS}
+
+
+def collect_statistics(runner, start_time, dns_resolver=None):
+    data = metrics.default_metrics()
+    return {
+        "phases": {name: data.phase_time(name) for name in data.phases},
+        "elapsed": time.perf_counter() - start_time,
+        "mode": "concurrent" if runner.concurrent else "serial",
+        "dns": {
+            "queries": data.counters["dns.queries"],
+            "cache_hits": data.counters["dns.cache_hits"],
+            "types": {name.split(".", 1)[1]: {"count": timer.count, "total": timer.total}
+                      for name, timer in data.timers.items() if name.startswith("dns.")},
+        },
+        "sources": {source: {"lookups": data.counters[f"{source}.lookups"], "cached": data.counters[f"{source}.cache_hits"]}
+                    for source in ("whois", "abn")},
+        "subdomains": {name: data.counters[f"subdomains.{name}"] for name in ("probed", "found", "wildcard_filtered")},
+        "rate_limits": ratelimit.default_scheduler().stats(),
+        "nameservers": dns_resolver.stats() if dns_resolver else {},
+        "hedging": dns_resolver.hedging.stats() if dns_resolver else {},
+    }
+
+
+def collect_profiles(directory=None):
+    data = metrics.default_metrics()
+    return {"reports": data.report_profiles(), "saved": data.dump_profiles(directory) if directory else []}
+
+
+class AnsiRenderer:
+    """Renders a report as the coloured terminal sections; with colour off on the writer, as plain text.
+
+    Each section is flushed as soon as it is rendered so concurrent runs still show progress.
+    """
+    def __init__(self, writer, domain):
+        self.writer = writer
+        self.domain = domain
+        Logger.use(writer)
+
+    def whm(self, whm):
+        if whm is not None:
+            Logger.write_header("Web Hosting Manager (WHM)", Config.COLORS.WHM_PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+            for title, data in whm.items():
+                if "error" in data:
+                    Logger.write(f"{title}: {data['error']}", Colors.RED)
+                if "links" not in data:
+                    continue
+                Logger.write(f"{title}", Config.COLORS.WHM_SECONDARY_COLOR, Config.STYLES.WHM_STYLE)
+                for name, link in data["links"].items():
+                    Logger.write(f"\t{StringUtils.hyperlink(link, name)}", Config.COLORS.WHM_SECONDARY_COLOR, Config.STYLES.WHM_STYLE)
+        self.writer.flush()
+
+    def asic(self, whois_lookup, entity):
+        if whois_lookup.registrant_id is not None:
+            Logger.write_header("ASIC Lookup", Config.COLORS.ASIC_PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+            if entity is not None:
+                Logger.write(entity)
+        self.writer.flush()
+
+    def whois(self, whois_lookup):
+        Logger.write_header("Domain Information", Config.COLORS.WHOIS_PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+        Logger.write(WhoisDisplay(whois_lookup), end=" ")
+        self.writer.flush()
+
+    def records(self, targets):
+        for record_type, domains in targets.items():
+            Logger.write_header(f"{record_type.name} RECORDS", Config.COLORS.PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+            for domain, host_targets in domains.items():
+                for target in host_targets:
+                    RecordDisplay.display_target(target, Config.RECORD_SEPARATOR)
+        self.writer.flush()
+
+    def changes(self, changes):
+        snapshot = changes["snapshot"]
+        if snapshot is not None or changes["transfer"] in ("AXFR", "IXFR"):
+            Logger.write_header("Changes", Config.COLORS.PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+        if changes["transfer"] in ("AXFR", "IXFR"):
+            Logger.write(f"Zone loaded by {changes['transfer']}", Config.COLORS.SECONDARY_COLOR)
+        if snapshot is not None:
+            since = time.strftime("%Y-%m-%d %H:%M", time.localtime(snapshot["created"]))
+            if changes["cached"]:
+                Logger.write(f"SOA serial {changes['serial']} unchanged since {since}, records served from the snapshot", Config.COLORS.SECONDARY_COLOR)
+            elif not (changes["added"] or changes["removed"] or changes["changed"]):
+                Logger.write(f"No changes since {since} (serial {snapshot['serial']} -> {changes['serial']})", Config.COLORS.SECONDARY_COLOR)
+            else:
+                Logger.write(f"Since {since} (serial {snapshot['serial']} -> {changes['serial']}):", Config.COLORS.SECONDARY_COLOR)
+                for record in changes["added"]:
+                    Logger.write(f"+ {record['type']} {record['host']} {record['value']}", Colors.GREEN)
+                for record in changes["removed"]:
+                    Logger.write(f"- {record['type']} {record['host']} {record['value']}", Colors.RED)
+                for change in changes["changed"]:
+                    old, new = change["old"], change["new"]
+                    Logger.write(f"~ {new['type']} {new['host']} {old['value']} -> {new['value']}"
+                                 + (f" (priority {old['priority']} -> {new['priority']})" if old.get("priority") != new.get("priority") else ""), Colors.YELLOW)
+        self.writer.flush()
+
+    def spf(self, spf_lookup):
+        if spf_lookup is not None and len(spf_lookup["errors"]) > 0:
+            Logger.write_header("SPF Lookup", Config.COLORS.SPF_PRIMARY_COLOR, Config.STYLES.SPF_STYLE)
+            SPFDisplay(spf_lookup).display()
+        self.writer.flush()
+
+    def statistics(self, stats):
+        Logger.write_header("Statistics", Config.COLORS.PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+        for name, seconds in stats["phases"].items():
+            Logger.write(f"{name}: {seconds:.2f} seconds", Config.COLORS.SECONDARY_COLOR)
+        Logger.write(f"Execution time: {stats['elapsed']:.2f} seconds ({stats['mode']})", Config.COLORS.SECONDARY_COLOR)
+
+        dns = stats["dns"]
+        breakdown = ", ".join(f"{type} {timer['count']} in {timer['total']:.2f}s" for type, timer in dns["types"].items())
+        Logger.write(f"DNS queries: {dns['queries']}" + (f" ({breakdown})" if breakdown else ""), Config.COLORS.SECONDARY_COLOR)
+        hits, misses = dns["cache_hits"], dns["queries"]
+        Logger.write(f"DNS cache: {hits} hits, {misses} misses ({hits / max(hits + misses, 1):.0%})", Config.COLORS.SECONDARY_COLOR)
+        subdomains = stats["subdomains"]
+        if subdomains["probed"]:
+            Logger.write(f"Subdomains: {subdomains['probed']} probed, {subdomains['found']} found, {subdomains['wildcard_filtered']} wildcard matches dropped", Config.COLORS.SECONDARY_COLOR)
+        for source, counts in stats["sources"].items():
+            if counts["lookups"] or counts["cached"]:
+                Logger.write(f"{source}: {counts['lookups']} lookups, {counts['cached']} cached", Config.COLORS.SECONDARY_COLOR)
+        hedging = stats["hedging"]
+        if hedging.get("hedged"):
+            Logger.write(f"DNS hedging: {hedging['hedged']} of {hedging['queries']} queries hedged, {hedging['won']} won, p99 {hedging['p99'] * 1000:.1f}ms ({hedging['p99_unhedged'] * 1000:.1f}ms unhedged)", Config.COLORS.SECONDARY_COLOR)
+        for role, servers in stats["nameservers"].items():
+            for server, latency in servers.items():
+                if latency["queries"]:
+                    Logger.write(f"Nameserver {server} ({role}): {latency['queries']} queries, {latency['ewma'] * 1000:.1f}ms average (max {latency['max'] * 1000:.1f}ms), {latency['failures']} failed", Config.COLORS.SECONDARY_COLOR)
+        for destination, limits in stats["rate_limits"].items():
+            Logger.write(f"{destination}: {limits['acquired']} requests, {limits['waited']:.2f}s rate limited (max {limits['max_wait']:.2f}s)", Config.COLORS.SECONDARY_COLOR)
+        self.writer.flush()
+
+    def profiles(self, profiles):
+        for name, report in profiles["reports"].items():
+            Logger.write_header(f"Profile: {name}", Config.COLORS.PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+            Logger.write(report.strip("\n"), Config.COLORS.SECONDARY_COLOR)
+        for path in profiles["saved"]:
+            Logger.write(f"Saved {path}", Config.COLORS.SECONDARY_COLOR)
+        self.writer.flush()
+
+    def end(self):
+        Logger.write_header("The End", Config.COLORS.PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+        self.writer.flush()
+
+
+class NDJSONRenderer:
+    """Writes each section as one JSON object per line as soon as it is ready."""
+    def __init__(self, writer, domain):
+        self.writer = writer
+        self.domain = domain
+
+    def section(self, name, data):
+        self.writer.write(json.dumps({"section": name, "domain": self.domain, "data": data}, default=str) + "\n")
+        self.writer.flush()
+
+    def whm(self, whm):
+        self.section("whm", whm)
+
+    def asic(self, whois_lookup, entity):
+        self.section("asic", entity.to_dict() if entity is not None else None)
+
+    def whois(self, whois_lookup):
+        self.section("whois", whois_to_dict(whois_lookup))
+
+    def records(self, targets):
+        self.section("records", records_to_dict(targets))
+
+    def changes(self, changes):
+        self.section("changes", changes)
+
+    def spf(self, spf_lookup):
+        self.section("spf", spf_lookup)
+
+    def statistics(self, stats):
+        self.section("statistics", stats)
+
+    def profiles(self, profiles):
+        self.section("profiles", profiles)
+
+    def end(self):
+        pass
+
+
+class JSONRenderer(NDJSONRenderer):
+    """Collects every section and writes the report as a single JSON document at the end."""
+    def __init__(self, writer, domain):
+        super().__init__(writer, domain)
+        self.report = {"domain": domain}
+
+    def section(self, name, data):
+        self.report[name] = data
+
+    def end(self):
+        self.writer.write(json.dumps(self.report, indent=2, default=str) + "\n")
+        self.writer.flush()
+
+
+RENDERERS = {
+    "ansi": AnsiRenderer,
+    "plain": AnsiRenderer,
+    "json": JSONRenderer,
+    "ndjson": NDJSONRenderer,
+}
+
+
+class LatencyReservoir:
+    """Fixed-size uniform sample of latencies, so percentiles cost constant memory."""
+    def __init__(self, size=10000):
+        self.size = size
+        self.count = 0
+        self.samples = []
+
+    def add(self, value):
+        self.count += 1
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < self.size:
+                self.samples[index] = value
+
+    def percentile(self, percent):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def collect_domain(domain, dns_resolver):
+    start = time.perf_counter()
+    result = {"domain": domain}
+    try:
+        whois_lookup = cache.whois_lookup(domain)
+        result["whois"] = whois_to_dict(whois_lookup)
+        future = concurrent.futures.Future()
+        future.set_result(whois_lookup)
+        entity = fetch_asic(future)
+        result["asic"] = entity.to_dict() if entity is not None else None
+    except Exception as e:
+        result["whois"] = None
+        result["asic"] = None
+        result.setdefault("errors", []).append(f"whois: {e}")
+
+    # Only from the WHM account index: a live lookup per domain would dominate a bulk run.
+    try:
+        index = whm.default_index()
+        if index is not None:
+            result["whm"] = index.lookup(domain, live=False)
+    except Exception as e:
+        result["whm"] = None
+        result.setdefault("errors", []).append(f"whm: {e}")
+
+    # A malformed name (e.g. an empty label) fails here, and must not take the rest of the batch down.
+    try:
+        records = fetch_records(dns_resolver, domain, list(Config.GENERIC_SUBDOMAINS))
+        result["records"] = records_to_dict(records)
+    except Exception as e:
+        result["records"] = None
+        result.setdefault("errors", []).append(f"dns: {e}")
+    try:
+        result["spf"] = fetch_spf(dns_resolver, domain)
+    except Exception as e:
+        result["spf"] = None
+        result.setdefault("errors", []).append(f"spf: {e}")
+    result["elapsed"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def collect_domain_job(domain, dns_resolver):
+    # Each domain queues as its own job, so the rate limiter round-robins between the domains in flight.
+    with ratelimit.job(domain):
+        return collect_domain(domain, dns_resolver)
+
+
+def read_domains(stream):
+    for line in stream:
+        domain = line.strip()
+        if domain and not domain.startswith("#"):
+            yield domain
+
+
+def run_bulk(source, jobs, dns_resolver, output=None):
+    """Streams NDJSON results for every domain in source, at most jobs domains in flight at once."""
+    output = output or sys.stdout
+    latencies = LatencyReservoir()
+    start = time.perf_counter()
+
+    def emit(future):
+        result = future.result()
+        latencies.add(result["elapsed"])
+        output.write(json.dumps(result, default=str) + "\n")
+        output.flush()
+
+    stream = sys.stdin if source == "-" else open(source, "r")
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending = set()
+            for domain in read_domains(stream):
+                if len(pending) >= jobs:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        emit(future)
+                pending.add(executor.submit(collect_domain_job, domain, dns_resolver))
+            for future in concurrent.futures.as_completed(pending):
+                emit(future)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    elapsed = time.perf_counter() - start
+    rate = latencies.count / elapsed if elapsed else 0.0
+    sys.stderr.write(
+        f"{latencies.count} domains in {elapsed:.2f}s ({rate:.1f} domains/s), "
+        f"p50 {latencies.percentile(50):.2f}s, p95 {latencies.percentile(95):.2f}s, "
+        f"{sum(stats['waited'] for stats in ratelimit.default_scheduler().stats().values()):.2f}s rate limited\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="DI", description='Domain Information')
+    parser.add_argument('domain', type=str, nargs="?", help='Domain name')
+    parser.add_argument("-ns", "--nameserver", help="Query these nameservers instead of the system's, e.g. '1.1.1.1,8.8.8.8' or '127.0.0.1:5353'")
+    parser.add_argument("--authoritative", help="Query names in the domain's zone at its own nameservers", action="store_true")
+    parser.add_argument("--hedge-ratio", type=float, default=0.05, metavar="RATIO", help="Resend DNS queries slower than twice the server's p95 RTT, at most RATIO extra queries per query (0 disables)")
+    parser.add_argument("-sd", "--subdomains", help="Multiple subdomains", action="store_true")
+    parser.add_argument("-w", "--wordlist", metavar="FILE", help="Probe every subdomain listed in FILE ('-' for stdin), streamed line by line")
+    parser.add_argument("--query-budget", type=int, metavar="N", help="Probe at most N subdomain names for the domain")
+    parser.add_argument("--no-transfer", help="Don't try AXFR/IXFR against our own nameservers", action="store_true")
+    parser.add_argument("-c", "--concurrent", help="Overlap the WHM, whois, ASIC, DNS and SPF phases", action="store_true")
+    parser.add_argument("--no-cache", help="Ignore cached whois/ABN results", action="store_true")
+    parser.add_argument("-b", "--bulk", metavar="FILE", help="Read domains from FILE ('-' for stdin) and write one JSON object per domain")
+    parser.add_argument("-j", "--jobs", type=int, default=16, help="Domains resolved concurrently in bulk mode")
+    parser.add_argument("--rate-limit", metavar="SPEC", type=ratelimit.argument, action="append", default=[], help="Outbound limits, e.g. 'whois=1/3,dns:1.1.1.1=50,http=none' (requests/s[/burst])")
+    parser.add_argument("-f", "--format", choices=sorted(RENDERERS), help="Output format (default: ansi on a terminal, plain otherwise)")
+    parser.add_argument("--profile", nargs="?", const="", metavar="DIR", help="cProfile each phase and print the hottest functions, saving .prof files to DIR if given (runs phases serially)")
+
+    args = parser.parse_args(argv)
+    if (args.domain is None) == (args.bulk is None):
+        parser.error("specify either a domain or --bulk FILE")
+    cache.set_bypass(args.no_cache)
+    for spec in args.rate_limit:
+        ratelimit.configure(spec)
+    base_domain = args.domain
+    if args.profile is not None:
+        # cProfile only follows the thread that enabled it, so phases can't overlap while profiling.
+        metrics.default_metrics().profiling = True
+        args.concurrent = False
+    start_time = time.perf_counter()
+
+    dns_resolver = DNSResolver(args.nameserver, hedge_ratio=args.hedge_ratio)
+    if args.authoritative and args.domain and not dns_resolver.use_authoritative(base_domain):
+        common.print_error(f"No nameservers found for {base_domain}, querying recursively.", file=sys.stderr)
+    if args.bulk:
+        run_bulk(args.bulk, max(args.jobs, 1), dns_resolver)
+        return
+    subdomains = list(Config.GENERIC_SUBDOMAINS)
+    known = None
     
-    if (spf_lookup != None and len(spf_lookup["errors"]) > 0):
-        Logger.write_header("SPF Lookup", Config.COLORS.SPF_PRIMARY_COLOR, Config.STYLES.SPF_STYLE)
-        spf_display = SPFDisplay(spf_lookup)
-        spf_display.display()
-
-    Logger.write_header("Statistics", Config.COLORS.PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
-    Logger.write(f"Execution time: {time.time() - start_time:.2f} seconds", Config.COLORS.SECONDARY_COLOR)
-    Logger.write(f"{requests.get('http://api.quotable.io/random').json()['content']}", Config.COLORS.SECONDARY_COLOR)
-    Logger.write_header("The End", Config.COLORS.PRIMARY_COLOR, Config.STYLES.PRIMARY_STYLE)
+    if args.subdomains or args.wordlist:
+        sources = [subdomains]
+        if args.subdomains:
+            sources.append([line for line in Nano.get_text().split("\n") if line != ""])
+        stream = None
+        if args.wordlist:
+            stream = sys.stdin if args.wordlist == "-" else open(args.wordlist, "r")
+            sources.append(read_wordlist(stream))
+        prober = SubdomainProber(dns_resolver, base_domain, 64 if args.wordlist else 16, budget=args.query_budget)
+        try:
+            with metrics.phase("Subdomains"):
+                found = prober.probe(itertools.chain(*sources), display_progress if sys.stderr.isatty() else None)
+        finally:
+            if stream not in (None, sys.stdin):
+                stream.close()
+        if sys.stderr.isatty():
+            sys.stderr.write("\n")
+        if prober.exhausted:
+            common.print_error(f"Query budget of {args.query_budget} names reached, the rest of the list was skipped.", file=sys.stderr)
+        # The probe's A answers go straight into the sweep rather than being queried again.
+        subdomains = list(found)
+        known = {f"{subdomain}.{base_domain}": {RecordType.A: records} for subdomain, records in found.items()}
+                
+    # Each phase has a different bottleneck (process spawn, whois socket, HTTPS, UDP),
+    # so in concurrent mode they all start now and are displayed in order as they finish.
+    output_format = args.format or ("ansi" if sys.stdout.isatty() else "plain")
+    renderer = RENDERERS[output_format](Writer(sys.stdout, color=output_format == "ansi"), base_domain)
+    runner = PhaseRunner(args.concurrent)
+    try:
+        runner.submit("WHM", WHMResolver().resolve, base_domain)
+        whois_future = runner.submit("Whois", cache.whois_lookup, base_domain)
+        runner.submit("ASIC", fetch_asic, whois_future)
+        runner.submit("DNS", sweep_records, dns_resolver, base_domain, subdomains, 16 if args.concurrent else 1, known, not args.no_transfer)
+        runner.submit("SPF", fetch_spf, dns_resolver, base_domain)
+
+        renderer.whm(runner.result("WHM"))
+        whois_lookup = runner.result("Whois")
+        renderer.asic(whois_lookup, runner.result("ASIC"))
+        renderer.whois(whois_lookup)
+        records, changes = runner.result("DNS")
+        renderer.records(resolve_targets(records, dns_resolver))
+        renderer.changes(changes)
+        renderer.spf(runner.result("SPF"))
+    finally:
+        runner.shutdown()
+
+    renderer.statistics(collect_statistics(runner, start_time, dns_resolver))
+    if args.profile is not None:
+        renderer.profiles(collect_profiles(args.profile))
+    renderer.end()
     
     
 if __name__ == "__main__":
-    main()
+    daemon.dispatch("di", main, ("-sd", "--subdomains", "-w", "--wordlist", "-b", "--bulk", "--no-cache", "--rate-limit", "--profile"))
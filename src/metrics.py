@@ -0,0 +1,130 @@
+import collections
+import contextlib
+import contextvars
+import io
+import os
+import threading
+import time
+import common
+
+cProfile = common.LazyModule("cProfile")
+pstats = common.LazyModule("pstats")
+
+
+class Timer:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """Process-wide counters, timers and optional per-phase cProfile data.
+
+    Phases are the coarse steps of a report (WHM, Whois, DNS, ...) and are kept in
+    the order they were declared. Timers are finer grained (one per DNS record type)
+    and may be added to from any thread.
+    """
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.timers = {}
+        self.phases = []
+        self.profiling = False
+        self.profiles = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.timers.setdefault(name, Timer()).add(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def declare(self, name):
+        with self.lock:
+            if name not in self.phases:
+                self.phases.append(name)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times a phase and, when profiling, captures a cProfile of the calling thread for it.
+
+        cProfile only sees the thread that enabled it and can't run in two threads at
+        once, so callers must run phases serially while profiling.
+        """
+        self.declare(name)
+        profiler = cProfile.Profile() if self.profiling else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            with self.timer(name):
+                yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                with self.lock:
+                    if name in self.profiles:
+                        self.profiles[name].add(profiler)
+                    else:
+                        self.profiles[name] = pstats.Stats(profiler)
+
+    def phase_time(self, name):
+        timer = self.timers.get(name)
+        return timer.total if timer else 0.0
+
+    def report_profiles(self, limit=15):
+        """Returns {phase: the top functions by cumulative time, as pstats prints them}."""
+        reports = {}
+        for name, stats in self.profiles.items():
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats("cumulative").print_stats(limit)
+            reports[name] = stream.getvalue()
+        return reports
+
+    def dump_profiles(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, stats in self.profiles.items():
+            path = os.path.join(directory, f"{name.lower().replace(' ', '_')}.prof")
+            stats.dump_stats(path)
+            paths.append(path)
+        return paths
+
+
+# One Metrics for the process, unless a caller (the daemon, per request) installs its own.
+_metrics = contextvars.ContextVar("metrics", default=Metrics())
+
+
+def default_metrics():
+    return _metrics.get()
+
+
+def use(instance):
+    _metrics.set(instance)
+
+
+def count(name, amount=1):
+    default_metrics().count(name, amount)
+
+
+def timer(name):
+    return default_metrics().timer(name)
+
+
+def phase(name):
+    return default_metrics().phase(name)
@@ -0,0 +1,189 @@
+import argparse
+import collections
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+# (requests per second, burst) per destination. A destination is "<kind>:<host>"
+# (dns:1.1.1.1, whois:whois.auda.org.au, http:abr.business.gov.au) or just "whm";
+# an exact entry wins over its kind's entry, and destinations with neither are unlimited.
+DEFAULT_LIMITS = {
+    "dns": (200.0, 100),
+    "whois": (2.0, 4),
+    "whois:whois.auda.org.au": (1.0, 3),
+    "http": (4.0, 8),
+    "whm": (4.0, 4),
+}
+
+current_job = contextvars.ContextVar("current_job", default="default")
+
+
+def parse_limits(spec):
+    """Parses "whois:whois.auda.org.au=1/3,http=5,dns=none" into {destination: (rate, burst) or None}."""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        destination, _, value = entry.partition("=")
+        if not destination or not value:
+            raise ValueError(f"invalid rate limit '{entry}', expected destination=rate[/burst] or destination=none")
+        if value.lower() in ("none", "off", "0"):
+            limits[destination] = None
+            continue
+        rate, _, burst = value.partition("/")
+        try:
+            rate = float(rate)
+            burst = int(burst) if burst else max(int(rate), 1)
+        except ValueError:
+            raise ValueError(f"invalid rate limit '{entry}', expected destination=rate[/burst] or destination=none") from None
+        if rate <= 0 or burst <= 0:
+            raise ValueError(f"invalid rate limit '{entry}', rate and burst must be positive")
+        limits[destination] = (rate, burst)
+    return limits
+
+
+def argument(spec):
+    """argparse type for --rate-limit: validates the spec so a bad one is a usage error."""
+    try:
+        parse_limits(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+
+class TokenBucket:
+    """A token bucket whose waiters are served round-robin by job, FIFO within a job.
+
+    A job that queues hundreds of requests (a bulk run) therefore can't starve one
+    that queues a few (an interactive lookup) sharing the same destination.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.queues = collections.OrderedDict()
+        self.acquired = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def head(self):
+        job = next(iter(self.queues))
+        return job, self.queues[job][0]
+
+    def acquire(self, job):
+        """Blocks until a token is granted to this caller, returning the seconds spent waiting."""
+        ticket = object()
+        start = time.monotonic()
+        with self.condition:
+            self.queues.setdefault(job, collections.deque()).append(ticket)
+            while True:
+                self.refill()
+                head_job, head_ticket = self.head()
+                if head_ticket is ticket and self.tokens >= 1:
+                    break
+                timeout = (1 - self.tokens) / self.rate if head_ticket is ticket else None
+                self.condition.wait(timeout)
+            self.tokens -= 1
+            queue = self.queues[job]
+            queue.popleft()
+            if queue:
+                self.queues.move_to_end(job)
+            else:
+                del self.queues[job]
+            waited = time.monotonic() - start
+            self.acquired += 1
+            self.waited += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.condition.notify_all()
+        return waited
+
+
+class Scheduler:
+    """Hands out outbound request slots per destination, so every backend shares one budget."""
+    def __init__(self, limits=None):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(parse_limits(os.environ.get("POLARIC_RATE_LIMITS", "")))
+        self.limits.update(limits or {})
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def configure(self, limits):
+        with self.lock:
+            self.limits.update(limits)
+            self.buckets.clear()
+
+    def limit(self, destination):
+        if destination in self.limits:
+            return self.limits[destination]
+        return self.limits.get(destination.split(":", 1)[0])
+
+    def bucket(self, destination):
+        with self.lock:
+            if destination not in self.buckets:
+                limit = self.limit(destination)
+                self.buckets[destination] = TokenBucket(*limit) if limit else None
+            return self.buckets[destination]
+
+    def acquire(self, destination, job=None):
+        bucket = self.bucket(destination)
+        if bucket is None:
+            return 0.0
+        return bucket.acquire(job or current_job.get())
+
+    def stats(self):
+        with self.lock:
+            buckets = {destination: bucket for destination, bucket in self.buckets.items() if bucket is not None}
+        return {
+            destination: {"acquired": bucket.acquired, "waited": bucket.waited, "max_wait": bucket.max_wait}
+            for destination, bucket in buckets.items()
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def default_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+
+def acquire(destination):
+    return default_scheduler().acquire(destination)
+
+
+def configure(spec):
+    default_scheduler().configure(parse_limits(spec))
+
+
+@contextlib.contextmanager
+def job(name):
+    """Attributes requests made by this thread (and functions it bind()s) to the named job."""
+    token = current_job.set(name)
+    try:
+        yield
+    finally:
+        current_job.reset(token)
+
+
+def bind(function):
+    """Wraps function so it runs in the caller's context when handed to a worker thread.
+
+    That carries the rate limit job along with anything else kept in context
+    variables, such as the daemon's per-request output and metrics.
+    """
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return bound
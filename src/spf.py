@@ -1,38 +1,133 @@
-import dns.resolver
 import re
 import argparse
+import collections
+import concurrent.futures
+import functools
+import threading
+import time
 import common
+import ratelimit
+import metrics
+import daemon
+
+dns = common.LazyModule("dns")
 
 CENTER_LENGTH = 50
 CENTER_CHAR = "-"
 
+MECHANISMS = {"all", "include", "a", "mx", "ptr", "ip4", "ip6", "exists"}
+# Mechanisms that cost a DNS lookup (RFC 7208 section 4.6.4); redirect= is counted separately.
+LOOKUP_MECHANISMS = {"a", "mx", "ptr", "exists"}
+TERM_PATTERN = re.compile(r'(?=\S)(([+\-~?]?)([^\s:=/]*)([:=/]?)(\S*))\s*')
+IPV4_PATTERN = re.compile(r'\d{1,3}(\.\d{1,3}){3}')
+
+
+class SPFTerm(collections.namedtuple("SPFTerm", "kind qualifier name value text")):
+    """One whitespace separated term of an SPF record.
+
+    kind is "version", "mechanism", "modifier" or "unknown". name is lower-cased and
+    value is everything after the ':' or '=' (for a/24 style terms, the "/24").
+    """
+    @property
+    def macro(self):
+        return "%" in self.value
+
+
+def txt_value(rdata):
+    """A TXT record's character-strings joined with nothing in between, as RFC 7208 section 3.3 reads them."""
+    return b"".join(rdata.strings).decode("utf-8", errors="replace")
+
+
+@functools.lru_cache(maxsize=4096)
+def tokenize(spf_record):
+    """Splits an SPF record into a tuple of SPFTerms in a single regex pass."""
+    terms = []
+    for text, qualifier, name, delimiter, value in TERM_PATTERN.findall(spf_record.lstrip()):
+        name = name.lower()
+        if delimiter == "/":
+            value = f"/{value}"
+        if delimiter == "=":
+            kind = "version" if name == "v" and not qualifier else "modifier"
+        elif name in MECHANISMS:
+            kind = "mechanism"
+            qualifier = qualifier or "+"
+        else:
+            kind = "unknown"
+        if kind != "mechanism" and qualifier:
+            # A qualifier only means something in front of a mechanism.
+            name = f"{qualifier}{name}"
+            qualifier = ""
+        terms.append(tuple.__new__(SPFTerm, (kind, qualifier, name, value, text)))
+    return tuple(terms)
+
 
 class SPFResolver:
-    def __init__(self):
+    # Evaluated include/redirect subtrees, shared by every resolver in the process
+    # so the same _spf.google.com style trees are only walked once. An LRU keyed by
+    # (memo_key(), domain), so resolvers asking different nameservers don't share results.
+    subtrees = collections.OrderedDict()
+    subtrees_lock = threading.Lock()
+    subtree_ttl = 300
+    subtree_max_entries = 10000
+    executor = None
+    executor_lock = threading.Lock()
+
+    def __init__(self, max_workers=16):
         self.errors = []
         self.lookup_count = 0
         self.resolver = dns.resolver.Resolver()
         self.limit = 10
+        self.max_workers = max_workers
 
-    def resolve_domain(self, domain):
+    def query(self, domain, rdtype):
+        ratelimit.acquire(f"dns:{self.resolver.nameservers[0]}")
+        metrics.count("dns.queries")
+        with metrics.timer(f"dns.{rdtype}"):
+            return self.resolver.resolve(domain, rdtype)
+
+    def query_txt(self, domain):
+        return [txt_value(txt_record) for txt_record in self.query(domain, 'TXT')]
+
+    def query_addresses(self, domain):
+        addresses = []
+        for rdtype in ("A", "AAAA"):
+            try:
+                addresses.extend(answer.to_text() for answer in self.query(domain, rdtype))
+            except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN):
+                pass
+        return addresses
+
+    def query_mx(self, domain):
+        try:
+            return [answer.exchange.to_text() for answer in self.query(domain, "MX")]
+        except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN):
+            return []
+
+    def report_missing(self, domain):
+        common.print_color(f"Hostname {domain} does not exist.", "RED", "FLASH")
+
+    def fetch_spf(self, domain):
+        """Returns (spf record, errors) for domain, the record being None when there is none."""
         try:
-            answers = self.resolver.query(domain, 'TXT')
-            for txt_record in answers:
-                txt_data = txt_record.to_text()
+            for txt_data in self.query_txt(domain):
                 if txt_data.startswith('"') and txt_data.endswith('"'):
                     txt_data = txt_data[1:-1]
-                if "v=spf1" in txt_data: 
-                    spf_record = txt_data
-                    if domain in spf_record:
-                        self.errors.append(f"Recursive SPF record detected! Contains the domain: {domain}")
-                    return self.parse_spf(spf_record)
+                if "v=spf1" in txt_data:
+                    errors = []
+                    if domain in txt_data:
+                        errors.append(f"Recursive SPF record detected! Contains the domain: {domain}")
+                    return txt_data, errors
         except dns.resolver.NoAnswer:
             pass
-        except dns.resolver.NXDOMAIN:
-            common.print_color(f"Hostname {domain} does not exist.", "RED", "FLASH")
-        except dns.resolver.NoNameservers:
-            common.print_color(f"Hostname {domain} does not exist.", "RED", "FLASH")
-            return
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoNameservers):
+            self.report_missing(domain)
+        return None, []
+
+    def resolve_domain(self, domain):
+        spf_record, errors = self.fetch_spf(domain)
+        if spf_record is None:
+            return None
+        return self.parse_spf(spf_record, errors, domain)
 
     def resolve_spf(self, spf):
         try:
@@ -42,83 +137,217 @@ class SPFResolver:
             return self.parse_spf(spf)
         except Exception as e:
             print(e)
-            
-    def parse_spf(self, spf_record):
-        if spf_record.startswith('"') or spf_record.endswith('"'):
-            self.errors.append(f"SPF record has unnecessary quotation marks: {spf_record}")
-        
-        if "\\" in spf_record:
-            self.errors.append(f"SPF record contains backslashes: {spf_record}")
-        
-        if spf_record.count("~all") > 1:
-            self.errors.append(f"Redundant '~all' mechanism detected in SPF record: {spf_record}")
-        
-        if not spf_record.startswith('v=spf1'):
-            self.errors.append(f"Missing 'v=spf1' at the start of the SPF record: {spf_record}")
 
-        if re.search(r'\binclude:[^\w.-]', spf_record):
-            self.errors.append(f"Malformed 'include' mechanism in SPF record: {spf_record}")
+    def parse_spf(self, spf_record, errors=None, domain=None):
+        records, memo = self.walk(spf_record)
+        result, _ = self.evaluate(spf_record, records, (domain,) if domain else (), memo)
+        result["errors"] = (errors or []) + result["errors"]
 
+        # The lookup limit applies to the domain being evaluated, not to each subtree.
+        if result["count"] > self.limit:
+            result["errors"].append(f"Too many lookups: {result['count']}/{self.limit} for SPF record: {spf_record}")
+        self.lookup_count = result["count"]
+        self.errors = result["errors"]
+        return result
 
-        if re.search(r'\bredirect=[^\s]+', spf_record):
-            self.errors.append(f"SPF record contains a 'redirect' modifier, which should be used alone: {spf_record}")
+    @staticmethod
+    def includes(terms):
+        return list(dict.fromkeys(term.value for term in terms
+                                  if term.kind == "mechanism" and term.name == "include" and term.value and not term.macro))
 
-        if len(re.findall(r'\ba\b', spf_record)) > 1:
-            self.errors.append(f"Duplicate 'a' mechanism detected in SPF record: {spf_record}")
-        
-        if len(re.findall(r'\bmx\b', spf_record)) > 1:
-            self.errors.append(f"Duplicate 'mx' mechanism detected in SPF record: {spf_record}")
-        
-        includes = re.findall(r'include:([\w.-]+)', spf_record)
-        seen_includes = set()
-        for include in includes:
-            if include in seen_includes:
-                self.errors.append(f"Duplicate 'include' mechanism for domain {include} detected: {spf_record}")
-            seen_includes.add(include)
+    @staticmethod
+    def redirects(terms):
+        return [term.value for term in terms
+                if term.kind == "modifier" and term.name == "redirect" and term.value and not term.macro][:1]
 
-        if len(spf_record) > 255:
-            self.errors.append(f"SPF record exceeds 255 characters: {spf_record}")
+    @classmethod
+    def targets(cls, spf_record):
+        terms = tokenize(spf_record)
+        return cls.includes(terms) + cls.redirects(terms)
 
-        if re.search(r'\b\d{1,3}(\.\d{1,3}){3}\b', spf_record) and not re.search(r'\bip[46]:', spf_record):
-            self.errors.append(f"IP address used without 'ip4' or 'ip6' prefix in SPF record: {spf_record}")
-        
-        if not spf_record.strip():
-            self.errors.append("SPF record is empty.")
-        
-        if re.search(r'\bredirect\b', spf_record) and re.search(r'\b(include|a|mx|ip4|ip6)\b', spf_record):
-            self.errors.append(f"SPF record contains both 'redirect' and other mechanisms: {spf_record}")
+    def memo_key(self):
+        return (tuple(self.resolver.nameservers), self.resolver.port)
 
-        if self.lookup_count > self.limit:
-            self.errors.append(f"Too many lookups: {spf_record} {self.lookup_count}/{self.limit}")
-            return
+    def cached_subtree(self, domain):
+        key = (self.memo_key(), domain)
+        with self.subtrees_lock:
+            entry = self.subtrees.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self.subtrees[key]
+                return None
+            self.subtrees.move_to_end(key)
+            return entry
 
-        if bool(re.search(r'\ba\b', spf_record)):
-            self.lookup_count += 1
-        if bool(re.search(r'\bmx\b', spf_record)):
-            self.lookup_count += 1
+    def memoize(self, domain, result):
+        now = time.time()
+        with self.subtrees_lock:
+            self.subtrees[(self.memo_key(), domain)] = (now + self.subtree_ttl, result)
+            self.subtrees.move_to_end((self.memo_key(), domain))
+            # Expired entries at the cold end go first, then the least recently used beyond the bound.
+            while self.subtrees and (len(self.subtrees) > self.subtree_max_entries
+                                     or next(iter(self.subtrees.values()))[0] <= now):
+                self.subtrees.popitem(last=False)
 
-        include_results = {}
-        includes = re.findall(r'include:([\w.-]+)', spf_record)
-        for include_domain in includes:
-            if include_domain not in include_results:
-                self.lookup_count += 1
-                include_results[include_domain] = self.resolve_domain(include_domain)
+    @classmethod
+    def get_executor(cls, max_workers):
+        with cls.executor_lock:
+            if cls.executor is None:
+                cls.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+            return cls.executor
 
-        redirects = re.findall(r'redirect=([\w.-]+)', spf_record)
-        if redirects:
-            self.lookup_count += 1
-            self.resolve_domain(redirects[0])
+    def walk(self, spf_record):
+        """Fetches every include/redirect target below spf_record, resolving each tree level in parallel.
+
+        Returns (records, memo). Targets with a memoized subtree are not fetched again;
+        their results are taken into memo now, so one that expires or is evicted from
+        the shared memo before evaluate() still counts. Levels deeper than the lookup
+        limit are left unfetched, since such a tree exceeds the limit anyway.
+        """
+        records = {}
+        memo = {}
+        frontier = self.targets(spf_record)
+        executor = self.get_executor(self.max_workers)
+        depth = 0
+        while frontier and depth < self.limit:
+            pending = []
+            for domain in dict.fromkeys(frontier):
+                if domain in records or domain in memo:
+                    continue
+                entry = self.cached_subtree(domain)
+                if entry is not None:
+                    memo[domain] = entry[1]
+                else:
+                    pending.append(domain)
+            for domain, fetched in zip(pending, executor.map(ratelimit.bind(self.fetch_spf), pending)):
+                records[domain] = fetched
+            frontier = [target for domain in pending if records[domain][0] for target in self.targets(records[domain][0])]
+            depth += 1
+        return records, memo
+
+    def subtree(self, domain, records, path, memo):
+        """Returns (result, complete) for an include/redirect target, memoizing complete subtrees."""
+        if domain in memo:
+            return memo[domain], True
+        if domain not in records:
+            return None, False
+
+        spf_record, errors = records[domain]
+        if spf_record is None:
+            result, complete = None, True
+        else:
+            result, complete = self.evaluate(spf_record, records, path + (domain,), memo)
+            result["errors"] = errors + result["errors"]
+        if complete:
+            self.memoize(domain, result)
+            memo[domain] = result
+        return result, complete
+
+    def evaluate(self, spf_record, records, path, memo):
+        terms = tokenize(spf_record)
+        errors = self.lint(spf_record, terms)
+        count = sum(1 for term in terms if term.kind == "mechanism" and term.name in LOOKUP_MECHANISMS)
+        # Every include and the redirect cost a lookup, macro ones too, even though only plain targets are walked.
+        count += sum(1 for term in terms if term.kind == "mechanism" and term.name == "include" and term.value)
+        count += any(term.kind == "modifier" and term.name == "redirect" and term.value for term in terms)
+        complete = True
+
+        include_results = {}
+        includes = self.includes(terms)
+        redirects = self.redirects(terms)
+        for domain, is_redirect in [(domain, False) for domain in includes] + [(domain, True) for domain in redirects]:
+            if domain in path:
+                # Loops depend on where the walk started, so these subtrees are never memoized.
+                errors.append(f"SPF include loop detected at {domain}: {spf_record}")
+                complete = False
+                continue
+            result, child_complete = self.subtree(domain, records, path, memo)
+            complete = complete and child_complete
+            if not is_redirect:
+                include_results[domain] = result
+            if result is not None:
+                count += result["count"]
+                errors.extend(result["errors"])
 
-        if self.lookup_count > self.limit:
-            self.errors.append(f"Too many lookups: {self.lookup_count}/{self.limit} for SPF record: {spf_record}")
-        
         result = {
-            "count": self.lookup_count,
+            "count": count,
             "spf": spf_record,
             "include": include_results,
-            "errors": self.errors
+            "errors": errors
         }
-        return result
+        if redirects:
+            result["redirect"] = redirects
+        return result, complete
+
+    def lint(self, spf_record, terms=None):
+        terms = tokenize(spf_record) if terms is None else terms
+        errors = []
+        if spf_record.startswith('"') or spf_record.endswith('"'):
+            errors.append(f"SPF record has unnecessary quotation marks: {spf_record}")
+
+        if any("\\" in term.text for term in terms):
+            errors.append(f"SPF record contains backslashes: {spf_record}")
+
+        a_count = mx_count = softfail_count = 0
+        seen_includes = set()
+        redirect = False
+        other_mechanisms = False
+        bare_ip = False
+        for term in terms:
+            kind = term.kind
+            if kind == "mechanism":
+                name = term.name
+                if name == "include":
+                    other_mechanisms = True
+                    value = term.value
+                    if not value or not (value[0].isalnum() or value[0] in "_.-%"):
+                        errors.append(f"Malformed 'include' mechanism in SPF record: {spf_record}")
+                    elif value in seen_includes:
+                        errors.append(f"Duplicate 'include' mechanism for domain {value} detected: {spf_record}")
+                    seen_includes.add(value)
+                elif name == "all":
+                    softfail_count += term.qualifier == "~"
+                elif name == "a":
+                    a_count += 1
+                    other_mechanisms = True
+                elif name == "mx":
+                    mx_count += 1
+                    other_mechanisms = True
+                elif name == "ip4" or name == "ip6":
+                    other_mechanisms = True
+            elif kind == "modifier":
+                redirect = redirect or term.name == "redirect"
+            elif kind == "unknown" and IPV4_PATTERN.fullmatch(term.name.lstrip("+-~?")):
+                bare_ip = True
+
+        if softfail_count > 1:
+            errors.append(f"Redundant '~all' mechanism detected in SPF record: {spf_record}")
+
+        if not terms or terms[0].kind != "version" or terms[0].value != "spf1" or not spf_record.startswith("v="):
+            errors.append(f"Missing 'v=spf1' at the start of the SPF record: {spf_record}")
+
+        if redirect:
+            errors.append(f"SPF record contains a 'redirect' modifier, which should be used alone: {spf_record}")
+
+        if a_count > 1:
+            errors.append(f"Duplicate 'a' mechanism detected in SPF record: {spf_record}")
+
+        if mx_count > 1:
+            errors.append(f"Duplicate 'mx' mechanism detected in SPF record: {spf_record}")
+
+        if len(spf_record) > 255:
+            errors.append(f"SPF record exceeds 255 characters: {spf_record}")
+
+        if bare_ip:
+            errors.append(f"IP address used without 'ip4' or 'ip6' prefix in SPF record: {spf_record}")
+
+        if not terms:
+            errors.append("SPF record is empty.")
+
+        if redirect and other_mechanisms:
+            errors.append(f"SPF record contains both 'redirect' and other mechanisms: {spf_record}")
+        return errors
 
 
     def display_lookup(self, spf_lookup, depth=0):
@@ -163,19 +392,55 @@ class SPFResolver:
             for error in errors:
                 common.print_color(f"- {error}", "HI_RED")
 
-def main():
+def display_flattened(domain, max_length, samples):
+    # spfcheck builds on this module, so it is imported where it is needed.
+    import spfcheck
+
+    checker = spfcheck.SPFChecker()
+    try:
+        records = spfcheck.flatten(checker, domain, max_length)
+    except spfcheck.FlattenError as e:
+        common.print_error(f"Cannot flatten {domain}: {e}")
+        return
+
+    common.print_color(f" {domain} ".center(CENTER_LENGTH, CENTER_CHAR), "CYAN", "BOLD")
+    for name, record in records:
+        common.print_color(f"{name}. IN TXT {spfcheck.txt_strings(record)}", "WHITE")
+    lookups = len(records) - 1
+    common.print_color(f"{len(records)} record(s), {lookups} lookup(s) at the receiver", "YELLOW" if lookups > 1 else "GREEN")
+
+    if samples:
+        checked, mismatches = spfcheck.verify(checker, domain, records, samples)
+        if mismatches:
+            common.print_error(f"{len(mismatches)}/{checked} sample IPs got a different verdict:")
+            for ip, expected, actual in mismatches[:20]:
+                common.print_color(f"- {ip}: {expected} -> {actual}", "HI_RED")
+        else:
+            common.print_color(f"Verified: {checked} sample IPs get the same verdict.", "GREEN")
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         prog="SPF Resolver",
         description="Counts SPF Lookups")
 
-    parser.add_argument("domain", help="Domain to be resolved.")
-    args = parser.parse_args()
+    parser.add_argument("domains", nargs="+", help="Domains to be resolved.")
+    parser.add_argument("-f", "--flatten", help="Emit ip4/ip6-only records with the same verdicts", action="store_true")
+    parser.add_argument("-l", "--max-length", type=int, default=512, help="Maximum bytes per flattened record (255 or 512)")
+    parser.add_argument("-v", "--verify", type=int, default=1000, metavar="SAMPLES", help="Sample IPs compared after flattening (0 to skip)")
+    args = parser.parse_args(argv)
+
+    if args.flatten:
+        for domain in args.domains:
+            display_flattened(domain, args.max_length, args.verify)
+        return
 
     resolver = SPFResolver()
-    spf_lookup = resolver.resolve_domain(args.domain)
-    resolver.display_lookup(spf_lookup)
+    for domain in args.domains:
+        spf_lookup = resolver.resolve_domain(domain)
+        resolver.display_lookup(spf_lookup)
     pass
 
 
 if __name__ == "__main__":
-    main()
+    daemon.dispatch("spf", main)
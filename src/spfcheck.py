@@ -0,0 +1,569 @@
+import argparse
+import collections
+import csv
+import ipaddress
+import random
+import re
+import socket
+import sys
+import common
+import spf
+
+dns = common.LazyModule("dns")
+
+QUALIFIER_RESULTS = {"+": "pass", "-": "fail", "~": "softfail", "?": "neutral"}
+DUAL_CIDR_PATTERN = re.compile(r'^(?P<domain>[^/]*)(?:/(?P<ip4>\d+))?(?://(?P<ip6>\d+))?$')
+MACRO_PATTERN = re.compile(r'%\{(?P<letter>[slodiphcrtv])(?P<digits>\d*)(?P<reverse>r?)(?P<delimiters>[.\-+,/_=]*)\}|%%|%_|%-')
+MX_LIMIT = 10
+EVERYTHING = [ipaddress.ip_network("0.0.0.0/0"), ipaddress.ip_network("::/0")]
+
+
+class PermError(Exception):
+    pass
+
+
+class TempError(Exception):
+    pass
+
+
+def parse_ip(ip):
+    """Returns (version, integer) for an IPv4/IPv6 address string."""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+
+
+class PrefixTrie:
+    """Binary trie over CIDR prefixes of one address family.
+
+    Each node is [zero child, one child, values]. lookup() walks the address bits and
+    returns the values of every prefix containing the address.
+    """
+    def __init__(self, bits):
+        self.bits = bits
+        self.root = [None, None, None]
+
+    def insert(self, network, value):
+        node = self.root
+        address = int(network.network_address)
+        for position in range(network.prefixlen):
+            bit = (address >> (self.bits - 1 - position)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            node[2] = []
+        node[2].append(value)
+
+    def lookup(self, address):
+        node = self.root
+        values = []
+        shift = self.bits - 1
+        while node is not None:
+            if node[2] is not None:
+                values.extend(node[2])
+            if shift < 0:
+                break
+            node = node[(address >> shift) & 1]
+            shift -= 1
+        return values
+
+
+class CompiledPolicy:
+    """An SPF policy with every ip4/ip6/a/mx term resolved into prefix tries.
+
+    Terms keep their position so check_host's first-match order is preserved: a
+    lookup yields candidate term indices and the lowest one that matches decides.
+    Terms that depend on the sender IP (macros, ptr) or on policies that could not
+    be compiled are "dynamic" and evaluated on every check.
+    """
+    def __init__(self, domain):
+        self.domain = domain
+        self.tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        self.terms = []
+        self.dynamic = []
+        self.all_index = None
+        self.redirect = None
+        self.result = None
+        self.lookups = 0
+        self.limit_index = None
+
+    def add_network(self, network, index):
+        self.tries[network.version].insert(network, index)
+
+    def pass_networks(self):
+        """Networks that could make this policy pass, or None when that is not known statically."""
+        if self.result is not None or self.dynamic or self.limit_index is not None:
+            return None
+        networks = []
+        for index, (qualifier, kind, argument) in enumerate(self.terms):
+            if qualifier != "+":
+                continue
+            if kind == "networks":
+                networks.extend(argument)
+            elif kind == "include":
+                included = argument.pass_networks()
+                if included is None:
+                    return None
+                networks.extend(included)
+            elif kind == "all":
+                return EVERYTHING
+        if self.redirect is not None and self.all_index is None:
+            redirected = self.redirect.pass_networks()
+            if redirected is None:
+                return None
+            networks.extend(redirected)
+        return networks
+
+
+class SPFChecker:
+    """RFC 7208 check_host() over compiled policies, each domain's policy resolved once."""
+    def __init__(self, spf_resolver=None, max_policies=10000, enforce_limit=True):
+        self.spf_resolver = spf_resolver or QuietSPFResolver()
+        self.enforce_limit = enforce_limit
+        self.max_policies = max_policies
+        self.policies = collections.OrderedDict()
+
+    def policy(self, domain):
+        domain = domain.lower().rstrip(".")
+        policy = self.policies.get(domain)
+        if policy is not None:
+            self.policies.move_to_end(domain)
+            return policy
+        policy = self.compile(domain, ())
+        self.policies[domain] = policy
+        while len(self.policies) > self.max_policies:
+            self.policies.popitem(last=False)
+        return policy
+
+    def compile(self, domain, path):
+        policy = CompiledPolicy(domain)
+        try:
+            spf_record, _ = self.spf_resolver.fetch_spf(domain)
+        except dns.exception.DNSException:
+            policy.result = "temperror"
+            return policy
+        if spf_record is None:
+            policy.result = "none"
+            return policy
+        try:
+            self.compile_terms(policy, spf.tokenize(spf_record), path + (domain,))
+        except PermError:
+            policy.result = "permerror"
+        except (TempError, dns.exception.DNSException):
+            policy.result = "temperror"
+        return policy
+
+    def compile_terms(self, policy, terms, path):
+        redirect = None
+        for term in terms:
+            if term.kind == "version":
+                continue
+            if term.kind == "modifier":
+                if term.name == "redirect":
+                    redirect = term.value
+                continue
+            if term.kind != "mechanism":
+                raise PermError(f"Unknown term {term.text}")
+
+            index = len(policy.terms)
+            if term.name in spf.LOOKUP_MECHANISMS or term.name == "include":
+                policy.lookups += 1
+            if term.name == "all":
+                policy.terms.append((term.qualifier, "all", None))
+                if policy.all_index is None:
+                    policy.all_index = index
+            elif term.name in ("ip4", "ip6"):
+                try:
+                    network = ipaddress.ip_network(term.value, strict=False)
+                except ValueError:
+                    raise PermError(f"Invalid network {term.text}")
+                if network.version != int(term.name[-1]):
+                    raise PermError(f"Invalid network {term.text}")
+                policy.terms.append((term.qualifier, "networks", [network]))
+                policy.add_network(network, index)
+            elif term.name in ("a", "mx") and not term.macro:
+                networks = self.resolve_networks(term, policy.domain)
+                policy.terms.append((term.qualifier, "networks", networks))
+                for network in networks:
+                    policy.add_network(network, index)
+            elif term.name == "include" and not term.macro:
+                if term.value in path:
+                    raise PermError(f"Include loop at {term.value}")
+                included = self.compile(term.value, path)
+                policy.lookups += included.lookups
+                policy.terms.append((term.qualifier, "include", included))
+                networks = included.pass_networks()
+                if networks is None:
+                    policy.dynamic.append(index)
+                else:
+                    for network in networks:
+                        policy.add_network(network, index)
+            elif term.name == "exists" and not term.macro:
+                # Without macros the answer is the same for every sender, so it matches everything or nothing.
+                networks = EVERYTHING if self.spf_resolver.query_addresses(term.value) else []
+                policy.terms.append((term.qualifier, "networks", networks))
+                for network in networks:
+                    policy.add_network(network, index)
+            else:
+                # exists, ptr and macro terms depend on the sender IP.
+                policy.terms.append((term.qualifier, "dynamic", term))
+                policy.dynamic.append(index)
+            if policy.limit_index is None and policy.lookups > self.spf_resolver.limit:
+                policy.limit_index = index
+
+        if redirect is not None and policy.all_index is None:
+            if "%" in redirect:
+                raise PermError("Macros in redirect= are not supported")
+            if redirect in path:
+                raise PermError(f"Redirect loop at {redirect}")
+            policy.lookups += 1
+            policy.redirect = self.compile(redirect, path)
+            policy.lookups += policy.redirect.lookups
+            if policy.limit_index is None and policy.lookups > self.spf_resolver.limit:
+                policy.limit_index = len(policy.terms)
+
+    def resolve_networks(self, term, domain):
+        match = DUAL_CIDR_PATTERN.match(term.value)
+        if match is None:
+            raise PermError(f"Invalid term {term.text}")
+        target = match.group("domain") or domain
+        prefixes = {4: int(match.group("ip4") or 32), 6: int(match.group("ip6") or 128)}
+        if prefixes[4] > 32 or prefixes[6] > 128:
+            raise PermError(f"Invalid prefix length {term.text}")
+
+        hosts = [target]
+        if term.name == "mx":
+            hosts = self.spf_resolver.query_mx(target)[:MX_LIMIT]
+        networks = []
+        for host in hosts:
+            for address in self.spf_resolver.query_addresses(host):
+                address = ipaddress.ip_address(address)
+                networks.append(ipaddress.ip_network(f"{address}/{prefixes[address.version]}", strict=False))
+        return networks
+
+    def check_host(self, ip, domain):
+        try:
+            version, address = parse_ip(ip)
+        except OSError:
+            return "permerror"
+        return self.evaluate(self.policy(domain), ip, version, address)
+
+    def check_many(self, pairs):
+        for ip, domain in pairs:
+            yield ip, domain, self.check_host(ip, domain)
+
+    def evaluate(self, policy, ip, version, address):
+        if policy.result is not None:
+            return policy.result
+        candidates = policy.tries[version].lookup(address)
+        candidates.extend(policy.dynamic)
+        if policy.all_index is not None:
+            candidates.append(policy.all_index)
+        for index in sorted(set(candidates)):
+            if self.enforce_limit and policy.limit_index is not None and index >= policy.limit_index:
+                return "permerror"
+            qualifier, kind, argument = policy.terms[index]
+            if kind == "include":
+                result = self.evaluate(argument, ip, version, address)
+                if result in ("temperror", "permerror"):
+                    return result
+                if result == "none":
+                    return "permerror"
+                if result != "pass":
+                    continue
+            elif kind == "dynamic":
+                try:
+                    matched = self.match_dynamic(argument, policy.domain, ip, version, address)
+                except PermError:
+                    return "permerror"
+                except (TempError, dns.exception.DNSException):
+                    return "temperror"
+                if matched is not True:
+                    if matched in ("temperror", "permerror"):
+                        return matched
+                    continue
+            return QUALIFIER_RESULTS[qualifier]
+        if self.enforce_limit and policy.limit_index is not None:
+            return "permerror"
+        if policy.redirect is not None:
+            result = self.evaluate(policy.redirect, ip, version, address)
+            return "permerror" if result == "none" else result
+        return "neutral"
+
+    def match_dynamic(self, term, domain, ip, version, address):
+        target = expand_macros(term.value, ip, domain) if term.macro else term.value
+        if term.name == "exists":
+            return bool(self.spf_resolver.query_addresses(target.rstrip("/")))
+        if term.name == "include":
+            result = self.evaluate(self.policy(target), ip, version, address)
+            if result == "pass":
+                return True
+            return "permerror" if result == "none" else result if result in ("temperror", "permerror") else False
+        if term.name in ("a", "mx"):
+            expanded = spf.SPFTerm(term.kind, term.qualifier, term.name, target, term.text)
+            return any(address_in(network, version, address) for network in self.resolve_networks(expanded, domain))
+        # ptr is deprecated (RFC 7208 section 5.5) and is never treated as a match.
+        return False
+
+
+def address_in(network, version, address):
+    if network.version != version:
+        return False
+    return int(network.network_address) == address & int(network.netmask)
+
+
+def expand_macros(value, ip, domain, sender=None):
+    """Expands RFC 7208 section 7 macros. Without a sender, postmaster@domain is assumed."""
+    sender = sender or f"postmaster@{domain}"
+    address = ipaddress.ip_address(ip)
+    if address.version == 4:
+        ip_text = str(address)
+    else:
+        ip_text = ".".join(address.exploded.replace(":", ""))
+    variables = {
+        "s": sender,
+        "l": sender.split("@", 1)[0],
+        "o": sender.split("@", 1)[-1],
+        "d": domain,
+        "i": ip_text,
+        "p": "unknown",
+        "v": "in-addr" if address.version == 4 else "ip6",
+        "h": domain,
+    }
+
+    def replace(match):
+        text = match.group(0)
+        if text == "%%":
+            return "%"
+        if text == "%_":
+            return " "
+        if text == "%-":
+            return "%20"
+        letter = match.group("letter")
+        if letter not in variables:
+            raise PermError(f"Unsupported macro {text}")
+        parts = re.split(f"[{re.escape(match.group('delimiters') or '.')}]", variables[letter])
+        if match.group("reverse"):
+            parts.reverse()
+        if match.group("digits"):
+            digits = int(match.group("digits"))
+            if digits == 0:
+                raise PermError(f"Invalid macro {text}")
+            parts = parts[-digits:]
+        return ".".join(parts)
+
+    return MACRO_PATTERN.sub(replace, value)
+
+
+class FlattenError(Exception):
+    pass
+
+
+def collapse(networks):
+    return [network for version in (4, 6)
+            for network in ipaddress.collapse_addresses(n for n in networks if n.version == version)]
+
+
+def subtract(networks, removed):
+    """Returns the parts of networks not covered by removed. CIDRs either nest or are disjoint."""
+    result = []
+    for network in networks:
+        pieces = [network]
+        for other in removed:
+            if other.version != network.version:
+                continue
+            remaining = []
+            for piece in pieces:
+                if piece.subnet_of(other):
+                    continue
+                if other.subnet_of(piece):
+                    remaining.extend(piece.address_exclude(other))
+                else:
+                    remaining.append(piece)
+            pieces = remaining
+        result.extend(pieces)
+    return result
+
+
+def policy_regions(policy):
+    """Returns ({verdict: networks}, default verdict) for a compiled policy.
+
+    Terms are applied in order and each one only claims addresses no earlier term
+    decided, so the regions are disjoint and their union with the default is the
+    whole address space.
+    """
+    if policy.result is not None:
+        raise FlattenError(f"{policy.domain} evaluates to {policy.result}")
+    regions = collections.defaultdict(list)
+    decided = []
+    for qualifier, kind, argument in policy.terms:
+        verdict = QUALIFIER_RESULTS[qualifier]
+        if kind == "all":
+            return regions, verdict
+        if kind == "networks":
+            matched = argument
+        elif kind == "include":
+            # include matches wherever the included policy passes, its default included.
+            included, included_default = policy_regions(argument)
+            matched = included.get("pass", [])
+            if included_default == "pass":
+                others = [network for verdict, networks in included.items() if verdict != "pass" for network in networks]
+                matched = matched + subtract(EVERYTHING, collapse(others))
+        else:
+            raise FlattenError(f"{policy.domain}: '{argument.text}' depends on the sender and cannot be flattened")
+        claimed = subtract(collapse(matched), decided)
+        regions[verdict].extend(claimed)
+        decided = collapse(decided + claimed)
+    if policy.redirect is not None:
+        redirected, default = policy_regions(policy.redirect)
+        for verdict, networks in redirected.items():
+            regions[verdict].extend(subtract(networks, decided))
+        return regions, default
+    return regions, "neutral"
+
+
+def flatten(checker, domain, max_length=512):
+    """Compiles domain's policy into [(name, record)] holding only ip4/ip6 terms.
+
+    Records are chained with redirect= when they do not fit in max_length bytes, so
+    a receiver needs one lookup per extra record.
+    """
+    regions, default = policy_regions(checker.policy(domain))
+    qualifiers = {verdict: qualifier for qualifier, verdict in QUALIFIER_RESULTS.items()}
+    terms = []
+    for verdict in ("pass", "fail", "softfail", "neutral"):
+        if verdict == default:
+            continue
+        prefix = "" if verdict == "pass" else qualifiers[verdict]
+        for network in collapse(regions.get(verdict, [])):
+            text = str(network.network_address) if network.prefixlen == network.max_prefixlen else str(network)
+            terms.append(f"{prefix}ip{network.version}:{text}")
+
+    records = []
+    final = f"{qualifiers[default]}all"
+    while True:
+        name = domain if not records else f"_spf{len(records)}.{domain}"
+        redirect = f" redirect=_spf{len(records) + 1}.{domain}"
+        record = "v=spf1"
+        while terms and len(record) + 1 + len(terms[0]) + len(redirect if len(terms) > 1 else final) + 1 <= max_length:
+            record += f" {terms.pop(0)}"
+        if not terms:
+            records.append((name, f"{record} {final}"))
+            return records
+        if record == "v=spf1":
+            raise FlattenError(f"max length {max_length} is too small")
+        records.append((name, record + redirect))
+
+
+def txt_strings(record):
+    """Splits a record into the quoted <=255 byte character-strings of a TXT RR."""
+    return " ".join(f'"{record[start:start + 255]}"' for start in range(0, len(record), 255))
+
+
+def verify(checker, domain, records, samples=1000, seed=1):
+    """Evaluates sample IPs against the live and flattened policies, returning the mismatches.
+
+    The live policy is evaluated without the lookup limit, since lifting it is the point.
+    """
+    flattened = SPFChecker(FlattenedResolver(dict(records)))
+    reference = SPFChecker(checker.spf_resolver, enforce_limit=False)
+    reference.policies = checker.policies
+    regions, _ = policy_regions(checker.policy(domain))
+    generator = random.Random(seed)
+    ips = set()
+    for networks in regions.values():
+        for network in networks:
+            ips.update((str(network.network_address), str(network.broadcast_address),
+                        str(network.network_address + generator.randrange(network.num_addresses))))
+    while len(ips) < samples:
+        if generator.random() < 0.8:
+            ips.add(str(ipaddress.IPv4Address(generator.getrandbits(32))))
+        else:
+            ips.add(str(ipaddress.IPv6Address(generator.getrandbits(128))))
+    mismatches = []
+    for ip in sorted(ips):
+        expected = reference.check_host(ip, domain)
+        actual = flattened.check_host(ip, domain)
+        if expected != actual:
+            mismatches.append((ip, expected, actual))
+    return len(ips), mismatches
+
+
+class QuietSPFResolver(spf.SPFResolver):
+    def __init__(self):
+        super().__init__()
+        # Sender-dependent terms are re-evaluated per check, so keep their answers.
+        self.resolver.cache = dns.resolver.LRUCache()
+
+    def report_missing(self, domain):
+        pass
+
+
+class FlattenedResolver(QuietSPFResolver):
+    """Serves flattened records from memory so they can be checked before publishing.
+
+    Each record goes through txt_strings and back, split into <=255 byte strings
+    exactly as it would be published.
+    """
+    def __init__(self, records):
+        super().__init__()
+        self.records = {domain: dns.rdata.from_text("IN", "TXT", txt_strings(record)) for domain, record in records.items()}
+
+    def query_txt(self, domain):
+        return [spf.txt_value(self.records[domain])] if domain in self.records else []
+
+    def query_addresses(self, domain):
+        return []
+
+    def query_mx(self, domain):
+        return []
+
+
+def read_pairs(stream):
+    for row in csv.reader(stream):
+        if len(row) < 2:
+            continue
+        ip, domain = row[0].strip(), row[1].strip()
+        try:
+            ipaddress.ip_address(ip)
+        except ValueError:
+            # Header rows and garbage are skipped rather than aborting a large batch.
+            continue
+        yield ip, domain
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="SPF Check",
+        description="Evaluates SPF check_host() for ip,domain CSV rows")
+    parser.add_argument("ip", nargs="?", help="Sender IP (omit to read CSV)")
+    parser.add_argument("domain", nargs="?", help="Sender domain")
+    parser.add_argument("-i", "--input", default="-", help="CSV of ip,domain rows ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="CSV of ip,domain,result rows ('-' for stdout)")
+    args = parser.parse_args()
+
+    checker = SPFChecker()
+    if args.ip:
+        if not args.domain:
+            parser.error("a domain is required with an ip")
+        print(checker.check_host(args.ip, args.domain))
+        return
+
+    input_stream = sys.stdin if args.input == "-" else open(args.input, "r", newline="")
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        writer = csv.writer(output_stream)
+        writer.writerow(["ip", "domain", "result"])
+        for row in checker.check_many(read_pairs(input_stream)):
+            writer.writerow(row)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,29 +2,340 @@ import re
 import common
 import subprocess
 import argparse
+import cache
+import concurrent.futures
+import json
 import os
+import threading
+import time
+import urllib.parse
+import metrics
+import ratelimit
 
+requests = common.LazyModule("requests")
 
 COLORS = common.COLORS
 STYLES = common.STYLES
 
+# (connect, read) seconds
+TIMEOUT = (5, 20)
+MAX_WORKERS = 8
+WHM_PORT = 2087
+# Seconds before a server's account index is pulled again.
+INDEX_MAX_AGE = 60 * 60
+# A domain missing from an index older than this many seconds triggers one early refresh of it.
+MISS_REFRESH_AGE = 5 * 60
+# Seconds a server whose refresh failed is left alone before it is tried again.
+FAILURE_COOLDOWN = 5 * 60
+
+
+class WHMError(Exception):
+    """Raised when a WHM server refuses an API call or can't be reached."""
+
+
+def config_path():
+    if os.environ.get("POLARIC_WHM_CONFIG"):
+        return os.environ["POLARIC_WHM_CONFIG"]
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, "polaric", "whm.json")
+
+
+def load_servers(path=None):
+    """Returns the configured WHM servers as a list of {title, host, port, user, token, verify}.
+
+    Servers come from the JSON config file ({"servers": [...]}), or a single server
+    from POLARIC_WHM_HOST/POLARIC_WHM_TOKEN (and optionally _USER, _PORT, _TITLE).
+    """
+    servers = []
+    path = path or config_path()
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            servers = json.load(file).get("servers", [])
+    elif os.environ.get("POLARIC_WHM_HOST") and os.environ.get("POLARIC_WHM_TOKEN"):
+        servers = [{
+            "host": os.environ["POLARIC_WHM_HOST"],
+            "token": os.environ["POLARIC_WHM_TOKEN"],
+            "user": os.environ.get("POLARIC_WHM_USER", "root"),
+            "port": int(os.environ.get("POLARIC_WHM_PORT", WHM_PORT)),
+            "title": os.environ.get("POLARIC_WHM_TITLE"),
+        }]
+    for server in servers:
+        server.setdefault("user", "root")
+        server.setdefault("port", WHM_PORT)
+        server.setdefault("verify", True)
+        server["title"] = server.get("title") or server["host"]
+    return servers
+
+
+class WHMServer:
+    """One WHM server's JSON API (version 1), authenticated with an API token."""
+    def __init__(self, session, host, token, user="root", port=WHM_PORT, title=None, verify=True, timeout=TIMEOUT, scheme="https"):
+        self.session = session
+        self.host = host
+        self.title = title or host
+        self.base = f"{scheme}://{host}:{port}"
+        self.headers = {"Authorization": f"whm {user}:{token}"}
+        self.verify = verify
+        self.timeout = timeout
+        self.destination = f"whm:{host}"
+
+    def call(self, function, **params):
+        """Returns the data of a successful call, None when the server answers that nothing matched."""
+        ratelimit.acquire(self.destination)
+        metrics.count("whm.requests")
+        try:
+            with metrics.timer("whm.fetch"):
+                response = self.session.get(f"{self.base}/json-api/{function}", params=dict(params, **{"api.version": 1}),
+                                            headers=self.headers, verify=self.verify, timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise WHMError(f"{e}") from e
+        if not body.get("metadata", {}).get("result"):
+            return None
+        return body.get("data") or {}
+
+    def links(self, user):
+        quoted = urllib.parse.quote(user)
+        return {
+            "WHM": f"{self.base}/scripts4/listaccts?searchtype=user&search={quoted}",
+            "cPanel": f"{self.base}/xfercpanel/{quoted}",
+        }
+
+    def account(self, user, id=None):
+        return {"details": {"id": id, "username": user, "server": self.host}, "links": self.links(user)}
+
+    def lookup(self, domain):
+        """Returns the account owning domain (main, addon, parked or sub), or None."""
+        data = self.call("domainuserdata", domain=domain)
+        user = (data or {}).get("userdata", {}).get("user")
+        if user is None:
+            return None
+        summary = self.call("accountsummary", user=user) or {}
+        accounts = summary.get("acct") or [{}]
+        return self.account(user, accounts[0].get("uid"))
+
+    def domains(self):
+        """Returns {domain: user} for every domain on the server (main, addon, parked and sub) in one call."""
+        data = self.call("get_domain_info") or {}
+        return {entry["domain"].lower(): entry["user"] for entry in data.get("domains", [])}
+
+    def uids(self):
+        data = self.call("listaccts", want="user,uid") or {}
+        return {account["user"]: account.get("uid") for account in data.get("acct", [])}
+
+
+class WHMClient:
+    """Asks every configured WHM server which account hosts a domain, over one keep-alive session.
+
+    Results keep the shape of the `whm` script's parsed output: {title: {"details", "links"}}
+    for each server the domain was found on. A server that can't be queried yields
+    {"error": ...} under its title instead of failing the lookup.
+    """
+    def __init__(self, servers, timeout=TIMEOUT, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max(len(servers), 1), pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.servers = [WHMServer(self.session, timeout=timeout, **server) for server in servers]
+
+    def each_server(self, function, servers=None):
+        """Calls function(server) on every server (or the given ones) in parallel, returning (server, error, result) tuples."""
+        servers = self.servers if servers is None else servers
+        if not servers:
+            return []
+        workers = min(self.max_workers, len(servers))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(ratelimit.bind(function), server) for server in servers]
+            return [(server, future.exception(), None if future.exception() else future.result())
+                    for server, future in zip(servers, futures)]
+
+    def lookup(self, domain):
+        whm_object = {}
+        for server, error, account in self.each_server(lambda server: server.lookup(domain)):
+            if error is not None:
+                whm_object[server.title] = {"error": f"{error}"}
+            elif account is not None:
+                whm_object[server.title] = account
+        return whm_object or None
+
+    def lookup_many(self, domains):
+        """Looks up many domains with two calls per server, returning {domain: result or None}."""
+        domains = list(dict.fromkeys(domain.lower() for domain in domains))
+        results = {domain: {} for domain in domains}
+        for server, error, tables in self.each_server(lambda server: (server.domains(), server.uids())):
+            for domain in domains:
+                if error is not None:
+                    results[domain][server.title] = {"error": f"{error}"}
+                elif domain in tables[0]:
+                    user = tables[0][domain]
+                    results[domain][server.title] = server.account(user, tables[1].get(user))
+        return {domain: result or None for domain, result in results.items()}
+
+
+class WHMIndex:
+    """A local domain -> account index of every configured WHM server.
+
+    Each server's snapshot ({"updated", "domains": {domain: user}, "uids": {user: uid}})
+    covers main, addon, parked and sub domains. Snapshots are kept in the shared result
+    store and refreshed per server once they are older than max_age, so lookups are a
+    dict probe per server. Domains found by a live lookup are written into the
+    snapshot in memory until the next refresh replaces it.
+
+    Servers are fetched outside the lock, one refresh in flight per server; only
+    callers with no snapshot at all wait for it. A server whose refresh failed is
+    not retried for failure_cooldown seconds.
+    """
+    def __init__(self, client, store=None, max_age=INDEX_MAX_AGE, miss_refresh_age=MISS_REFRESH_AGE,
+                 failure_cooldown=FAILURE_COOLDOWN):
+        self.client = client
+        self.store = store
+        self.max_age = max_age
+        self.miss_refresh_age = miss_refresh_age
+        self.failure_cooldown = failure_cooldown
+        self.snapshots = {}
+        self.errors = {}
+        self.failed = {}
+        self.refreshing = {}
+        self.lock = threading.Lock()
+        if store is not None:
+            for server in client.servers:
+                snapshot = store.get("whm", server.title)
+                if snapshot is not None:
+                    self.snapshots[server.title] = snapshot
+
+    def age(self, server):
+        snapshot = self.snapshots.get(server.title)
+        return time.time() - snapshot["updated"] if snapshot else float("inf")
+
+    def refresh(self, max_age=None):
+        """Pulls the domain lists of servers whose snapshot is older than max_age, returning how many were refreshed."""
+        max_age = self.max_age if max_age is None else max_age
+        now = time.time()
+        stale = []
+        waiting = []
+        with self.lock:
+            for server in self.client.servers:
+                if self.age(server) <= max_age:
+                    continue
+                if server.title in self.refreshing:
+                    if server.title not in self.snapshots:
+                        waiting.append(self.refreshing[server.title])
+                    continue
+                if now - self.failed.get(server.title, float("-inf")) < self.failure_cooldown:
+                    continue
+                self.refreshing[server.title] = threading.Event()
+                stale.append(server)
+        for event in waiting:
+            event.wait()
+        if not stale:
+            return 0
+
+        refreshed = 0
+        try:
+            for server, error, tables in self.client.each_server(lambda server: (server.domains(), server.uids()), stale):
+                if error is not None:
+                    with self.lock:
+                        self.errors[server.title] = f"{error}"
+                        self.failed[server.title] = time.time()
+                    continue
+                snapshot = {"updated": time.time(), "domains": tables[0], "uids": tables[1]}
+                if self.store is not None:
+                    snapshot = self.store.put("whm", server.title, snapshot)
+                with self.lock:
+                    self.snapshots[server.title] = snapshot
+                    self.errors.pop(server.title, None)
+                    self.failed.pop(server.title, None)
+                refreshed += 1
+        finally:
+            with self.lock:
+                for server in stale:
+                    self.refreshing.pop(server.title).set()
+        metrics.count("whm.index_refreshes", refreshed)
+        return refreshed
+
+    def get(self, domain):
+        """Answers from the index alone: {title: account} for the servers hosting domain, or None."""
+        domain = domain.lower().rstrip(".")
+        whm_object = {}
+        for server in self.client.servers:
+            snapshot = self.snapshots.get(server.title)
+            if snapshot is None:
+                if server.title in self.errors:
+                    whm_object[server.title] = {"error": self.errors[server.title]}
+                continue
+            user = snapshot["domains"].get(domain)
+            if user is not None:
+                whm_object[server.title] = server.account(user, snapshot["uids"].get(user))
+        return whm_object or None
+
+    def found(self, whm_object):
+        return whm_object is not None and any("details" in data for data in whm_object.values())
+
+    def remember(self, domain, whm_object):
+        with self.lock:
+            for server in self.client.servers:
+                data = whm_object.get(server.title, {})
+                snapshot = self.snapshots.get(server.title)
+                if "details" in data and snapshot is not None:
+                    snapshot["domains"][domain.lower().rstrip(".")] = data["details"]["username"]
+                    snapshot["uids"][data["details"]["username"]] = data["details"]["id"]
+
+    def lookup(self, domain, live=True):
+        """Answers from the index, falling back to asking every server directly on a miss when live."""
+        self.refresh()
+        whm_object = self.get(domain)
+        if self.found(whm_object):
+            metrics.count("whm.index_hits")
+            return whm_object
+        metrics.count("whm.index_misses")
+        if not live:
+            return whm_object
+        whm_object = self.client.lookup(domain)
+        if whm_object is not None:
+            self.remember(domain, whm_object)
+        return whm_object
+
+    def lookup_many(self, domains):
+        """Answers a batch from the index, refreshing snapshots older than miss_refresh_age at most once for misses."""
+        self.refresh()
+        results = {domain: self.get(domain) for domain in dict.fromkeys(domains)}
+        misses = [domain for domain, whm_object in results.items() if not self.found(whm_object)]
+        if misses and self.refresh(self.miss_refresh_age):
+            results.update({domain: self.get(domain) for domain in misses})
+        metrics.count("whm.index_hits", len(results) - len(misses))
+        metrics.count("whm.index_misses", len(misses))
+        return results
+
+    def stats(self):
+        return {
+            server.title: {
+                "domains": len(self.snapshots[server.title]["domains"]) if server.title in self.snapshots else 0,
+                "age": self.age(server),
+                "error": self.errors.get(server.title),
+            }
+            for server in self.client.servers
+        }
+
 
 def fetch_whm(domain):
+    """Runs the `whm` shell alias, used when no WHM API servers are configured."""
     try:
+        ratelimit.acquire("whm")
         command = ["bash", "-i", "-c", f"whm {domain}"]
         result = subprocess.run(
             command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
         return result.stdout.decode('utf-8')
-    except:
+    except (OSError, subprocess.CalledProcessError):
         return None
-        pass
 
 
 def extract_details(string):
     match = re.search(r"ID (\d+) - username (\w+) - server ([\w\d.]+)", string)
     if match:
         return {
-            "ID": match.group(1),
+            "id": match.group(1),
             "username": match.group(2),
             "server": match.group(3)
         }
@@ -52,30 +363,61 @@ def parse_output(output):
         if "=====" in line:
             if "No service found for domain" in line:
                 continue
-
             title = extract_title(line)
-            whm_object[title] = {}
-        if "Found service" in line and title != "":
-            details = extract_details(line)
-            whm_object[title]["details"] = {}
-            whm_object[title]["details"]["id"] = details["ID"]
-            whm_object[title]["details"]["username"] = details["username"]
-            whm_object[title]["details"]["server"] = details["server"]
-
-        if "Link" in line and title != "":
+            whm_object[title] = {"details": {}, "links": {}}
+        elif "Found service" in line and title:
+            whm_object[title]["details"] = extract_details(line)
+        elif "Link" in line and title:
             link = parse_name_link(line)
-            if not "links" in whm_object[title]:
-                whm_object[title]["links"] = {}
-            whm_object[title]["links"][link["name"]] = link["link"]
+            if link is not None:
+                whm_object[title]["links"][link["name"]] = link["link"]
+    return whm_object if title else None
 
-    if title == "":
-        return None
 
-    return whm_object
+_client = None
+_client_lock = threading.Lock()
+_index = None
+
+
+def default_client():
+    """The API client for the configured servers, or None when there are none."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            servers = load_servers()
+            _client = WHMClient(servers) if servers else False
+        return _client or None
+
+
+def default_index():
+    """The account index over default_client(), or None when no API servers are configured."""
+    global _index
+    client = default_client()
+    with _client_lock:
+        if _index is None and client is not None:
+            _index = WHMIndex(client, cache.default_store())
+        return _index
+
+
+def resolve(domain):
+    index = default_index()
+    if index is not None:
+        return index.lookup(domain)
+    output = fetch_whm(domain)
+    return parse_output(output) if output else None
+
+
+def resolve_many(domains):
+    index = default_index()
+    if index is not None:
+        return index.lookup_many(domains)
+    return {domain: resolve(domain) for domain in domains}
 
 
 def display_output(whm_object):
     for title, data in whm_object.items():
+        if "error" in data:
+            common.print_error(f"{title}: {data['error']}")
         if "links" in data:
             common.print_color(f"{title}", "CYAN", "NORMAL")
             for name, link in data["links"].items():
@@ -84,25 +426,47 @@ def display_output(whm_object):
     return
 
 
-def display_whm(domain):
-    output = fetch_whm(domain)
-    parsed_output = parse_output(output)
-    display_output(parsed_output)
+def display_whm(domains):
+    results = resolve_many(domains) if len(domains) > 1 else {domains[0]: resolve(domains[0])}
+    for domain, whm_object in results.items():
+        if len(results) > 1:
+            common.print_color(domain, "YELLOW", "BOLD")
+        if whm_object is None:
+            common.print_color("No service found.", "RED")
+            continue
+        display_output(whm_object)
+
+
+def display_index(stats):
+    for title, data in stats.items():
+        if data["error"]:
+            common.print_error(f"{title}: {data['error']}")
+        age = f"{data['age'] / 60:.1f} minutes old" if data["age"] != float("inf") else "never pulled"
+        common.print_color(f"{title}: {data['domains']} domains, {age}", "WHITE")
 
 
 def main():
     parser = argparse.ArgumentParser(
-        prog="DI",
-        description="Domain Information"
+        prog="WHM",
+        description="Find the WHM accounts hosting domains"
     )
-    parser.add_argument("domain", help="Domain to query")
+    parser.add_argument("domains", nargs="*", help="Domains to query")
     parser.add_argument("-ns", "--nameserver",
-                        help="Specify a custom nameserver")
+                        help="Ignored: accounts are looked up through the WHM API, not DNS (kept for existing scripts)")
+    parser.add_argument("-r", "--refresh", help="Pull every server's account index now", action="store_true")
 
     args = parser.parse_args()
+    if not args.domains and not args.refresh:
+        parser.error("specify domains to query or --refresh")
 
-    display_whm(args.domain)
-    pass
+    if args.refresh:
+        index = default_index()
+        if index is None:
+            parser.error(f"no WHM API servers configured (see {config_path()})")
+        index.refresh(0)
+        display_index(index.stats())
+    if args.domains:
+        display_whm(args.domains)
 
 
 if __name__ == "__main__":
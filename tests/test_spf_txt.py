@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+
+import dns.rdata
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import spf
+import spfcheck
+
+SPLIT = '"v=spf1 ip4:1.2.3.0/24 " "ip4:5.6.7.0/24 -all"'
+LONG = "v=spf1 " + " ".join(f"ip4:10.{i}.0.0/16" for i in range(40)) + " -all"
+
+
+class TXTResolver(spfcheck.QuietSPFResolver):
+    """Answers TXT queries with fixed presentation-format rdata, through the real query_txt."""
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def query(self, domain, rdtype):
+        return [dns.rdata.from_text("IN", "TXT", self.records[domain])]
+
+
+class TXTStringsTest(unittest.TestCase):
+    def test_strings_are_joined_without_separator(self):
+        self.assertEqual(spf.txt_value(dns.rdata.from_text("IN", "TXT", SPLIT)), "v=spf1 ip4:1.2.3.0/24 ip4:5.6.7.0/24 -all")
+
+    def test_split_record_evaluates(self):
+        checker = spfcheck.SPFChecker(TXTResolver({"split.test": SPLIT}))
+        self.assertEqual(checker.check_host("1.2.3.4", "split.test"), "pass")
+        self.assertEqual(checker.check_host("5.6.7.8", "split.test"), "pass")
+        self.assertEqual(checker.check_host("9.9.9.9", "split.test"), "fail")
+
+    def test_txt_strings_round_trip(self):
+        self.assertGreater(len(LONG), 255)
+        checker = spfcheck.SPFChecker(TXTResolver({"long.test": spfcheck.txt_strings(LONG)}))
+        self.assertEqual(checker.check_host("10.39.1.1", "long.test"), "pass")
+        self.assertEqual(checker.check_host("10.17.1.1", "long.test"), "pass")
+        self.assertEqual(checker.check_host("11.0.0.1", "long.test"), "fail")
+
+    def test_flattened_resolver_serves_split_records(self):
+        checker = spfcheck.SPFChecker(spfcheck.FlattenedResolver({"long.test": LONG}))
+        self.assertEqual(checker.check_host("10.25.0.1", "long.test"), "pass")
+        self.assertEqual(checker.check_host("11.0.0.1", "long.test"), "fail")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import ratelimit
+import whm
+import whm_client
+
+
+def config(server, title, token=whm_client.TOKEN):
+    return {"host": "127.0.0.1", "port": server.server_address[1], "token": token, "title": title, "scheme": "http"}
+
+
+class WHMClientTest(unittest.TestCase):
+    """WHMClient and WHMIndex against the local WHM API stand-in from benchmarks/whm_client.py."""
+    @classmethod
+    def setUpClass(cls):
+        ratelimit.configure("whm=none,whm:127.0.0.1=none")
+        cls.table = whm_client.accounts(0, 5)
+        cls.server = whm_client.serve(cls.table, 0)
+        cls.slow = whm_client.serve(whm_client.accounts(1, 5), 1.0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.slow.shutdown()
+
+    def test_lookup_finds_every_kind_of_domain(self):
+        client = whm.WHMClient([config(self.server, "one")])
+        for user, (uid, domains) in self.table.items():
+            for domain in domains:
+                details = client.lookup(domain)["one"]["details"]
+                self.assertEqual((details["username"], details["id"]), (user, uid))
+
+    def test_lookup_not_found(self):
+        # The stand-in answers metadata.result = 0 for a domain no account owns.
+        client = whm.WHMClient([config(self.server, "one")])
+        self.assertIsNone(client.lookup("missing.com.au"))
+
+    def test_bad_token_is_an_error_entry(self):
+        client = whm.WHMClient([config(self.server, "one", token="WRONG")])
+        result = client.lookup("site0x0.com.au")
+        self.assertIn("403", result["one"]["error"])
+
+    def test_timeout_is_an_error_entry(self):
+        client = whm.WHMClient([config(self.slow, "slow")], timeout=(0.5, 0.2))
+        self.assertIn("error", client.lookup("site1x0.com.au")["slow"])
+
+    def test_lookup_many_partial_failure(self):
+        client = whm.WHMClient([config(self.server, "one"), config(self.server, "bad", token="WRONG")])
+        results = client.lookup_many(["site0x1.com.au", "missing.com.au"])
+        self.assertEqual(results["site0x1.com.au"]["one"]["details"]["username"], "user0x1")
+        self.assertIn("error", results["site0x1.com.au"]["bad"])
+        self.assertNotIn("one", results["missing.com.au"])
+        self.assertIn("error", results["missing.com.au"]["bad"])
+
+    def test_lookup_many_matches_lookup(self):
+        client = whm.WHMClient([config(self.server, "one")])
+        domains = [domains[0] for _, domains in self.table.values()] + ["missing.com.au"]
+        self.assertEqual(client.lookup_many(domains), {domain: client.lookup(domain) for domain in domains})
+
+    def test_index_answers_and_backs_off_failed_servers(self):
+        bad = whm_client.serve(self.table, 0)
+        self.addCleanup(bad.shutdown)
+        client = whm.WHMClient([config(self.server, "one"), config(bad, "bad", token="WRONG")])
+        index = whm.WHMIndex(client)
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(index.lookup("parked0x2.au", live=False)["one"]["details"]["username"], "user0x2")
+        self.assertIsNotNone(index.stats()["bad"]["error"])
+        failed_requests = bad.requests
+        # Lookups during the cooldown don't ask the failed server again.
+        for _ in range(5):
+            index.lookup("site0x3.com.au", live=False)
+        self.assertEqual(bad.requests, failed_requests)
+        index.failure_cooldown = 0
+        index.refresh()
+        self.assertGreater(bad.requests, failed_requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
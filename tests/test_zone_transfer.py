@@ -0,0 +1,102 @@
+import functools
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import cache
+import di
+import ratelimit
+import zone_transfer
+
+BASE_DOMAIN = zone_transfer.ORIGIN.rstrip(".")
+HOSTS = 50
+
+
+class ZoneTransferTest(unittest.TestCase):
+    """ZoneTransfer and sweep_records against the dnspython authoritative stand-in from benchmarks/zone_transfer.py."""
+    @classmethod
+    def setUpClass(cls):
+        ratelimit.configure("dns=none")
+
+    def setUp(self):
+        self.authority = zone_transfer.Authority(zone_transfer.make_zone(HOSTS, 1))
+        self.port = self.authority.serve()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.store = cache.Store(os.path.join(self.directory.name, "store.sqlite3"))
+
+    def resolver(self, port=None):
+        return di.DNSResolver(f"127.0.0.1:{port or self.port}")
+
+    def transferrer(self, port=None):
+        return di.ZoneTransfer(self.resolver(port), port=port or self.port)
+
+    def sweep(self, transfer=True, port=None):
+        """sweep_records with our nameserver pointed at the stand-in."""
+        port = port or self.port
+        with mock.patch.object(di.ZoneTransfer, "nameservers", return_value=["127.0.0.1"]), \
+                mock.patch.object(di, "ZoneTransfer", functools.partial(di.ZoneTransfer, port=port)):
+            return di.sweep_records(self.resolver(port), BASE_DOMAIN, list(di.Config.GENERIC_SUBDOMAINS),
+                                    transfer=transfer, store=self.store)
+
+    def test_axfr_matches_per_name_sweep(self):
+        transferrer = self.transferrer()
+        zone = transferrer.transfer(BASE_DOMAIN, ["127.0.0.1"])
+        self.assertEqual(transferrer.kind, "AXFR")
+        self.assertEqual(len(zone.nodes), HOSTS + len(di.Config.GENERIC_SUBDOMAINS) + 1)
+        swept = di.records_to_dict(di.fetch_records(self.resolver(), BASE_DOMAIN, list(di.Config.GENERIC_SUBDOMAINS)))
+        transferred = di.records_to_dict(transferrer.to_records(zone, BASE_DOMAIN))
+        for type, hosts in swept.items():
+            for host, records in hosts.items():
+                self.assertEqual(transferred[type][host], records, (type, host))
+
+    def test_refused_transfer(self):
+        refusing = zone_transfer.Authority(zone_transfer.make_zone(HOSTS, 1), allow_transfer=False)
+        port = refusing.serve()
+        self.assertIsNone(self.transferrer(port).transfer(BASE_DOMAIN, ["127.0.0.1"]))
+
+    def test_ixfr_after_serial_change(self):
+        transferrer = self.transferrer()
+        zone_text = transferrer.transfer(BASE_DOMAIN, ["127.0.0.1"]).to_text()
+        self.assertEqual(transferrer.serial(BASE_DOMAIN, ["127.0.0.1"]), 1)
+        self.authority.zone = zone_transfer.make_zone(HOSTS + 1, 2)
+        self.assertEqual(transferrer.serial(BASE_DOMAIN, ["127.0.0.1"]), 2)
+        zone = transferrer.transfer(BASE_DOMAIN, ["127.0.0.1"], zone_text)
+        self.assertEqual(transferrer.kind, "IXFR")
+        self.assertIsNotNone(zone.get_node(f"host{HOSTS}.{zone_transfer.ORIGIN}"))
+
+    def test_sweep_falls_back_to_per_name_queries(self):
+        refusing = zone_transfer.Authority(zone_transfer.make_zone(HOSTS, 1), allow_transfer=False)
+        port = refusing.serve()
+        records, changes = self.sweep(port=port)
+        self.assertIsNone(changes["transfer"])
+        self.assertEqual(di.records_to_dict(records),
+                         di.records_to_dict(di.fetch_records(self.resolver(port), BASE_DOMAIN, list(di.Config.GENERIC_SUBDOMAINS))))
+
+    def test_sweep_transfers_then_serves_snapshot_then_diffs(self):
+        records, changes = self.sweep()
+        self.assertEqual(changes["transfer"], "AXFR")
+        self.assertIn(f"host{HOSTS - 1}", di.records_to_dict(records)["A"])
+
+        _, changes = self.sweep()
+        self.assertTrue(changes["cached"])
+
+        self.authority.zone = zone_transfer.make_zone(HOSTS + 1, 2)
+        records, changes = self.sweep()
+        self.assertEqual(changes["serial"], 2)
+        self.assertFalse(changes["cached"])
+        self.assertIn(f"host{HOSTS}", di.records_to_dict(records)["A"])
+        self.assertEqual([(record["type"], record["host"]) for record in changes["added"]],
+                         [("A", f"host{HOSTS}.{BASE_DOMAIN}")])
+
+    def test_sweep_without_transfer(self):
+        _, changes = self.sweep(transfer=False)
+        self.assertIsNone(changes["transfer"])
+
+
+if __name__ == "__main__":
+    unittest.main()